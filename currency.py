@@ -1,37 +1,86 @@
 balances = Hash(default_value=0)
 metadata = Hash()
 # XST002
-permits = Hash()
+permits = Hash()  # permits:<deadline day>:<permit hash>: bool - used permits, bucketed by the day of their deadline
 # XST003
 streams = Hash()
+outflows = Hash(default_value=0)  # outflows:<sender>:rate|owed|checkpoint|cursor|last - aggregate of the sender's streams
+outflow_changes = Hash()  # outflow_changes:<sender>:<day>: [[second of day, rate change], ...] - scheduled, in time order
+stream_index = Hash(default_value=0)  # stream_index:<account>:<direction>: int count, stream_index:<account>:<direction>:<i>: stream id
+# Custody
+custody = Hash(default_value=0)  # custody:<contract>:<owner>: float - tokens bonded to a contract by an owner
+custody_shards = Hash(default_value=0)  # custody_shards:<contract>:<shard>: float - running totals, summed on read
+
+CUSTODY_SHARDS = 16
 
 supply = Variable()
 issuer = Variable()
+base_units = Variable()  # True if balances, allowances, custody and stream rates are whole base units: int
+
+UNITS_PER_TOKEN = 10 ** 8
+
+# Events, indexers fold these instead of polling balances and streams. Times are sent as strings.
+TransferEvent = LogEvent(event="Transfer", params={"from": {"type": str, "idx": True}, "to": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+ApproveEvent = LogEvent(event="Approve", params={"from": {"type": str, "idx": True}, "to": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+IssueEvent = LogEvent(event="Issue", params={"to": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+BondEvent = LogEvent(event="Bond", params={"owner": {"type": str, "idx": True}, "contract": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+UnbondEvent = LogEvent(event="Unbond", params={"owner": {"type": str, "idx": True}, "contract": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+StreamCreateEvent = LogEvent(event="StreamCreate", params={"stream_id": {"type": str, "idx": True}, "sender": {"type": str, "idx": True}, "receiver": {"type": str, "idx": True}, "rate": {"type": (int, float, decimal)}, "begins": {"type": str}, "closes": {"type": str}})
+StreamBalanceEvent = LogEvent(event="StreamBalance", params={"stream_id": {"type": str, "idx": True}, "sender": {"type": str, "idx": True}, "receiver": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+StreamCloseChangeEvent = LogEvent(event="StreamCloseChange", params={"stream_id": {"type": str, "idx": True}, "closes": {"type": str}})
+StreamFinalizeEvent = LogEvent(event="StreamFinalize", params={"stream_id": {"type": str, "idx": True}})
+StreamForfeitEvent = LogEvent(event="StreamForfeit", params={"stream_id": {"type": str, "idx": True}})
 
 @construct
-def seed(vk: str, gov_contract: str):
-    balances[vk] = 5555555.55 # 5% Team Tokens
-    balances["team_lock"] = 16666666.65 # 15% Team Tokens 5 Year Release, Directly minted into Lock contract
-    balances["dao"] = 33333333.3 # 30% DAO Tokens, Directly minted into DAO contract
-    balances[vk] += 49999999.95 # 45% Second batch of public tokens, to be sent out after mint
-    balances[vk] += 5555555.55 # 5% First batch of public tokens, to be sent out after mint
+def seed(vk: str, gov_contract: str, integer_units: bool = False):
+    # With integer_units every amount is an int count of 1 / UNITS_PER_TOKEN tokens, so arithmetic on them is exact.
+    base_units.set(integer_units)
+
+    balances[vk] = seed_amount(5555555.55) # 5% Team Tokens
+    balances["team_lock"] = seed_amount(16666666.65) # 15% Team Tokens 5 Year Release, Directly minted into Lock contract
+    balances["dao"] = seed_amount(33333333.3) # 30% DAO Tokens, Directly minted into DAO contract
+    balances[vk] += seed_amount(49999999.95) # 45% Second batch of public tokens, to be sent out after mint
+    balances[vk] += seed_amount(5555555.55) # 5% First batch of public tokens, to be sent out after mint
         
     # TEAM LOCK
     # 365 * 4 + 364 = 1824 (4 years + 1 leap-year)
     # 1824 * 24 * 60 * 60 = 157593600 (seconds in duration)
     # 16666666.65 / 157593600 (release per second)
     
-    setup_seed_stream("team_lock", "team_lock", vk, 0.10575725568804825, 1824)
+    setup_seed_stream("team_lock", "team_lock", vk, seed_amount(0.10575725568804825), 1824)
 
-    supply.set(111111111)
+    supply.set(seed_amount(111111111))
     issuer.set(gov_contract)
 
 
+def seed_amount(tokens: float):
+    return to_units(tokens) if base_units.get() else tokens
+
+
+# Conversions between tokens and base units, for callers of a currency seeded with integer_units.
+# to_units rounds down to a whole base unit.
+@export
+def to_units(tokens: float) -> int:
+    return int(tokens * UNITS_PER_TOKEN)
+
+
+@export
+def from_units(units: int) -> float:
+    return decimal(units) / UNITS_PER_TOKEN
+
+
+def check_amount(amount: float):
+    if base_units.get():
+        assert isinstance(amount, int), 'Amounts must be whole base units.'
+
+
 @export
 def issue(amount: float):
     assert ctx.caller == issuer.get(), 'Only the minter can mint new tokens.'
+    check_amount(amount)
     supply.set(supply.get() + amount)
     balances[issuer.get()] += amount
+    IssueEvent({"to": issuer.get(), "amount": amount})
 
 
 def setup_seed_stream(stream_id: str, sender: str, receiver: str, rate: float, duration_days: int):
@@ -42,15 +91,23 @@ def setup_seed_stream(stream_id: str, sender: str, receiver: str, rate: float, d
     streams[stream_id, 'sender'] = sender
     streams[stream_id, 'rate'] = rate
     streams[stream_id, 'claimed'] = 0
+    streams[stream_id, 'accrued_until'] = now
+    streams[stream_id, 'due'] = 0
+
+    index_stream(stream_id, sender, receiver)
+    add_outflow(stream_id)
+    StreamCreateEvent({"stream_id": stream_id, "sender": sender, "receiver": receiver, "rate": rate, "begins": str(streams[stream_id, 'begins']), "closes": str(streams[stream_id, 'closes'])})
 
 
 @export
 def transfer(amount: float, to: str):
     assert amount > 0, 'Cannot send negative balances.'
+    check_amount(amount)
     assert balances[ctx.caller] >= amount, 'Not enough coins to send.'
 
     balances[ctx.caller] -= amount
     balances[to] += amount
+    TransferEvent({"from": ctx.caller, "to": to, "amount": amount})
 
     return f"Sent {amount} to {to}"
 
@@ -58,7 +115,9 @@ def transfer(amount: float, to: str):
 @export
 def approve(amount: float, to: str):
     assert amount > 0, 'Cannot send negative balances.'
+    check_amount(amount)
     balances[ctx.caller, to] = amount
+    ApproveEvent({"from": ctx.caller, "to": to, "amount": amount})
 
     return f"Approved {amount} for {to}"
 
@@ -66,12 +125,14 @@ def approve(amount: float, to: str):
 @export
 def transfer_from(amount: float, to: str, main_account: str):
     assert amount > 0, 'Cannot send negative balances.'
+    check_amount(amount)
     assert balances[main_account, ctx.caller] >= amount, f'Not enough coins approved to send. You have {balances[main_account, ctx.caller]} and are trying to spend {amount}'
     assert balances[main_account] >= amount, 'Not enough coins to send.'
 
     balances[main_account, ctx.caller] -= amount
     balances[main_account] -= amount
     balances[to] += amount
+    TransferEvent({"from": main_account, "to": to, "amount": amount})
 
     return f"Sent {amount} to {to} from {main_account}"
 
@@ -81,6 +142,53 @@ def balance_of(address: str):
     return balances[address]
 
 
+# Custody
+# Contracts that hold tokens on behalf of owners (e.g. staking) bond them here instead of
+# crediting balances[contract], so bonds from different owners never write the same key.
+
+
+@export
+def bond(amount: float, owner: str):
+    assert amount > 0, 'Cannot bond negative balances.'
+    check_amount(amount)
+    assert balances[owner, ctx.caller] >= amount, f'Not enough coins approved to bond. You have {balances[owner, ctx.caller]} and are trying to bond {amount}'
+    assert balances[owner] >= amount, 'Not enough coins to bond.'
+
+    balances[owner, ctx.caller] -= amount
+    balances[owner] -= amount
+    custody[ctx.caller, owner] += amount
+    custody_shards[ctx.caller, custody_shard(owner)] += amount
+    BondEvent({"owner": owner, "contract": ctx.caller, "amount": amount})
+
+    return f"Bonded {amount} from {owner} to {ctx.caller}"
+
+
+@export
+def unbond(amount: float, owner: str):
+    assert amount > 0, 'Cannot unbond negative balances.'
+    check_amount(amount)
+    assert custody[ctx.caller, owner] >= amount, 'Not enough coins in custody.'
+
+    custody[ctx.caller, owner] -= amount
+    custody_shards[ctx.caller, custody_shard(owner)] -= amount
+    balances[owner] += amount
+    UnbondEvent({"owner": owner, "contract": ctx.caller, "amount": amount})
+
+    return f"Unbonded {amount} from {ctx.caller} to {owner}"
+
+
+@export
+def custody_of(contract: str):
+    total = 0
+    for shard in range(CUSTODY_SHARDS):
+        total += custody_shards[contract, shard]
+    return total
+
+
+def custody_shard(owner: str) -> int:
+    return int(hashlib.sha3(owner)[:8], 16) % CUSTODY_SHARDS
+
+
 # XST002 / Permit
 
 @export
@@ -89,16 +197,77 @@ def permit(owner: str, spender: str, value: float, deadline: str, signature: str
     permit_msg = construct_permit_msg(owner, spender, value, str(deadline))
     permit_hash = hashlib.sha3(permit_msg)
 
-    assert permits[permit_hash] is None, 'Permit can only be used once.'
+    assert not permit_used(permit_hash, deadline), 'Permit can only be used once.'
     assert now < deadline, 'Permit has expired.'
     assert crypto.verify(owner, permit_msg, signature), 'Invalid signature.'
+    check_amount(value)
 
     balances[owner, spender] += value
-    permits[permit_hash] = True
+    mark_permit_used(permit_hash, deadline)
+    ApproveEvent({"from": owner, "to": spender, "amount": balances[owner, spender]})
 
     return f"Permit granted for {value} to {spender} from {owner}"
 
 
+# Grants many permits in one transaction, e.g. when submitted by a relayer.
+# Each entry is a dict of owner, spender, value, deadline and signature, as taken by `permit`.
+# Deadlines and replays are checked for the whole batch before any signature is verified.
+@export
+def permit_many(signed_permits: list):
+    checked = []
+    batch_hashes = {}
+
+    for signed in signed_permits:
+        deadline = strptime_ymdhms(signed["deadline"])
+        assert now < deadline, 'Permit has expired.'
+
+        permit_msg = construct_permit_msg(signed["owner"], signed["spender"], signed["value"], str(deadline))
+        permit_hash = hashlib.sha3(permit_msg)
+
+        assert permit_hash not in batch_hashes, 'Permit can only be used once.'
+        assert not permit_used(permit_hash, deadline), 'Permit can only be used once.'
+
+        batch_hashes[permit_hash] = True
+        checked.append([signed, permit_msg, permit_hash, deadline])
+
+    for signed, permit_msg, permit_hash, deadline in checked:
+        assert crypto.verify(signed["owner"], permit_msg, signed["signature"]), 'Invalid signature.'
+        check_amount(signed["value"])
+
+    for signed, permit_msg, permit_hash, deadline in checked:
+        balances[signed["owner"], signed["spender"]] += signed["value"]
+        mark_permit_used(permit_hash, deadline)
+        ApproveEvent({"from": signed["owner"], "to": signed["spender"], "amount": balances[signed["owner"], signed["spender"]]})
+
+    return f"Granted {len(checked)} permits"
+
+
+# Drops the used permits of deadline days that are over.
+# Those permits can't be replayed since `now < deadline` is asserted on use.
+# Days are given as YYYYMMDD, e.g. 20240131.
+@export
+def prune_permits(days: list):
+    today = permit_bucket(now)
+    for day in days:
+        assert day < today, 'Permits of this day can still be used.'
+        permits.clear(day)
+
+    return f"Pruned permits of {len(days)} days"
+
+
+def permit_bucket(deadline: datetime.datetime) -> int:
+    return deadline.year * 10000 + deadline.month * 100 + deadline.day
+
+
+def permit_used(permit_hash: str, deadline: datetime.datetime) -> bool:
+    # Permits used before bucketing are stored at permits:<permit hash>
+    return permits[permit_bucket(deadline), permit_hash] is not None or permits[permit_hash] is not None
+
+
+def mark_permit_used(permit_hash: str, deadline: datetime.datetime):
+    permits[permit_bucket(deadline), permit_hash] = True
+
+
 def construct_permit_msg(owner: str, spender: str, value: float, deadline: str):
     return f"{owner}:{spender}:{value}:{deadline}:{ctx.this}:{chain_id}"
 
@@ -113,6 +282,17 @@ BEGIN_KEY = "begins"
 CLOSE_KEY = "closes"
 RATE_KEY = "rate"
 CLAIMED_KEY = "claimed"
+ACCRUED_KEY = "accrued_until"
+DUE_KEY = "due"
+OWED_KEY = "owed"
+CHECKPOINT_KEY = "checkpoint"
+CURSOR_KEY = "cursor"
+LAST_KEY = "last"
+OUTFLOW_ORIGIN = datetime.datetime(year=2000, month=1, day=1)
+MAX_SOLVENCY_DAYS = 36500
+OUTGOING = "out"
+INCOMING = "in"
+INDEX_SLOT_KEYS = {OUTGOING: "out_slot", INCOMING: "in_slot"}
 STREAM_ACTIVE = "active"
 STREAM_FINALIZED = "finalized"
 STREAM_FORFEIT = "forfeit"
@@ -138,6 +318,7 @@ def perform_create_stream(sender: str, receiver: str, rate: float, begins: str,
     assert streams[stream_id, STATUS_KEY] is None, 'Stream already exists.'
     assert begins < closes, 'Stream cannot begin after the close date.'
     assert rate > 0, 'Rate must be greater than 0.'
+    check_amount(rate)
 
     streams[stream_id, STATUS_KEY] = STREAM_ACTIVE
     streams[stream_id, BEGIN_KEY] = begins
@@ -146,6 +327,12 @@ def perform_create_stream(sender: str, receiver: str, rate: float, begins: str,
     streams[stream_id, SENDER_KEY] = sender
     streams[stream_id, RATE_KEY] = rate
     streams[stream_id, CLAIMED_KEY] = 0
+    streams[stream_id, ACCRUED_KEY] = begins
+    streams[stream_id, DUE_KEY] = 0
+
+    index_stream(stream_id, sender, receiver)
+    add_outflow(stream_id)
+    StreamCreateEvent({"stream_id": stream_id, "sender": sender, "receiver": receiver, "rate": rate, "begins": str(begins), "closes": str(closes)})
 
     return stream_id
 
@@ -162,10 +349,10 @@ def create_stream_from_permit(sender: str, receiver: str, rate: float, begins: s
     permit_msg = construct_stream_permit_msg(sender, receiver, rate, begins, closes, deadline)
     permit_hash = hashlib.sha3(permit_msg)
 
-    assert permits[permit_hash] is None, 'Permit can only be used once.'
+    assert not permit_used(permit_hash, deadline), 'Permit can only be used once.'
     assert crypto.verify(sender, permit_msg, signature), 'Invalid signature.'
 
-    permits[permit_hash] = True
+    mark_permit_used(permit_hash, deadline)
 
     return perform_create_stream(sender, receiver, rate, begins, closes)
 
@@ -183,25 +370,272 @@ def balance_stream(stream_id: str):
 
     assert ctx.caller in [sender, receiver], 'Only sender or receiver can balance a stream.'
 
+    local_balances = {}
+    outstanding_balance, claimable_amount = settle_stream(stream_id, sender, receiver, local_balances)
+
+    assert outstanding_balance > 0, 'No amount due on this stream.'
+
+    write_local_balances(local_balances)
+
+    return f"Claimed {claimable_amount} tokens from stream"
+
+
+# Balances many streams in one transaction.
+# Streams that have not started or have nothing due are skipped.
+# Each sender and receiver balance is read once and written once.
+# Called by `sender` or `receiver` of every stream
+@export
+def balance_streams(stream_ids: list):
+    local_balances = {}
+    total_claimed = 0
+
+    for stream_id in stream_ids:
+        assert streams[stream_id, STATUS_KEY], 'Stream does not exist.'
+        assert streams[stream_id, STATUS_KEY] == STREAM_ACTIVE, 'You can only balance active streams.'
+
+        sender = streams[stream_id, SENDER_KEY]
+        receiver = streams[stream_id, RECEIVER_KEY]
+
+        assert ctx.caller in [sender, receiver], 'Only sender or receiver can balance a stream.'
+
+        if now > streams[stream_id, BEGIN_KEY]:
+            total_claimed += settle_stream(stream_id, sender, receiver, local_balances)[1]
+
+    write_local_balances(local_balances)
+
+    return f"Claimed {total_claimed} tokens from {len(stream_ids)} streams"
+
+
+# Balances up to `limit` of the caller's incoming streams, starting at index `start`.
+# Called by `receiver`
+@export
+def balance_all_incoming(start: int, limit: int):
+    return balance_streams(stream_ids=get_streams(account=ctx.caller, direction=INCOMING, start=start, limit=limit))
+
+
+# Lists the ids of an account's active streams, `direction` is "out" for sent and "in" for received streams.
+@export
+def get_streams(account: str, direction: str, start: int, limit: int):
+    assert direction in INDEX_SLOT_KEYS, 'Direction must be "out" or "in".'
+
+    end = min(stream_index[account, direction], start + limit)
+    return [stream_index[account, direction, i] for i in range(start, end)]
+
+
+# Pays what is due on a started stream out of `local_balances`, returns [amount due, amount paid].
+# If the sender owes more across all of their streams than they hold, the payment is pro-rated.
+def settle_stream(stream_id: str, sender: str, receiver: str, local_balances: dict) -> list:
     closes = streams[stream_id, CLOSE_KEY]
-    begins = streams[stream_id, BEGIN_KEY]
     rate = streams[stream_id, RATE_KEY]
-    claimed = streams[stream_id, CLAIMED_KEY]
+    accrued_until, due = stream_checkpoint(stream_id)
 
-    # Calculate the amount of tokens that can be claimed
-    
-    outstanding_balance = calc_outstanding_balance(begins, closes, rate, claimed)
-    
-    assert outstanding_balance > 0, 'No amount due on this stream.'
+    outstanding_balance = calc_outstanding_balance(accrued_until, closes, rate, due)
+
+    if outstanding_balance <= 0:
+        return [outstanding_balance, 0]
 
-    claimable_amount = calc_claimable_amount(outstanding_balance, sender)
+    checkpoint_outflow(sender)
+    claimable_amount = calc_claimable_amount(
+        outstanding_balance, read_local_balance(sender, local_balances), outflows[sender, OWED_KEY]
+    )
 
-    balances[sender] -= claimable_amount
-    balances[receiver] += claimable_amount
+    local_balances[sender] -= claimable_amount
+    read_local_balance(receiver, local_balances)
+    local_balances[receiver] += claimable_amount
 
     streams[stream_id, CLAIMED_KEY] += claimable_amount
+    streams[stream_id, ACCRUED_KEY] = now if now < closes else closes
+    streams[stream_id, DUE_KEY] = outstanding_balance - claimable_amount
+    outflows[sender, OWED_KEY] -= claimable_amount
+    if claimable_amount > 0:
+        StreamBalanceEvent({"stream_id": stream_id, "sender": sender, "receiver": receiver, "amount": claimable_amount})
+
+    return [outstanding_balance, claimable_amount]
+
+
+def read_local_balance(account: str, local_balances: dict) -> float:
+    if account not in local_balances:
+        local_balances[account] = balances[account]
+    return local_balances[account]
 
-    return f"Claimed {claimable_amount} tokens from stream"
+
+def write_local_balances(local_balances: dict):
+    for account, balance in local_balances.items():
+        balances[account] = balance
+
+
+# Returns the time until which the sender can pay all of their streams at their current total rate, streams
+# beginning or closing later change it. None if the sender pays nothing per second.
+@export
+def sender_solvent_until(sender: str):
+    owed, rate, day, left, walked = accrue_outflow(sender)
+
+    surplus = balances[sender] - owed
+    if surplus <= 0:
+        return now
+    if rate <= 0:
+        return None
+
+    return now + datetime.timedelta(seconds=int(min(surplus / rate, MAX_SOLVENCY_DAYS * 86400)))
+
+
+# Returns [owed, rate, day, left, walked], the sender's outflow accrued up to now without writing it.
+# Scheduled rate changes are read from the cursor day on, only up to today. `day` is the first day with changes
+# still ahead of now, `left` those changes if some of that day's have passed, and `walked` the days fully passed.
+def accrue_outflow(sender: str) -> list:
+    checkpoint = outflows[sender, CHECKPOINT_KEY]
+    owed = outflows[sender, OWED_KEY]
+    rate = outflows[sender, RATE_KEY]
+    day = outflows[sender, CURSOR_KEY]
+    last = outflows[sender, LAST_KEY]
+    today = outflow_day(now)[0]
+
+    left = None
+    walked = []
+    while last and day <= last and day <= today:
+        changes = outflow_changes[sender, day] or []
+        i = 0
+        while i < len(changes) and outflow_time(day, changes[i][0]) <= now:
+            owed += rate * seconds_between(checkpoint, outflow_time(day, changes[i][0]))
+            checkpoint = outflow_time(day, changes[i][0])
+            rate += changes[i][1]
+            i += 1
+        if i < len(changes):
+            if i > 0:
+                left = changes[i:]
+            break
+        if changes:
+            walked.append(day)
+        day += 1
+    if checkpoint:
+        owed += rate * seconds_between(checkpoint, now)
+
+    return [owed, rate, day, left, walked]
+
+
+# Accrues the sender's total outflow rate up to now, applying the rate changes scheduled up to now.
+def checkpoint_outflow(sender: str):
+    owed, rate, day, left, walked = accrue_outflow(sender)
+
+    outflows[sender, OWED_KEY] = owed
+    outflows[sender, CHECKPOINT_KEY] = now
+    if walked or left:
+        outflows[sender, RATE_KEY] = rate
+    for passed_day in walked:
+        outflow_changes[sender, passed_day] = None
+    if left:
+        outflow_changes[sender, day] = left
+
+    last = outflows[sender, LAST_KEY]
+    if last and day > last:
+        outflows[sender, CURSOR_KEY] = None
+        outflows[sender, LAST_KEY] = None
+    elif last and day != outflows[sender, CURSOR_KEY]:
+        outflows[sender, CURSOR_KEY] = day
+
+
+# A stream counts towards its sender's outflow between `begins` and `closes` until it is finalized or forfeited.
+def add_outflow(stream_id: str):
+    update_outflow(stream_id, 1)
+
+
+# Removes whatever the stream still contributes to the sender's outflow, called before its `closes` changes.
+def remove_outflow(stream_id: str):
+    update_outflow(stream_id, -1)
+
+
+# Adds (sign 1) or removes (sign -1) what the stream accrued up to now less what it paid, and its rate.
+# The rate changes at `begins` and `closes` apply now if they have passed and are scheduled otherwise.
+def update_outflow(stream_id: str, sign: int):
+    sender = streams[stream_id, SENDER_KEY]
+    rate = streams[stream_id, RATE_KEY]
+    begins = streams[stream_id, BEGIN_KEY]
+    closes = streams[stream_id, CLOSE_KEY]
+
+    checkpoint_outflow(sender)
+
+    accrued_until = now if now < closes else closes
+    if accrued_until > begins:
+        outflows[sender, OWED_KEY] += sign * rate * seconds_between(begins, accrued_until)
+    outflows[sender, OWED_KEY] -= sign * streams[stream_id, CLAIMED_KEY]
+
+    if begins > now:
+        update_outflow_schedule(sender, begins, rate, sign)
+    if closes > now:
+        update_outflow_schedule(sender, closes, -rate, sign)
+        if begins <= now:
+            outflows[sender, RATE_KEY] += sign * rate
+
+
+# Inserts (sign 1) or removes (sign -1) a rate change at `time` in the sender's bucket for its day, kept in time
+# order, and keeps the cursor at or before the first day with changes and `last` at the last.
+def update_outflow_schedule(sender: str, time: datetime.datetime, change, sign: int):
+    day, second = outflow_day(time)
+    changes = outflow_changes[sender, day] or []
+
+    if sign > 0:
+        i = len(changes)
+        while i > 0 and changes[i - 1][0] > second:
+            i -= 1
+        changes = changes[:i] + [[second, change]] + changes[i:]
+
+        last = outflows[sender, LAST_KEY]
+        if not last or day < outflows[sender, CURSOR_KEY]:
+            outflows[sender, CURSOR_KEY] = day
+        if day > last:
+            outflows[sender, LAST_KEY] = day
+    else:
+        # Streams created before outflows were scheduled have no entry to remove.
+        if [second, change] not in changes:
+            return
+        i = changes.index([second, change])
+        changes = changes[:i] + changes[i + 1:]
+
+    outflow_changes[sender, day] = changes if changes else None
+
+
+# Returns [day, second of day] of a time, days counted from OUTFLOW_ORIGIN.
+def outflow_day(time: datetime.datetime) -> list:
+    seconds = seconds_between(OUTFLOW_ORIGIN, time)
+    return [seconds // 86400, seconds % 86400]
+
+
+def outflow_time(day: int, second: int) -> datetime.datetime:
+    return OUTFLOW_ORIGIN + datetime.timedelta(days=day, seconds=second)
+
+
+def index_stream(stream_id: str, sender: str, receiver: str):
+    add_to_stream_index(stream_id, sender, OUTGOING)
+    add_to_stream_index(stream_id, receiver, INCOMING)
+
+
+def unindex_stream(stream_id: str):
+    remove_from_stream_index(stream_id, streams[stream_id, SENDER_KEY], OUTGOING)
+    remove_from_stream_index(stream_id, streams[stream_id, RECEIVER_KEY], INCOMING)
+
+
+def add_to_stream_index(stream_id: str, account: str, direction: str):
+    count = stream_index[account, direction]
+    stream_index[account, direction, count] = stream_id
+    stream_index[account, direction] = count + 1
+    streams[stream_id, INDEX_SLOT_KEYS[direction]] = count
+
+
+# Swaps the last stream of the index into the removed stream's slot.
+def remove_from_stream_index(stream_id: str, account: str, direction: str):
+    slot = streams[stream_id, INDEX_SLOT_KEYS[direction]]
+    if slot is None:
+        return
+
+    last = stream_index[account, direction] - 1
+    last_id = stream_index[account, direction, last]
+
+    stream_index[account, direction, slot] = last_id
+    streams[last_id, INDEX_SLOT_KEYS[direction]] = slot
+
+    stream_index[account, direction, last] = None
+    stream_index[account, direction] = last
+    streams[stream_id, INDEX_SLOT_KEYS[direction]] = None
 
 
 # Sets a stream to expire at some point greater than or equal to the current time.
@@ -219,12 +653,16 @@ def change_close_time(stream_id: str, new_close_time: str):
 
     assert ctx.caller == sender, 'Only sender can extend the close time of a stream.'
 
+    remove_outflow(stream_id)
     if new_close_time < streams[stream_id, BEGIN_KEY] and now < streams[stream_id, BEGIN_KEY]:
         streams[stream_id, CLOSE_KEY] = streams[stream_id, BEGIN_KEY]
     elif new_close_time <= now:
         streams[stream_id, CLOSE_KEY] = now
     else:
         streams[stream_id, CLOSE_KEY] = new_close_time
+    add_outflow(stream_id)
+
+    StreamCloseChangeEvent({"stream_id": stream_id, "closes": str(streams[stream_id, CLOSE_KEY])})
 
     return f"Changed close time of stream to {streams[stream_id, CLOSE_KEY]}"
 
@@ -244,18 +682,20 @@ def finalize_stream(stream_id: str):
 
     assert ctx.caller in [sender, receiver], 'Only sender or receiver can finalize a stream.'
 
-    begins = streams[stream_id, BEGIN_KEY]
     closes = streams[stream_id, CLOSE_KEY]
     rate = streams[stream_id, RATE_KEY]
-    claimed = streams[stream_id, CLAIMED_KEY]
+    accrued_until, due = stream_checkpoint(stream_id)
 
     assert now <= closes, 'Stream has not closed yet.'
 
-    outstanding_balance = calc_outstanding_balance(begins, closes, rate, claimed)
+    outstanding_balance = calc_outstanding_balance(accrued_until, closes, rate, due)
 
     assert outstanding_balance == 0, 'Stream has outstanding balance.'
 
     streams[stream_id, STATUS_KEY] = STREAM_FINALIZED
+    unindex_stream(stream_id)
+    remove_outflow(stream_id)
+    StreamFinalizeEvent({"stream_id": stream_id})
 
     return f"Finalized stream {stream_id}"
 
@@ -287,24 +727,47 @@ def forfeit_stream(stream_id: str) -> str:
     assert ctx.caller == receiver, 'Only receiver can forfeit a stream.'
 
     streams[stream_id, STATUS_KEY] = STREAM_FORFEIT
+    unindex_stream(stream_id)
+    remove_outflow(stream_id)
     streams[stream_id, CLOSE_KEY] = now
+    StreamForfeitEvent({"stream_id": stream_id})
 
     return f"Forfeit stream {stream_id}"
 
 
-def calc_outstanding_balance(begins: str, closes: str, rate: float, claimed: float) -> float:
-    begins = begins
-    closes = closes
-
+# Amount due is what was left unpaid at the last checkpoint plus whole seconds accrued since.
+def calc_outstanding_balance(accrued_until: str, closes: str, rate: float, due: float) -> float:
     claimable_end_point = now if now < closes else closes
-    claimable_period = claimable_end_point - begins
-    claimable_seconds = claimable_period.seconds
-    amount_due = (rate * claimable_seconds) - claimed
-    return amount_due
-
-
-def calc_claimable_amount(amount_due: float, sender:str) -> float:
-    return amount_due if amount_due < balances[sender] else balances[sender]
+    if claimable_end_point <= accrued_until:
+        return due
+    return due + rate * seconds_between(accrued_until, claimable_end_point)
+
+
+# Returns [accrued_until, due], streams without a checkpoint accrue from `begins`.
+def stream_checkpoint(stream_id: str) -> list:
+    accrued_until = streams[stream_id, ACCRUED_KEY]
+    if accrued_until is None:
+        return [streams[stream_id, BEGIN_KEY], -streams[stream_id, CLAIMED_KEY]]
+    return [accrued_until, streams[stream_id, DUE_KEY]]
+
+
+def calc_claimable_amount(amount_due: float, available: float, owed: float) -> float:
+    if owed > available:
+        # In base units the pro-rated amount is rounded down, the remainder stays due.
+        if base_units.get():
+            amount_due = amount_due * available // owed
+        else:
+            amount_due = amount_due * available / owed
+    return amount_due if amount_due < available else available
+
+
+# Signed whole seconds from start to end, including whole days.
+def seconds_between(start: datetime.datetime, end: datetime.datetime) -> int:
+    if end < start:
+        period = start - end
+        return -(period.days * 86400 + period.seconds % 86400)
+    period = end - start
+    return period.days * 86400 + period.seconds % 86400
 
 
 def construct_stream_permit_msg(sender:str, receiver:str, rate:float, begins:str, closes:str, deadline:str) -> str:
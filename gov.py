@@ -10,6 +10,8 @@ import currency
 # import Hash
 # import now
 # import datetime
+# import LogEvent
+# import decimal
 
 Actions = Hash()  # Actions, using action core pattern
 
@@ -36,6 +38,21 @@ Validators = Hash(default_value=0)
     
     Validators:<address>:epoch_collected: int or None
         - The index of the last epoch which rewards were collected for.
+
+    Validators:<address>:rewards: float
+        - The validator's commission and share of issuance for its own lock, claimable with claim_validator_rewards.
+
+    Validators:<address>:delegator_index: float
+        - The cumulative reward per unit of non-compounding delegated stake.
+
+    Validators:<address>:shares: float
+        - The total shares of compounding delegations.
+
+    Validators:<address>:compound_stake: float
+        - The tokens behind the compounding shares, rewards are added here so the share price grows.
+
+    Validators:<address>:reward_index: float
+        - The RewardIndex at which rewards were last accrued.
 """
 
 Delegators = Hash(default_value=0)
@@ -45,8 +62,18 @@ Delegators:<address>:<validator>:amount: float
 Delegators:<address>:<validator>:epoch_joined: int
     - The point when the delegator joined the validator.
 Delegators:<address>:<validator>:unbonding: Date or None
+Delegators:<address>:<validator>:rewards: float
+    - Rewards accrued to a non-compounding delegation, claimable with claim_rewards.
+Delegators:<address>:<validator>:reward_index: float
+    - The validator's delegator_index at which rewards were last accrued.
+Delegators:<address>:<validator>:shares: float
+    - Shares held in the validator's compounding pool.
+Delegators:<address>:<validator>:principal: float
+    - The tokens bonded for the compounding shares.
+Delegators:<address>:<validator>:compounded: float
+    - The part of amount that came from compounded rewards rather than bonded tokens.
 Delegators:<address>:<validator>:validator:p_record: Dict
-    - A record of changes in the delegation to this validator.
+    - A record of changes in the delegation to this validator, the amount delegated from each epoch.
     {
         [epoch]: [amount]
     }
@@ -55,10 +82,27 @@ Delegators:<address>:<validator>:validator:p_record: Dict
 
 
 
-StakingEpochs = Hash()  # Staking Epochs
+StakingEpochs = Hash()  # Staking Epochs - StakingEpochs:<epoch>:<validator>: float, power at the start of the epoch
+# Only written for validators whose power changed in the epoch before, otherwise the latest earlier epoch applies.
 Epoch_I = Variable()  # Epoch Index - The index tracking the current epoch : int
-TotalPower = Variable()  # Total Power - The total voting power among all validators : float
+Epoch_T = Variable()  # Epoch Time - The time at which the current epoch began : Date
+TotalPower = Variable()  # Total Power - The total voting power among all validators, as of the last fold : float
+PowerShards = Hash(default_value=0)  # PowerShards:<shard>: float - Power deltas not yet folded into TotalPower
 ActivePower = Variable()  # Active Power - The total voting power among all active validators : float
+RewardIndex = Variable()  # Reward Index - The cumulative issuance per unit of power : float
+PruneCursor = Variable()  # Prune Cursor - The power tree slot at which the next prune call starts : int
+
+Pending = Hash(default_value=0)
+"""
+    Used when Rules:queued_settlement is set, stake changes are netted per epoch instead of applied one by one.
+
+    Pending:<address>:<validator>:amount: float
+        - The net change to the delegation, not yet written to Delegators.
+    Pending:<address>:<validator>:epoch: int
+        - The epoch in which the net change was queued.
+"""
+PendingPower = Hash(default_value=0)  # PendingPower:<validator>: float - Net power change applied at the next epoch boundary
+DelegatorIndexEpochs = Hash()  # DelegatorIndexEpochs:<epoch>:<validator>: float - delegator_index when the queued changes took effect
 
 Rules = Hash() # This state is used to store the rules for the network. Alterable via governance votes.
 """
@@ -71,8 +115,50 @@ Rules = Hash() # This state is used to store the rules for the network. Alterabl
         epoch_length: int, # The number of hours in an epoch.
         min_vote_turnout: float, # The minimum percentage of power that must vote on a proposal for it to be valid.
         min_vote_ratio: float, # The minimum percentage of validators that must vote yes for a proposal to be valid.
+        queued_settlement: bool, # Net delegation changes per epoch and apply them at the epoch boundary.
     }
 """
+RuleVersions = Hash()
+"""
+    Every version of Rules, keyed by the epoch from which it is in force, so past epochs can be settled with their own rules.
+
+    RuleVersions:count: int
+        - The number of versions recorded.
+    RuleVersions:epoch:<index>: int
+        - The epoch at which version <index> takes effect, increasing with the index.
+    RuleVersions:rules:<index>: dict
+        - The full set of rules of version <index>.
+"""
+PowerTree = Hash(default_value=0)  # Fenwick tree over validator slots, mirrors Validators:<address>:power as of the last epoch boundary
+"""
+    Only written by seed and advance_epoch, so power changes during an epoch don't write shared tree nodes.
+    prune only deletes the slot and owner of validators that have left and whose leaf is already zero.
+
+    PowerTree:size: int
+        - The number of validator slots allocated. Slots are 1-indexed and never reused.
+
+    PowerTree:slot:<address>: int
+        - The slot assigned to a validator, 0 until the first epoch boundary after it first held power
+          and again once it has left without power. A validator that joins again gets a new slot.
+
+    PowerTree:owner:<slot>: str
+        - The validator occupying a slot, deleted when the validator gives the slot up.
+
+    PowerTree:node:<slot>: float
+        - The total power of slots (slot - lowbit(slot), slot].
+"""
+EpochWork = Hash()
+"""
+    The validators advance_epoch has to visit, so the boundary costs O(validators changed) rather than O(validators).
+
+    EpochWork:touched:<shard>: list
+        - The touched validators of a power shard, "new" for validators without a power tree slot.
+          A validator is appended on its first change in an epoch, so a shard's list is written once per validator and epoch.
+    EpochWork:epoch:<address>: int
+        - The epoch in which the validator was last appended.
+    EpochWork:compounding: list
+        - Validators with a compounding pool, their rewards are restaked into power every epoch.
+"""
 IssuanceRules = Hash(default_value=0) # IssuanceRules:rule_name: float
 """
     {
@@ -82,6 +168,7 @@ IssuanceRules = Hash(default_value=0) # IssuanceRules:rule_name: float
         reward_max: float, # The maximum reward percentage
         reward_target: float, # The target reward percentage
     }
+    Reward percentages are annual fractions of supply, e.g. 0.05 is 5% a year.
 """
 
 
@@ -103,40 +190,78 @@ DEFAULT_RULES = {
     "epoch_length": 0,
     "min_vote_turnout": 0.0,
     "min_vote_ratio": 0.0,
+    "queued_settlement": False,
+}
+
+DEFAULT_ISSUANCE_RULES = {
+    "staked_target": 0.0,
+    "reward_steepness": 0.0,
+    "reward_min": 0.0,
+    "reward_max": 0.0,
+    "reward_target": 0.0,
 }
 
+HOURS_PER_YEAR = 8760
+SAMPLE_PRECISION = 1000000  # Resolution of the seed -> power mapping in sample_by_power
+POWER_SHARDS = 16  # Number of PowerShards, validators write to the shard of their power tree slot
+
+# Fields deleted once a validator has left, power and active stay so get_validators still lists it as inactive.
+EXITED_VALIDATOR_FIELDS = ["locked", "unbonding", "is_genesis_node", "epoch_joined", "epoch_collected"]
+# Fields deleted once a validator that has left holds no power. Its remaining delegations are all unbonding and were
+# accrued when they announced their leave, so delegator_index is no longer read. A zero rewards is deleted as well.
+EMPTY_VALIDATOR_FIELDS = ["commission", "reward_index", "delegator_index", "shares", "compound_stake"]
+# Fields deleted once a delegation has left, unclaimed rewards are kept.
+EXITED_DELEGATION_FIELDS = ["amount", "epoch_joined", "unbonding", "record", "reward_index", "shares", "principal", "compounded"]
+
+# Events, indexers fold these instead of polling Validators and Delegators. Times are sent as strings.
+ValidatorJoinEvent = LogEvent(event="ValidatorJoin", params={"validator": {"type": str, "idx": True}, "commission": {"type": (int, float, decimal)}, "locked": {"type": (int, float, decimal)}})
+ValidatorAnnounceLeaveEvent = LogEvent(event="ValidatorAnnounceLeave", params={"validator": {"type": str, "idx": True}, "unbonding": {"type": str}})
+ValidatorCancelLeaveEvent = LogEvent(event="ValidatorCancelLeave", params={"validator": {"type": str, "idx": True}})
+ValidatorLeaveEvent = LogEvent(event="ValidatorLeave", params={"validator": {"type": str, "idx": True}, "locked": {"type": (int, float, decimal)}})
+DelegateEvent = LogEvent(event="Delegate", params={"delegator": {"type": str, "idx": True}, "validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}, "compound": {"type": bool}})
+RedelegateEvent = LogEvent(event="Redelegate", params={"delegator": {"type": str, "idx": True}, "from_validator": {"type": str, "idx": True}, "to_validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+DelegatorAnnounceLeaveEvent = LogEvent(event="DelegatorAnnounceLeave", params={"delegator": {"type": str, "idx": True}, "validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}, "unbonding": {"type": str}})
+DelegatorCancelLeaveEvent = LogEvent(event="DelegatorCancelLeave", params={"delegator": {"type": str, "idx": True}, "validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+DelegatorLeaveEvent = LogEvent(event="DelegatorLeave", params={"delegator": {"type": str, "idx": True}, "validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+PowerEvent = LogEvent(event="Power", params={"validator": {"type": str, "idx": True}, "power": {"type": (int, float, decimal)}})
+EpochEvent = LogEvent(event="Epoch", params={"epoch": {"type": int}, "issued": {"type": (int, float, decimal)}})
+ClaimRewardsEvent = LogEvent(event="ClaimRewards", params={"account": {"type": str, "idx": True}, "validator": {"type": str, "idx": True}, "amount": {"type": (int, float, decimal)}})
+
 
 @construct
-def seed(genesis_nodes: list, rules: dict = {}):
-    Rules["v_max"] = rules.get("v_max", DEFAULT_RULES["v_max"])
-    Rules["v_lock"] = rules.get("v_lock", DEFAULT_RULES["v_lock"])
-    Rules["v_min_commission"] = rules.get("v_min_commission", DEFAULT_RULES["v_min_commission"])
-    Rules["fee_dist"] = rules.get("fee_dist", DEFAULT_RULES["fee_dist"])
-    Rules["unbonding_period"] = rules.get("unbonding_period", DEFAULT_RULES["unbonding_period"])
-    Rules["epoch_length"] = rules.get("epoch_length", DEFAULT_RULES["epoch_length"])
-    Rules["min_vote_turnout"] = rules.get("min_vote_turnout", DEFAULT_RULES["min_vote_turnout"])
-    Rules["min_vote_ratio"] = rules.get("min_vote_ratio", DEFAULT_RULES["min_vote_ratio"])
+def seed(genesis_nodes: list, rules: dict = {}, issuance_rules: dict = {}):
+    genesis_rules = {}
+    for rule in DEFAULT_RULES.keys():
+        genesis_rules[rule] = rules.get(rule, DEFAULT_RULES[rule])
+
+    for rule in DEFAULT_ISSUANCE_RULES.keys():
+        IssuanceRules[rule] = issuance_rules.get(rule, DEFAULT_ISSUANCE_RULES[rule])
     
     Epoch_I.set(0)
+    set_rules(genesis_rules, 0)
+    Epoch_T.set(now)
     TotalPower.set(0)
     ActivePower.set(0)
+    RewardIndex.set(0)
     
     for node in genesis_nodes:
         Validators[node, 'active'] = True
         Validators[node, "locked"] = Rules["v_lock"]
         Validators[node, "unbonding"] = None
-        Validators[node, "power"] = Rules["v_lock"]
         Validators[node, "commission"] = Rules["v_min_commission"]
         Validators[node, "epoch_joined"] = 0
         Validators[node, "epoch_collected"] = None
         Validators[node, "is_genesis_node"] = True # Not returned tokens on leave.
-        TotalPower.set(TotalPower.get() + Rules["v_lock"])
+        add_power(node, Rules["v_lock"])
         
         StakingEpochs[0, node] = Rules["v_lock"]
                 
         Validators[node, "active"] = True
         ActivePower.set(ActivePower.get() + Rules["v_lock"])
 
+    apply_power_tree()
+    fold_power_shards()
+
 
 @export
 def join(commission: float):
@@ -149,18 +274,177 @@ def join(commission: float):
 
     assert commission >= min_commission, f"Commission must be at least {min_commission}"
 
-    currency.transfer_from(amount=join_fee, to=ctx.this, main_account=ctx.caller)
+    currency.bond(amount=join_fee, owner=ctx.caller)
 
     Validators[ctx.caller, 'active'] = True
     Validators[ctx.caller, "locked"] = join_fee
     Validators[ctx.caller, "unbonding"] = None
-    Validators[ctx.caller, "power"] += join_fee
     Validators[ctx.caller, "commission"] = commission
     Validators[ctx.caller, "epoch_joined"] = Epoch_I.get() + 1
     Validators[ctx.caller, "epoch_collected"] = None
     Validators[ctx.caller, "is_genesis_node"] = None
-    
-    TotalPower.set(TotalPower.get() + join_fee)
+
+    add_power(ctx.caller, join_fee)
+    ValidatorJoinEvent({"validator": ctx.caller, "commission": commission, "locked": join_fee})
+
+
+def add_power(validator: str, amount: float):
+    # Every change to Validators:<address>:power goes through here to keep the power tree and totals in step.
+    # The total is written to a shard rather than TotalPower and the power tree is updated at the epoch boundary,
+    # so transactions on different validators only share the shard keys of validators in the same shard.
+    amount += accrue_rewards(validator)
+    Validators[validator, "power"] += amount
+    slot = PowerTree["slot", validator]
+    PowerShards[slot % POWER_SHARDS] += amount
+    touch(validator, slot)
+    if amount:
+        PowerEvent({"validator": validator, "power": Validators[validator, "power"]})
+
+
+def fold_power_shards():
+    total = TotalPower.get()
+    for shard in range(POWER_SHARDS):
+        delta = PowerShards[shard]
+        if delta:
+            total += delta
+            PowerShards[shard] = 0
+    TotalPower.set(total)
+    return total
+
+
+@export
+def total_power():
+    """
+    * Returns the total power including deltas not yet folded into TotalPower.
+    * Read only, does not touch the shards' keys for writing.
+    """
+    total = TotalPower.get()
+    for shard in range(POWER_SHARDS):
+        total += PowerShards[shard]
+    return total
+
+
+@export
+def fold_total_power():
+    """
+    * Folds the power shards into TotalPower and returns the new total.
+    * Can be called by anyone, it does not change the total.
+    """
+    return fold_power_shards()
+
+
+def touch(validator: str, slot: int):
+    epoch = Epoch_I.get()
+    if EpochWork["epoch", validator] == epoch:
+        return
+    EpochWork["epoch", validator] = epoch
+    shard = slot % POWER_SHARDS if slot else "new"
+    EpochWork["touched", shard] = (EpochWork["touched", shard] or []) + [validator]
+
+
+def touched_validators():
+    validators = []
+    for shard in range(POWER_SHARDS):
+        validators += EpochWork["touched", shard] or []
+    return validators + (EpochWork["touched", "new"] or [])
+
+
+def apply_power_tree():
+    # Brings the power tree up to date with the validators touched this epoch and empties the touched lists.
+    for validator in touched_validators():
+        if not PowerTree["slot", validator] and not Validators[validator, "power"]:
+            continue
+        slot = power_tree_slot(validator)
+        delta = Validators[validator, "power"] - (power_tree_prefix(slot) - power_tree_prefix(slot - 1))
+        if delta:
+            power_tree_add(slot, delta)
+        release_power_slot(validator, slot)
+
+    for shard in range(POWER_SHARDS):
+        EpochWork["touched", shard] = None
+    EpochWork["touched", "new"] = None
+
+
+def power_tree_slot(validator: str):
+    slot = PowerTree["slot", validator]
+    if not slot:
+        # Append a slot, its node covers the existing slots (slot - lowbit(slot), slot - 1].
+        slot = PowerTree["size"] + 1
+        PowerTree["node", slot] = power_tree_prefix(slot - 1) - power_tree_prefix(slot - (slot & -slot))
+        PowerTree["slot", validator] = slot
+        PowerTree["owner", slot] = validator
+        PowerTree["size"] = slot
+    return slot
+
+
+def release_power_slot(validator: str, slot: int):
+    # A validator that has left and holds no power gives up its slot. The slot stays in the tree as an empty leaf,
+    # it is only released once that leaf is zero so the tree never holds power without an owner.
+    if Validators[validator, "active"] or Validators[validator, "power"]:
+        return
+    if power_tree_prefix(slot) - power_tree_prefix(slot - 1):
+        return
+    PowerTree["slot", validator] = None
+    PowerTree["owner", slot] = None
+    EpochWork["epoch", validator] = None
+
+
+def power_tree_add(slot: int, amount: float):
+    node = slot
+    size = PowerTree["size"]
+    while node <= size:
+        PowerTree["node", node] += amount
+        node += node & -node
+
+
+def power_tree_prefix(slot: int):
+    total = 0
+    while slot > 0:
+        total += PowerTree["node", slot]
+        slot -= slot & -slot
+    return total
+
+
+@export
+def sample_by_power(seed: int):
+    """
+    * Picks a validator with probability proportional to its power at the last epoch boundary.
+    * The seed is reduced modulo SAMPLE_PRECISION and mapped onto the cumulative power of all slots.
+    * O(log n) in the number of validator slots.
+    """
+    size = PowerTree["size"]
+    total = power_tree_prefix(size)
+    assert total > 0, "No power to sample from"
+
+    target = (seed % SAMPLE_PRECISION) * total / SAMPLE_PRECISION
+
+    step = 1
+    while step * 2 <= size:
+        step *= 2
+
+    # Descend the tree to the last slot whose prefix sum is <= target, the sample is the slot after it.
+    slot = 0
+    while step > 0:
+        if slot + step <= size and PowerTree["node", slot + step] <= target:
+            slot += step
+            target -= PowerTree["node", slot]
+        step //= 2
+
+    return PowerTree["owner", min(slot + 1, size)]
+
+
+@export
+def power_interval_of(validator: str):
+    """
+    * Returns [start, end), the interval of cumulative power that sample_by_power maps onto the validator.
+    * This is not an ordinal rank, start is the power of every validator in an earlier power tree slot.
+    * Like sample_by_power it reflects power at the last epoch boundary.
+    * O(log n) in the number of validator slots.
+    """
+    slot = PowerTree["slot", validator]
+    assert slot, "Validator has no power slot"
+
+    return [power_tree_prefix(slot - 1), power_tree_prefix(slot)]
 
 
 def copy_from_hash(from_h, to_h, items: list):
@@ -176,6 +460,58 @@ def write_to_hash(h, items: dict):
         h[k] = items[k]
 
 
+def set_rules(rules: dict, epoch: int):
+    """
+    * Records a new version of the rules, in force from `epoch` on. Rules missing from `rules` keep their latest value.
+    * A version recorded for the current epoch is applied to Rules immediately, later ones by advance_epoch.
+    """
+    assert epoch >= Epoch_I.get(), "Rules can't change in a past epoch"
+
+    count = RuleVersions["count"] or 0
+    version = {}
+    if count > 0:
+        last = RuleVersions["epoch", count - 1]
+        assert epoch >= last, "Rule changes must be recorded in epoch order"
+        for rule, value in RuleVersions["rules", count - 1].items():
+            version[rule] = value
+        if epoch == last:
+            count -= 1  # Replaces the version already recorded for this epoch
+    for rule, value in rules.items():
+        version[rule] = value
+
+    RuleVersions["epoch", count] = epoch
+    RuleVersions["rules", count] = version
+    RuleVersions["count"] = count + 1
+
+    if epoch == Epoch_I.get():
+        write_to_hash(Rules, version)
+
+
+@export
+def rules_at(epoch: int):
+    """
+    Called by : Anyone
+    * Returns the rules in force at `epoch`, by binary search over the epochs at which they changed.
+    """
+    return RuleVersions["rules", rule_version_at(epoch)]
+
+
+def rule_version_at(epoch: int):
+    # The index of the version in force at `epoch`.
+    low = 0
+    high = (RuleVersions["count"] or 0) - 1
+    assert high >= 0 and RuleVersions["epoch", 0] <= epoch, "No rules recorded for this epoch"
+
+    while low < high:
+        middle = (low + high + 1) // 2
+        if RuleVersions["epoch", middle] <= epoch:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
 @export
 def announce_validator_leave():
     assert Validators[ctx.caller, 'active'], "Not a validator"
@@ -184,6 +520,7 @@ def announce_validator_leave():
     Validators[ctx.caller, "unbonding"] = now + datetime.timedelta(
         days=Rules["unbonding_period"]
     )
+    ValidatorAnnounceLeaveEvent({"validator": ctx.caller, "unbonding": str(Validators[ctx.caller, "unbonding"])})
 
 
 @export
@@ -192,6 +529,7 @@ def cancel_validator_leave():
     assert Validators[ctx.caller, "unbonding"], "Not unbonding"
 
     Validators[ctx.caller, "unbonding"] = None
+    ValidatorCancelLeaveEvent({"validator": ctx.caller})
 
 
 @export
@@ -200,22 +538,21 @@ def validator_leave():
     assert Validators[ctx.caller, "unbonding"], "Not unbonding"
     assert Validators[ctx.caller, "unbonding"] <= now, "Unbonding period not over"
 
+    locked = Validators[ctx.caller, "locked"]
+
     # perform the transfer
     if not Validators[ctx.caller, "is_genesis_node"]:
-        currency.transfer(Validators[ctx.caller, "locked"], ctx.caller)
+        currency.unbond(amount=locked, owner=ctx.caller)
         
     # reset the validator record.
+    add_power(ctx.caller, -locked)
     Validators[ctx.caller, 'active'] = False
-    Validators[ctx.caller, "unbonding"] = None
-    Validators[ctx.caller, "power"] -= Validators[ctx.caller, "locked"]
-    Validators[ctx.caller, "locked"] = None
-    Validators[ctx.caller, "is_genesis_node"] = None
-    
-    TotalPower.set(TotalPower.get() - Validators[ctx.caller, "locked"])
+    clear_validator(ctx.caller)
+    ValidatorLeaveEvent({"validator": ctx.caller, "locked": locked})
 
 
 @export
-def delegate(validator: str, amount: float):
+def delegate(validator: str, amount: float, compound: bool = False):
     """
     Called by : Delegator
     * Delegates tokens to a validator.
@@ -223,6 +560,8 @@ def delegate(validator: str, amount: float):
     * Cannot delegate to a validator that is unbonding.
     * Cannot delegate to a validator if caller has a delegation to validator that is unbonding.
     * Value must be greater than 0.
+    * If compound is set, the delegation buys shares of the validator's compounding pool and its rewards are restaked each epoch.
+    * A delegation is either compounding or not, the mode can't change while tokens are delegated.
     """
     assert amount > 0, "Amount must be greater than 0"
     assert Validators[validator, 'active'], "Validator is not registered"
@@ -233,17 +572,26 @@ def delegate(validator: str, amount: float):
     assert currency_balances[ctx.caller] >= amount, "Insufficient funds"
     assert currency_balances[ctx.caller, ctx.this] >= amount, "Insufficient allowance"
 
-    currency.transfer_from(amount=amount, to=ctx.this, main_account=ctx.caller)
+    currency.bond(amount=amount, owner=ctx.caller)
+    DelegateEvent({"delegator": ctx.caller, "validator": validator, "amount": amount, "compound": compound})
+
+    if compound:
+        assert not Delegators[ctx.caller, validator, "amount"] + Pending[ctx.caller, validator, "amount"], "This delegation is not compounding"
+        buy_shares(ctx.caller, validator, amount)
+        return
+
+    assert not Delegators[ctx.caller, validator, "shares"], "This delegation is compounding"
 
+    if Rules["queued_settlement"]:
+        queue_delegation(ctx.caller, validator, amount)
+        return
+
+    accrue_delegation(ctx.caller, validator)
     Delegators[ctx.caller, validator, "amount"] += amount
     Delegators[ctx.caller, validator, "epoch_joined"] = Epoch_I.get() + 1
     Delegators[ctx.caller, validator, "unbonding"] = None
-    Delegators[ctx.caller, validator, "record"] = {
-        Epoch_I.get() + 1: amount
-    }
-    Validators[validator, "power"] += amount
-    
-    TotalPower.set(TotalPower.get() + amount)
+    write_record(ctx.caller, validator, Epoch_I.get() + 1, Delegators[ctx.caller, validator, "amount"])
+    add_power(validator, amount)
 
 
 @export
@@ -255,31 +603,36 @@ def announce_delegator_leave(validator: str):
     * If the validator is not unbonding, the delegated tokens can be claimed after the standard unbonding period, defined in Rules.
     * If the validator is no longer registered, the delegated tokens can be claimed immediately / unbonding period set to now.
     """
+    settle_delegation(ctx.caller, validator, True)
+    accrue_delegation(ctx.caller, validator)
+    redeem_shares(ctx.caller, validator)
+
     assert Delegators[ctx.caller, validator, "amount"] > 0, "No delegation to leave"
     assert not Delegators[ctx.caller, validator, "unbonding"], "Already unbonding"
 
+    amount = Delegators[ctx.caller, validator, "amount"]
+
     # Validator has left the network
     if not Validators[validator, 'active']:
-        currency.transfer(Delegators[ctx.caller, validator, "amount"], ctx.caller)
-        Validators[validator, "power"] -= Delegators[ctx.caller, validator, "amount"]
-        Delegators[ctx.caller, validator, "amount"] = 0
-        Delegators[ctx.caller, validator, "record"] = None
-        TotalPower.set(TotalPower.get() - Delegators[ctx.caller, validator, "amount"])
+        release_delegation(ctx.caller, validator, amount)
+        add_power(validator, -amount)
+        clear_delegation(ctx.caller, validator)
+        if not Validators[validator, "power"]:
+            clear_validator(validator)
+        DelegatorLeaveEvent({"delegator": ctx.caller, "validator": validator, "amount": amount})
         return
 
     # Validator is unbonding
     elif Validators[validator, "unbonding"]:
         Delegators[ctx.caller, validator, "unbonding"] = Validators[validator, "unbonding"]
-        Validators[validator, "power"] -= Delegators[ctx.caller, validator, "amount"]
 
     # Validator is not unbonding
     else:
         Delegators[ctx.caller, validator, "unbonding"] = now + datetime.timedelta(days=Rules["unbonding_period"])
-        Validators[validator, "power"] -= Delegators[ctx.caller, validator, "amount"]
 
-    Delegators[ctx.caller, validator, 'record'][Epoch_I.get()] = 0
-    
-    TotalPower.set(TotalPower.get() - Delegators[ctx.caller, validator, "amount"])
+    add_power(validator, -amount)
+    write_record(ctx.caller, validator, Epoch_I.get(), 0)
+    DelegatorAnnounceLeaveEvent({"delegator": ctx.caller, "validator": validator, "amount": amount, "unbonding": str(Delegators[ctx.caller, validator, "unbonding"])})
 
 
 @export
@@ -291,9 +644,11 @@ def cancel_delegator_leave(validator: str):
     assert Delegators[ctx.caller, validator, 'amount'] > 0, "No delegation to leave"
     assert Delegators[ctx.caller, validator, "unbonding"], "Not unbonding"
 
+    accrue_delegation(ctx.caller, validator)
     Delegators[ctx.caller, validator, "unbonding"] = None
-    Delegators[ctx.caller, validator, "record"][Epoch_I.get() + 1] = Delegators[ctx.caller, validator, "amount"]
-    Validators[validator, "power"] += Delegators[ctx.caller, validator, "amount"]
+    write_record(ctx.caller, validator, Epoch_I.get() + 1, Delegators[ctx.caller, validator, "amount"])
+    add_power(validator, Delegators[ctx.caller, validator, "amount"])
+    DelegatorCancelLeaveEvent({"delegator": ctx.caller, "validator": validator, "amount": Delegators[ctx.caller, validator, "amount"]})
 
 
 @export
@@ -311,18 +666,353 @@ def redelegate(from_validator: str, to_validator: str, amount: float):
     assert not Validators[to_validator, "unbonding"], "To validator is unbonding"
     
     # Delegator Checks
-    assert Delegators[ctx.caller, from_validator, 'amount'] > 0, "No delegation to move"
-    assert Delegators[ctx.caller, from_validator, 'amount'] >= amount, "Insufficient delegation"
+    delegated = delegation_of(ctx.caller, from_validator)
+    assert delegated > 0, "No delegation to move"
+    assert delegated >= amount, "Insufficient delegation"
     assert not Delegators[ctx.caller, from_validator, "unbonding"], "The 'from' delegation is unbonding, cancel the unbonding first"
     assert not Delegators[ctx.caller, to_validator, "unbonding"], "The 'to' delegation is unbonding, cancel the unbonding first"
+    assert not Delegators[ctx.caller, from_validator, "shares"], "Compounding delegations can't be redelegated"
+    assert not Delegators[ctx.caller, to_validator, "shares"], "Compounding delegations can't be redelegated"
+    assert not Delegators[ctx.caller, from_validator, "compounded"], "Compounded delegations can't be redelegated"
+
+    RedelegateEvent({"delegator": ctx.caller, "from_validator": from_validator, "to_validator": to_validator, "amount": amount})
+
+    if Rules["queued_settlement"]:
+        queue_delegation(ctx.caller, from_validator, -amount)
+        queue_delegation(ctx.caller, to_validator, amount)
+        return
 
+    accrue_delegation(ctx.caller, from_validator)
+    accrue_delegation(ctx.caller, to_validator)
     Delegators[ctx.caller, from_validator, "amount"] -= amount
-    Delegators[ctx.caller, from_validator, 'record'][Epoch_I.get()] -= amount
+    write_record(ctx.caller, from_validator, Epoch_I.get(), Delegators[ctx.caller, from_validator, "amount"])
     Delegators[ctx.caller, to_validator, "amount"] += amount
-    Delegators[ctx.caller, to_validator, 'record'][Epoch_I.get() + 1] += amount
+    write_record(ctx.caller, to_validator, Epoch_I.get() + 1, Delegators[ctx.caller, to_validator, "amount"])
     
-    Validators[from_validator, "power"] -= amount
-    Validators[to_validator, "power"] += amount
+    add_power(from_validator, -amount)
+    add_power(to_validator, amount)
+
+
+@export
+def delegation_of(delegator: str, validator: str):
+    """
+    * Returns the current amount delegated, including changes queued but not yet settled and the value of compounding shares.
+    """
+    amount = Delegators[delegator, validator, "amount"] + Pending[delegator, validator, "amount"]
+    shares = Delegators[delegator, validator, "shares"]
+    if shares:
+        amount += shares * Validators[validator, "compound_stake"] / Validators[validator, "shares"]
+    return amount
+
+
+def write_record(delegator: str, validator: str, epoch: int, amount: float):
+    # Hash values are copies, the record has to be written back to change it.
+    record = Delegators[delegator, validator, "record"] or {}
+    record[epoch] = amount
+    Delegators[delegator, validator, "record"] = record
+
+
+def queue_delegation(delegator: str, validator: str, amount: float):
+    settle_delegation(delegator, validator, False)
+
+    Pending[delegator, validator, "amount"] += amount
+    Pending[delegator, validator, "epoch"] = Epoch_I.get()
+    PendingPower[validator] += amount
+    touch(validator, PowerTree["slot", validator])
+
+
+def settle_delegation(delegator: str, validator: str, force: bool):
+    """
+    Writes the net change queued for a delegation to Delegators.
+    Changes from past epochs are already in the validator's power, changes from the current epoch are only settled if forced.
+    A change from a past epoch took effect at the following boundary, the old amount earns rewards up to the
+    delegator_index recorded there and the new amount from then on.
+    """
+    amount = Pending[delegator, validator, "amount"]
+    if not amount:
+        return
+
+    epoch = Pending[delegator, validator, "epoch"]
+    if epoch == Epoch_I.get():
+        if not force:
+            return
+        add_power(validator, amount)
+        PendingPower[validator] -= amount
+        accrue_delegation(delegator, validator)
+    else:
+        accrue_delegation_to(delegator, validator, DelegatorIndexEpochs[epoch + 1, validator])
+
+    if not Delegators[delegator, validator, "amount"]:
+        Delegators[delegator, validator, "epoch_joined"] = epoch + 1
+
+    Delegators[delegator, validator, "amount"] += amount
+
+    write_record(delegator, validator, epoch + 1, Delegators[delegator, validator, "amount"])
+
+    Pending[delegator, validator, "amount"] = None
+    Pending[delegator, validator, "epoch"] = None
+
+
+@export
+def advance_epoch():
+    """
+    Called by : Anyone
+    * Starts the next epoch once Rules:epoch_length hours have passed.
+    * Issues rewards for all the hours since the last boundary, so a late boundary issues for the epochs it covers.
+    * Only visits validators whose power changed or has changes queued, and those with compounding delegations.
+    * Accrues the rewards of validators with compounding delegations, restaking them into the validator's power.
+    * Applies the power changes queued during the epoch, one write per validator.
+    * Snapshots the visited validators' power into StakingEpochs and applies it to the power tree.
+    * Folds the power shards into TotalPower.
+    * Applies the version of the rules recorded for the new epoch, if any.
+    """
+    assert now >= Epoch_T.get() + datetime.timedelta(hours=Rules["epoch_length"]), "Epoch not over"
+
+    epoch = Epoch_I.get() + 1
+
+    issued = issue_epoch_rewards(fold_power_shards(), hours_since(Epoch_T.get()))
+
+    # Compounding pools restake their rewards, pools emptied since the last boundary are dropped from the list.
+    compounding = []
+    for validator in EpochWork["compounding"] or []:
+        if Validators[validator, "compound_stake"]:
+            compounding.append(validator)
+            add_power(validator, 0)
+    EpochWork["compounding"] = compounding
+
+    for validator in touched_validators():
+        if Rules["queued_settlement"]:
+            # Delegations with changes queued this epoch settle their rewards against the index at this boundary.
+            sync_rewards(validator)
+            DelegatorIndexEpochs[epoch, validator] = Validators[validator, "delegator_index"]
+        delta = PendingPower[validator]
+        if delta:
+            add_power(validator, delta)
+            PendingPower[validator] = 0
+        StakingEpochs[epoch, validator] = Validators[validator, "power"]
+
+    apply_power_tree()
+    fold_power_shards()
+
+    Epoch_I.set(epoch)
+    Epoch_T.set(now)
+
+    # Rules recorded for the new epoch replace the ones in force, after the ended epoch was issued under the old ones.
+    # Other boundaries leave Rules alone, even while a later version is waiting.
+    if RuleVersions["count"]:
+        version = rule_version_at(epoch)
+        if RuleVersions["epoch", version] == epoch:
+            write_to_hash(Rules, RuleVersions["rules", version])
+
+    EpochEvent({"epoch": epoch, "issued": issued})
+
+    return epoch
+
+
+def issuance_rate(staked_ratio: float):
+    """
+    Annual issuance as a fraction of supply, for the share of supply that is staked.
+    * reward_max with nothing staked, falling to reward_target at staked_target, then to reward_min when everything is staked.
+    * reward_steepness in [0, 1] bends each side from a straight line (0) to a parabola (1).
+    """
+    target = IssuanceRules["staked_target"]
+    steepness = IssuanceRules["reward_steepness"]
+    reward_target = IssuanceRules["reward_target"]
+
+    if staked_ratio < target:
+        x = 1 - staked_ratio / target
+        return reward_target + (IssuanceRules["reward_max"] - reward_target) * ((1 - steepness) * x + steepness * x * x)
+
+    x = 1 if target >= 1 else min((staked_ratio - target) / (1 - target), 1)
+    return reward_target - (reward_target - IssuanceRules["reward_min"]) * ((1 - steepness) * x + steepness * x * x)
+
+
+def issue_epoch_rewards(total: float, hours: float):
+    # One currency.issue per epoch for the hours it lasted, spread over all power through RewardIndex.
+    if total <= 0:
+        return 0
+
+    supply = ForeignVariable(foreign_contract="currency", foreign_name="supply").get()
+    amount = payable(supply * issuance_rate(total / supply) * hours / HOURS_PER_YEAR)
+
+    if amount <= 0:
+        return 0
+
+    currency.issue(amount=amount)
+    RewardIndex.set(RewardIndex.get() + amount / total)
+
+    return amount
+
+
+def hours_since(time: datetime.datetime) -> float:
+    elapsed = now - time
+    return (elapsed.days * 86400 + elapsed.seconds % 86400) / 3600
+
+
+def accrue_rewards(validator: str):
+    """
+    Brings a validator's rewards up to RewardIndex, called before its power changes.
+    * The validator takes its commission and the share earned by its own lock.
+    * The rest is split by stake between the compounding pool and the delegator_index of non-compounding delegations.
+    * Returns the amount added to the compounding pool, which the caller adds to the validator's power.
+    """
+    index = RewardIndex.get()
+    power = Validators[validator, "power"]
+    reward = power * (index - Validators[validator, "reward_index"])
+    Validators[validator, "reward_index"] = index
+
+    if reward <= 0:
+        return 0
+
+    own_stake = Validators[validator, "locked"]
+    commission = reward * Validators[validator, "commission"] / 100
+    validator_reward = commission + (reward - commission) * own_stake / power
+    Validators[validator, "rewards"] += validator_reward
+
+    delegated = power - own_stake
+    if delegated <= 0:
+        return 0
+
+    delegator_reward = reward - validator_reward
+    compound_stake = Validators[validator, "compound_stake"]
+    compounded = delegator_reward * compound_stake / delegated
+
+    if delegated > compound_stake:
+        Validators[validator, "delegator_index"] += (delegator_reward - compounded) / (delegated - compound_stake)
+    if compounded:
+        Validators[validator, "compound_stake"] += compounded
+
+    return compounded
+
+
+def sync_rewards(validator: str):
+    # Without power nothing accrues, which also keeps a cleared validator's record from being written again.
+    if Validators[validator, "power"] and Validators[validator, "reward_index"] != RewardIndex.get():
+        add_power(validator, 0)
+
+
+def accrue_delegation(delegator: str, validator: str):
+    # Brings a non-compounding delegation's rewards up to the validator's delegator_index, unbonding stake earns nothing.
+    sync_rewards(validator)
+    accrue_delegation_to(delegator, validator, Validators[validator, "delegator_index"])
+
+
+def accrue_delegation_to(delegator: str, validator: str, index: float):
+    if not Delegators[delegator, validator, "unbonding"]:
+        Delegators[delegator, validator, "rewards"] += Delegators[delegator, validator, "amount"] * (index - Delegators[delegator, validator, "reward_index"])
+    Delegators[delegator, validator, "reward_index"] = index
+
+
+def buy_shares(delegator: str, validator: str, amount: float):
+    # Accrues first so the new shares are priced after this epoch's compounding.
+    add_power(validator, amount)
+
+    if not Validators[validator, "compound_stake"]:
+        compounding = EpochWork["compounding"] or []
+        if validator not in compounding:
+            EpochWork["compounding"] = compounding + [validator]
+
+    total_shares = Validators[validator, "shares"]
+    compound_stake = Validators[validator, "compound_stake"]
+    shares = amount if total_shares <= 0 or compound_stake <= 0 else amount * total_shares / compound_stake
+
+    Validators[validator, "shares"] += shares
+    Validators[validator, "compound_stake"] += amount
+
+    if not Delegators[delegator, validator, "shares"]:
+        Delegators[delegator, validator, "epoch_joined"] = Epoch_I.get() + 1
+    Delegators[delegator, validator, "shares"] += shares
+    Delegators[delegator, validator, "principal"] += amount
+    Delegators[delegator, validator, "unbonding"] = None
+
+
+def redeem_shares(delegator: str, validator: str):
+    # Turns compounding shares into a plain amount at the current share price, the power stays until the caller removes it.
+    shares = Delegators[delegator, validator, "shares"]
+    if not shares:
+        return
+
+    sync_rewards(validator)
+    value = shares * Validators[validator, "compound_stake"] / Validators[validator, "shares"]
+    principal = Delegators[delegator, validator, "principal"]
+
+    Validators[validator, "shares"] -= shares
+    Validators[validator, "compound_stake"] -= value
+
+    Delegators[delegator, validator, "amount"] += value
+    Delegators[delegator, validator, "compounded"] += value - principal if value > principal else 0
+    Delegators[delegator, validator, "reward_index"] = Validators[validator, "delegator_index"]
+    Delegators[delegator, validator, "shares"] = None
+    Delegators[delegator, validator, "principal"] = None
+
+
+def release_delegation(delegator: str, validator: str, amount: float):
+    # Bonded tokens come back from custody, compounded rewards from the issuance held by this contract.
+    compounded = Delegators[delegator, validator, "compounded"]
+    bonded = payable(amount - compounded, True)
+    if bonded > 0:
+        currency.unbond(amount=bonded, owner=delegator)
+    compounded = payable(compounded)
+    if compounded > 0:
+        currency.transfer(amount=compounded, to=delegator)
+    Delegators[delegator, validator, "compounded"] = None
+
+
+def payable(amount: float, nearest: bool = False):
+    # Amounts sent to currency. If currency counts whole base units they are rounded down, or to the nearest unit
+    # for bonded tokens that only differ from a whole number by rounding error. What is left over stays with this contract.
+    if not ForeignVariable(foreign_contract="currency", foreign_name="base_units").get():
+        return amount
+    return int(amount + 0.5) if nearest else int(amount)
+
+
+@export
+def pending_rewards(validator: str):
+    """
+    * Returns the validator's claimable rewards, including issuance not yet accrued.
+    """
+    rewards = Validators[validator, "rewards"]
+    power = Validators[validator, "power"]
+    reward = power * (RewardIndex.get() - Validators[validator, "reward_index"])
+
+    if reward > 0:
+        commission = reward * Validators[validator, "commission"] / 100
+        rewards += commission + (reward - commission) * Validators[validator, "locked"] / power
+
+    return rewards
+
+
+@export
+def claim_validator_rewards():
+    """
+    Called by : Validator
+    * Pays out the validator's commission and the rewards earned by its own lock.
+    """
+    sync_rewards(ctx.caller)
+
+    amount = payable(Validators[ctx.caller, "rewards"])
+    assert amount > 0, "No rewards to claim"
+
+    Validators[ctx.caller, "rewards"] -= amount
+    currency.transfer(amount=amount, to=ctx.caller)
+    ClaimRewardsEvent({"account": ctx.caller, "validator": ctx.caller, "amount": amount})
+
+
+@export
+def claim_rewards(validator: str):
+    """
+    Called by : Delegator
+    * Pays out the rewards of a non-compounding delegation.
+    """
+    settle_delegation(ctx.caller, validator, False)
+    accrue_delegation(ctx.caller, validator)
+
+    amount = payable(Delegators[ctx.caller, validator, "rewards"])
+    assert amount > 0, "No rewards to claim"
+
+    Delegators[ctx.caller, validator, "rewards"] -= amount
+    currency.transfer(amount=amount, to=ctx.caller)
+    ClaimRewardsEvent({"account": ctx.caller, "validator": validator, "amount": amount})
 
 
 @export
@@ -335,11 +1025,73 @@ def delegator_leave(validator: str):
     assert Delegators[ctx.caller, validator, "unbonding"], 'Not unbonding, call announce_delegator_leave first'
     assert Delegators[ctx.caller, validator, "unbonding"] <= now, 'Unbonding period not over'
     
-    currency.transfer(Delegators[ctx.caller, validator, "amount"], ctx.caller)
-    
-    Delegators[ctx.caller, validator, "amount"] = 0
-    Delegators[ctx.caller, validator, "unbonding"] = None
-    Delegators[ctx.caller, validator, "validator"] = None
+    amount = Delegators[ctx.caller, validator, "amount"]
+    accrue_delegation(ctx.caller, validator)
+    release_delegation(ctx.caller, validator, amount)
+    clear_delegation(ctx.caller, validator)
+    DelegatorLeaveEvent({"delegator": ctx.caller, "validator": validator, "amount": amount})
+
+
+def clear_validator(validator: str):
+    # Deletes what a validator that has left no longer needs, everything but its unclaimed rewards once it holds no power.
+    for field in EXITED_VALIDATOR_FIELDS:
+        Validators[validator, field] = None
+
+    if Validators[validator, "power"]:
+        return
+
+    for field in EMPTY_VALIDATOR_FIELDS:
+        Validators[validator, field] = None
+    if not Validators[validator, "rewards"]:
+        Validators[validator, "rewards"] = None
+
+
+def clear_delegation(delegator: str, validator: str):
+    for field in EXITED_DELEGATION_FIELDS:
+        Delegators[delegator, validator, field] = None
+    if not Delegators[delegator, validator, "rewards"]:
+        Delegators[delegator, validator, "rewards"] = None
+
+
+@export
+def prune(max_items: int):
+    """
+    Called by : Anyone
+    * Deletes the leftover fields of up to max_items validators that have left, e.g. those that left before clear_validator existed.
+    * A validator without power also gives up its power tree slot, the empty slot is still walked.
+    * Walks the power tree slots from where the last call stopped and wraps around, returns the next slot.
+    """
+    size = PowerTree["size"]
+    if not size:
+        return 0
+
+    slot = PruneCursor.get() or 1
+    for i in range(min(max_items, size)):
+        validator = PowerTree["owner", slot]
+        if validator and not Validators[validator, "active"]:
+            clear_validator(validator)
+            release_power_slot(validator, slot)
+        slot = slot + 1 if slot < size else 1
+
+    PruneCursor.set(slot)
+    return slot
+
+
+@export
+def prune_delegations(delegations: list):
+    """
+    Called by : Anyone
+    * Deletes the leftover fields of the given [delegator, validator] pairs that hold nothing, e.g. those left before clear_delegation existed.
+    * Delegations that still hold tokens, shares or queued changes are skipped.
+    """
+    pruned = 0
+    for delegator, validator in delegations:
+        if Delegators[delegator, validator, "amount"] or Delegators[delegator, validator, "shares"] or Pending[delegator, validator, "amount"]:
+            continue
+        clear_delegation(delegator, validator)
+        pruned += 1
+
+    return pruned
 
 
 # @export
@@ -0,0 +1,62 @@
+import time
+
+from contracting.client import ContractingClient
+from nacl.signing import SigningKey
+
+# Per-permit cost of `permit` against `permit_many` at growing batch sizes.
+# Run from the repository root : python tests/bench_permits.py
+
+CHAIN_ID = "bench-chain"
+DEADLINE = "2100-01-01 00:00:00"
+BATCH_SIZES = [1, 10, 100, 1000]
+
+
+def sign_permit(key, spender, value, deadline, contract="currency", chain_id=CHAIN_ID):
+    # Signs the message built by currency.construct_permit_msg
+    owner = key.verify_key.encode().hex()
+    msg = f"{owner}:{spender}:{value}:{deadline}:{contract}:{chain_id}"
+    return {
+        "owner": owner,
+        "spender": spender,
+        "value": value,
+        "deadline": deadline,
+        "signature": key.sign(msg.encode()).signature.hex(),
+    }
+
+
+def setup_currency(client):
+    client.flush()
+    with open("currency.py") as f:
+        client.submit(f.read(), name="currency", constructor_args={"vk": "sys", "gov_contract": "gov"})
+    return client.get_contract("currency")
+
+
+def bench(batch_size, client):
+    currency = setup_currency(client)
+    environment = {"chain_id": CHAIN_ID}
+    signed = [sign_permit(SigningKey.generate(), "relayer", 1, DEADLINE) for _ in range(batch_size)]
+
+    start = time.perf_counter()
+    for p in signed:
+        currency.permit(**p, signer="relayer", environment=environment)
+    single = (time.perf_counter() - start) / batch_size
+
+    currency = setup_currency(client)
+    start = time.perf_counter()
+    currency.permit_many(signed_permits=signed, signer="relayer", environment=environment)
+    batched = (time.perf_counter() - start) / batch_size
+
+    return single, batched
+
+
+def main():
+    client = ContractingClient()
+    print(f"{'batch':>6} {'permit (ms)':>12} {'permit_many (ms)':>17}")
+    for size in BATCH_SIZES:
+        single, batched = bench(size, client)
+        print(f"{size:>6} {single * 1000:>12.3f} {batched * 1000:>17.3f}")
+    client.flush()
+
+
+if __name__ == "__main__":
+    main()
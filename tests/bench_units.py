@@ -0,0 +1,77 @@
+import time
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+
+# Throughput of currency seeded with decimal amounts against integer base units.
+# Run from the repository root : python tests/bench_units.py
+
+N = 1000
+START = Datetime(year=2021, month=1, day=1)
+
+
+def setup_currency(client, integer_units):
+    client.flush()
+    with open("currency.py") as f:
+        client.submit(
+            f.read(),
+            name="currency",
+            constructor_args={"vk": "sys", "gov_contract": "gov", "integer_units": integer_units},
+        )
+    return client.get_contract("currency")
+
+
+def bench_contract(client, integer_units):
+    currency = setup_currency(client, integer_units)
+    amount = currency.to_units(tokens=1.5) if integer_units else 1.5
+    rate = currency.to_units(tokens=0.001) if integer_units else 0.001
+
+    start = time.perf_counter()
+    for i in range(N):
+        currency.transfer(amount=amount, to=f"account{i % 100}", signer="sys")
+    transfers = N / (time.perf_counter() - start)
+
+    stream_id = currency.create_stream(
+        receiver="bob", rate=rate, begins="2021-01-01 00:00:00", closes="2022-01-01 00:00:00", signer="sys",
+        environment={"now": START},
+    )
+    start = time.perf_counter()
+    for i in range(N):
+        currency.balance_stream(stream_id=stream_id, signer="bob", environment={"now": START + Timedelta(seconds=i + 1)})
+    balances = N / (time.perf_counter() - start)
+
+    return transfers, balances
+
+
+def bench_arithmetic(n=200000):
+    # The stream accrual and pro-rating of settle_stream, without the contract around it.
+    def run(rate, due, available, owed, divide):
+        start = time.perf_counter()
+        for seconds in range(n):
+            outstanding = due + rate * seconds
+            divide(outstanding * available, owed)
+        return n / (time.perf_counter() - start)
+
+    decimal = run(
+        ContractingDecimal("0.001"), ContractingDecimal("0"), ContractingDecimal("5000.5"), ContractingDecimal("9000.25"),
+        lambda a, b: a / b,
+    )
+    integer = run(100000, 0, 500050000000, 900025000000, lambda a, b: a // b)
+    return decimal, integer
+
+
+def main():
+    client = ContractingClient()
+    print(f"{'mode':>8} {'transfer/s':>11} {'balance_stream/s':>17}")
+    for integer_units in (False, True):
+        transfers, balances = bench_contract(client, integer_units)
+        print(f"{'units' if integer_units else 'decimal':>8} {transfers:>11.0f} {balances:>17.0f}")
+    client.flush()
+
+    decimal, integer = bench_arithmetic()
+    print(f"accrual and pro-rating per second : decimal {decimal:.0f}, integer {integer:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+import hashlib
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+from contracting.storage.driver import Driver
+from contracting.storage.encoder import decode, encode
+
+from gov_fixtures import large_validator_set, restore, snapshot
+
+# Conservative read / write key sets for gov and currency exports, and a scheduler that runs the
+# non-conflicting transactions of a block side by side on worker processes with their own replica of the state.
+#
+# Keys are tuples of key parts, e.g. ("gov.Validators", "node3", "power").
+# A key ending in ANY covers every key that starts with the same parts.
+
+ANY = "*"
+POWER_SHARDS = 16  # Must match gov.POWER_SHARDS
+CUSTODY_SHARDS = 16  # Must match currency.CUSTODY_SHARDS
+
+Tx = namedtuple("Tx", ["contract", "function", "caller", "kwargs"])
+
+
+def contracting_sha3(value):
+    # Mirrors contracting's hashlib.sha3, hex strings are hashed as bytes.
+    try:
+        data = bytes.fromhex(value)
+    except ValueError:
+        data = value.encode()
+    return hashlib.sha3_256(data).hexdigest()
+
+
+def custody_shard(owner):
+    # Mirrors currency.custody_shard
+    return int(contracting_sha3(owner)[:8], 16) % CUSTODY_SHARDS
+
+
+def power_keys(validator, driver=None, gov="gov"):
+    """
+    Keys written by gov.add_power for a validator, the power tree itself is only written by advance_epoch.
+    Without a driver the slot is unknown, so every shard is covered.
+    """
+    keys = {
+        (f"{gov}.Validators", validator, "power"),
+        (f"{gov}.EpochWork", "epoch", validator),
+        (f"{gov}.PowerTree", "slot", validator),
+    }
+    slot = driver.get(f"{gov}.PowerTree:slot:{validator}") if driver is not None else None
+    if driver is None:
+        return keys | {(f"{gov}.PowerShards", ANY), (f"{gov}.EpochWork", "touched", ANY)}
+
+    keys.add((f"{gov}.PowerShards", str((slot or 0) % POWER_SHARDS)))
+    keys.add((f"{gov}.EpochWork", "touched", str(slot % POWER_SHARDS) if slot else "new"))
+    return keys
+
+
+def validator_keys(validator, driver=None, gov="gov"):
+    # Keys written when a validator's power or rewards change, accrue_rewards and clear_validator write any of its fields.
+    return {(f"{gov}.Validators", validator, ANY)} | power_keys(validator, driver, gov)
+
+
+def delegation_keys(delegator, validator, gov="gov"):
+    # Keys written when a delegation is settled, accrued or changed, including the changes queued for it.
+    return {
+        (f"{gov}.Delegators", delegator, validator, ANY),
+        (f"{gov}.Pending", delegator, validator, ANY),
+        (f"{gov}.PendingPower", validator),
+    }
+
+
+def bond_keys(owner, contract, currency="currency"):
+    return {
+        (f"{currency}.balances", owner),
+        (f"{currency}.balances", owner, contract),
+        (f"{currency}.custody", contract, owner),
+        (f"{currency}.custody_shards", contract, str(custody_shard(owner))),
+    }
+
+
+def unbond_keys(owner, contract, currency="currency"):
+    return {
+        (f"{currency}.balances", owner),
+        (f"{currency}.custody", contract, owner),
+        (f"{currency}.custody_shards", contract, str(custody_shard(owner))),
+    }
+
+
+def payout_keys(to, contract, currency="currency"):
+    # Rewards and compounded stake are transferred out of the contract's own balance.
+    return {(f"{currency}.balances", contract), (f"{currency}.balances", to)}
+
+
+def gov_access(tx, driver=None, gov="gov", currency="currency"):
+    """
+    Returns (reads, writes) for a gov transaction.
+    Every write is also treated as a read, reads only list keys that are not written.
+    """
+    caller, kw = tx.caller, tx.kwargs
+    rules = {
+        (f"{gov}.Rules", ANY),
+        (f"{gov}.Epoch_I",),
+        (f"{gov}.RewardIndex",),
+        (f"{gov}.DelegatorIndexEpochs", ANY),
+        (f"{currency}.base_units",),
+    }
+
+    if tx.function == "join":
+        writes = validator_keys(caller, driver, gov) | bond_keys(caller, gov, currency)
+        return rules, writes
+
+    if tx.function in ("announce_validator_leave", "cancel_validator_leave"):
+        return rules | {(f"{gov}.Validators", caller, ANY)}, {(f"{gov}.Validators", caller, "unbonding")}
+
+    if tx.function == "validator_leave":
+        writes = validator_keys(caller, driver, gov) | unbond_keys(caller, gov, currency)
+        return rules, writes
+
+    if tx.function == "delegate":
+        v = kw["validator"]
+        writes = delegation_keys(caller, v, gov) | validator_keys(v, driver, gov) | bond_keys(caller, gov, currency)
+        writes.add((f"{gov}.EpochWork", "compounding"))
+        return rules, writes
+
+    if tx.function in ("announce_delegator_leave", "delegator_leave"):
+        v = kw["validator"]
+        writes = delegation_keys(caller, v, gov) | validator_keys(v, driver, gov)
+        writes |= unbond_keys(caller, gov, currency) | payout_keys(caller, gov, currency)
+        return rules, writes
+
+    if tx.function == "cancel_delegator_leave":
+        v = kw["validator"]
+        return rules, delegation_keys(caller, v, gov) | validator_keys(v, driver, gov)
+
+    if tx.function == "redelegate":
+        a, b = kw["from_validator"], kw["to_validator"]
+        writes = delegation_keys(caller, a, gov) | delegation_keys(caller, b, gov)
+        writes |= validator_keys(a, driver, gov) | validator_keys(b, driver, gov)
+        return rules, writes
+
+    if tx.function == "claim_rewards":
+        v = kw["validator"]
+        writes = delegation_keys(caller, v, gov) | validator_keys(v, driver, gov) | payout_keys(caller, gov, currency)
+        return rules, writes
+
+    if tx.function == "claim_validator_rewards":
+        return rules, validator_keys(caller, driver, gov) | payout_keys(caller, gov, currency)
+
+    if tx.function == "advance_epoch":
+        # Visits every touched validator and issues rewards, a barrier for the whole contract.
+        reads = {(f"{currency}.issuer",), (f"{currency}.base_units",)}
+        return reads, {(f"{gov}.", ANY), (f"{currency}.supply",), (f"{currency}.balances", gov)}
+
+    if tx.function == "prune":
+        # The slots walked depend on PruneCursor, any validator may be cleared.
+        writes = {
+            (f"{gov}.Validators", ANY),
+            (f"{gov}.PowerTree", ANY),
+            (f"{gov}.EpochWork", "epoch", ANY),
+            (f"{gov}.PruneCursor",),
+        }
+        return rules, writes
+
+    if tx.function == "prune_delegations":
+        reads, writes = set(), set()
+        for delegator, validator in kw["delegations"]:
+            reads.add((f"{gov}.Pending", delegator, validator, ANY))
+            writes.add((f"{gov}.Delegators", delegator, validator, ANY))
+        return reads, writes
+
+    if tx.function == "fold_total_power":
+        return set(), {(f"{gov}.PowerShards", ANY), (f"{gov}.TotalPower",)}
+
+    if tx.function in ("sample_by_power", "power_interval_of", "total_power"):
+        return {(f"{gov}.PowerTree", ANY), (f"{gov}.Validators", ANY), (f"{gov}.PowerShards", ANY), (f"{gov}.TotalPower",)}, set()
+
+    if tx.function == "pending_rewards":
+        return {(f"{gov}.Validators", kw["validator"], ANY), (f"{gov}.RewardIndex",)}, set()
+
+    if tx.function == "delegation_of":
+        d, v = kw["delegator"], kw["validator"]
+        return {(f"{gov}.Delegators", d, v, ANY), (f"{gov}.Pending", d, v, ANY), (f"{gov}.Validators", v, ANY)}, set()
+
+    if tx.function == "rules_at":
+        return {(f"{gov}.RuleVersions", ANY)}, set()
+
+    # Unknown export, assume it touches the whole contract.
+    return set(), {(f"{gov}.", ANY)}
+
+
+def currency_access(tx, driver=None, currency="currency"):
+    caller, kw = tx.caller, tx.kwargs
+
+    units = {(f"{currency}.base_units",)}
+
+    if tx.function == "transfer":
+        return units, {(f"{currency}.balances", caller), (f"{currency}.balances", kw["to"])}
+
+    if tx.function == "approve":
+        return units, {(f"{currency}.balances", caller, kw["to"])}
+
+    if tx.function == "transfer_from":
+        main = kw["main_account"]
+        return units, {
+            (f"{currency}.balances", main),
+            (f"{currency}.balances", main, caller),
+            (f"{currency}.balances", kw["to"]),
+        }
+
+    if tx.function in ("balance_of", "custody_of"):
+        return {(f"{currency}.balances", ANY), (f"{currency}.custody_shards", ANY)}, set()
+
+    return set(), {(f"{currency}.", ANY)}
+
+
+def access_sets(tx, driver=None, gov="gov", currency="currency"):
+    if tx.contract == gov:
+        return gov_access(tx, driver, gov, currency)
+    if tx.contract == currency:
+        return currency_access(tx, driver, currency)
+    return set(), {(f"{tx.contract}.", ANY)}
+
+
+def key_parts(key):
+    # "gov.Validators:node1:power" -> ("gov.Validators", "node1", "power")
+    return tuple(key.split(":"))
+
+
+def undeclared(sets, reads, writes):
+    """
+    Returns the state keys an execution read or wrote that (reads, writes) from access_sets doesn't cover,
+    e.g. for the reads and writes in the full output of a transaction. Contract metadata such as __code__ is ignored.
+    """
+    declared_reads, declared_writes = sets
+    declared = declared_reads | declared_writes
+    missing = set()
+    for key in writes:
+        if "__" not in key and not any(keys_overlap(d, key_parts(key)) for d in declared_writes):
+            missing.add(key)
+    for key in reads:
+        if "__" not in key and not any(keys_overlap(d, key_parts(key)) for d in declared):
+            missing.add(key)
+    return sorted(missing)
+
+
+def keys_overlap(a, b):
+    for i in range(min(len(a), len(b))):
+        if a[i] == ANY or b[i] == ANY:
+            return True
+        if a[i] != b[i]:
+            # A bare contract prefix such as "gov." covers every name in the contract.
+            if a[i].endswith(".") and b[i].startswith(a[i]):
+                return True
+            if b[i].endswith(".") and a[i].startswith(b[i]):
+                return True
+            return False
+    return len(a) == len(b)
+
+
+def sets_overlap(a, b):
+    return any(keys_overlap(x, y) for x in a for y in b)
+
+
+def conflicts(first, second):
+    reads_1, writes_1 = first
+    reads_2, writes_2 = second
+    return (
+        sets_overlap(writes_1, writes_2)
+        or sets_overlap(writes_1, reads_2)
+        or sets_overlap(reads_1, writes_2)
+    )
+
+
+def schedule(txs, driver=None, gov="gov", currency="currency"):
+    """
+    Splits a block into waves of mutually non-conflicting transactions.
+    A transaction is placed after every earlier transaction it conflicts with, so running the
+    waves in order gives the same result as running the block serially.
+    """
+    sets = [access_sets(tx, driver, gov, currency) for tx in txs]
+    wave_of = []
+    waves = []
+
+    for i, tx in enumerate(txs):
+        wave = 0
+        for j in range(i):
+            if wave_of[j] >= wave and conflicts(sets[j], sets[i]):
+                wave = wave_of[j] + 1
+        wave_of.append(wave)
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(tx)
+
+    return waves
+
+
+def execute(client, tx, environment, contracts):
+    # Runs tx on client and returns its writes, {} if it reverted.
+    if tx.contract not in contracts:
+        contracts[tx.contract] = client.get_contract(tx.contract)
+    try:
+        output = getattr(contracts[tx.contract], tx.function)(
+            **tx.kwargs, signer=tx.caller, environment=environment, return_full_output=True
+        )
+    except Exception:
+        return {}
+    return dict(output["writes"])
+
+
+def run_serial(client, txs, environment):
+    contracts = {}
+    return [execute(client, tx, environment, contracts) for tx in txs]
+
+
+def replica(conn, state, storage_home):
+    """
+    Worker process holding its own copy of the state. Each message carries the writes of the previous wave, which are
+    applied first, and this worker's share of the next wave. The worker answers with the merged writes of its share.
+    Messages are encoded like the driver's values, so they keep their contracting types.
+    """
+    client = ContractingClient(driver=Driver(storage_home=Path(storage_home)))
+    restore(client, decode(state))
+    contracts = {}
+    conn.send(True)
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        writes, txs, environment = decode(message)
+        for key, value in writes.items():
+            client.raw_driver.set(key, value)
+        merged = {}
+        for tx in txs:
+            merged.update(execute(client, Tx(*tx), environment, contracts))
+        conn.send(encode(merged))
+
+    client.raw_driver.flush()
+    conn.close()
+
+
+def run_scheduled(state, waves, environment, workers=4):
+    """
+    Runs the waves on `workers` processes, each with its own replica of `state`. A wave is split over the workers,
+    and its writes are merged and sent to every replica before the next wave starts.
+    Returns (final state, seconds spent running the waves), the state being `state` with every write applied.
+    """
+    context = multiprocessing.get_context("spawn")
+    homes = [tempfile.mkdtemp(prefix="contracting-replica-") for _ in range(workers)]
+    conns = []
+    processes = []
+    encoded = encode(state)
+    for home in homes:
+        parent, child = context.Pipe()
+        process = context.Process(target=replica, args=(child, encoded, home), daemon=True)
+        process.start()
+        conns.append(parent)
+        processes.append(process)
+
+    try:
+        for conn in conns:
+            conn.recv()
+
+        final = dict(state)
+        writes = {}
+        start = time.perf_counter()
+        for wave in waves:
+            for i, conn in enumerate(conns):
+                conn.send(encode([writes, [list(tx) for tx in wave[i::workers]], environment]))
+            writes = {}
+            for conn in conns:
+                writes.update(decode(conn.recv()))
+            for key, value in writes.items():
+                if value is None:
+                    final.pop(key, None)
+                else:
+                    final[key] = value
+        elapsed = time.perf_counter() - start
+    finally:
+        for conn in conns:
+            conn.send(None)
+        for process in processes:
+            process.join()
+        for home in homes:
+            shutil.rmtree(home, ignore_errors=True)
+
+    return final, elapsed
+
+
+def random_block(size, validators, delegators, seed=0):
+    rng = random.Random(seed)
+    txs = []
+    for _ in range(size):
+        delegator = rng.choice(delegators)
+        roll = rng.random()
+        if roll < 0.6:
+            txs.append(Tx("gov", "delegate", delegator, {"validator": rng.choice(validators), "amount": 1}))
+        elif roll < 0.8:
+            txs.append(Tx("currency", "transfer", delegator, {"amount": 1, "to": rng.choice(delegators)}))
+        else:
+            txs.append(Tx("gov", "redelegate", delegator, {
+                "from_validator": rng.choice(validators),
+                "to_validator": rng.choice(validators),
+                "amount": 1,
+            }))
+    return txs
+
+
+BENCHMARK_RULES = {
+    "v_max": 2,
+    "v_lock": 100,
+    "v_min_commission": 5,
+    "fee_dist": [0.4, 0.3, 0.1, 0.2],
+    "unbonding_period": 7,
+    "epoch_length": 8,
+    "min_vote_turnout": 0.5,
+    "min_vote_ratio": 0.7,
+}
+
+
+def benchmark(client=None, size=2000, workers=4, n_validators=50, n_delegators=1000, seed=0):
+    """
+    Runs a random block on the contracts serially and as scheduled waves on worker replicas, from the same state.
+    The state is a canned network of validators and delegators, one epoch in so every validator has a power tree slot.
+    Returns the timings and whether both runs end in the same state.
+    """
+    client = client or ContractingClient()
+    validators, delegators = large_validator_set(client, n_validators, n_delegators, BENCHMARK_RULES)
+    epoch_start = Datetime(year=2021, month=1, day=1)
+    now = epoch_start + Timedelta(hours=BENCHMARK_RULES["epoch_length"])
+    gov = client.get_contract("gov")
+    gov.Epoch_T.set(epoch_start)
+    gov.advance_epoch(environment={"now": now})
+    client.raw_driver.commit()
+
+    state = snapshot(client.raw_driver)
+    txs = random_block(size, validators, delegators, seed)
+    environment = {"now": now}
+
+    start = time.perf_counter()
+    waves = schedule(txs, client.raw_driver)
+    schedule_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_serial(client, txs, environment)
+    serial_time = time.perf_counter() - start
+    client.raw_driver.commit()
+    serial_state = snapshot(client.raw_driver)
+
+    scheduled_state, scheduled_time = run_scheduled(state, waves, environment, workers)
+
+    return {
+        "txs": size,
+        "waves": len(waves),
+        "schedule_s": schedule_time,
+        "serial_s": serial_time,
+        "scheduled_s": scheduled_time,
+        "same_state": scheduled_state == serial_state,
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+# Diffs two states given as (key, value) iterators sorted by key, such as gov_snapshot.Snapshot.iter_items().
+# diff() is a single merge-join pass that only holds the current key of each side, whatever the size of the states.
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+Delta = namedtuple("Delta", ["kind", "key", "old", "new"])
+
+
+def diff(old_items, new_items):
+    """
+    Yields a Delta for every key whose value differs, in key order.
+    A key set to None is treated as missing, as the driver does.
+    """
+    old_items = ((k, v) for k, v in old_items if v is not None)
+    new_items = ((k, v) for k, v in new_items if v is not None)
+    end = (None, None)
+
+    old_key, old_value = next(old_items, end)
+    new_key, new_value = next(new_items, end)
+
+    while old_key is not None or new_key is not None:
+        if new_key is None or (old_key is not None and old_key < new_key):
+            yield Delta(REMOVED, old_key, old_value, None)
+            old_key, old_value = next(old_items, end)
+        elif old_key is None or new_key < old_key:
+            yield Delta(ADDED, new_key, None, new_value)
+            new_key, new_value = next(new_items, end)
+        else:
+            if old_value != new_value:
+                yield Delta(CHANGED, old_key, old_value, new_value)
+            old_key, old_value = next(old_items, end)
+            new_key, new_value = next(new_items, end)
+
+
+def classify(key, gov="gov", currency="currency"):
+    """
+    Returns (group, entity, field) for a key:
+    * ("validator", address, field) for Validators, StakingEpochs and PendingPower keys, the epoch is part of the field.
+    * ("delegation", (delegator, validator), field) for Delegators and Pending keys.
+    * ("account", address, field) for currency balances, allowances and custody.
+    * ("other", contract, rest of the key) for everything else.
+    """
+    contract, _, rest = key.partition(".")
+    name, _, path = rest.partition(":")
+    parts = path.split(":") if path else []
+
+    if contract == gov:
+        if name == "Validators" and len(parts) >= 2:
+            return "validator", parts[0], ":".join(parts[1:])
+        if name == "StakingEpochs" and len(parts) == 2:
+            return "validator", parts[1], f"StakingEpochs:{parts[0]}"
+        if name == "PendingPower" and len(parts) == 1:
+            return "validator", parts[0], "PendingPower"
+        if name in ("Delegators", "Pending") and len(parts) >= 3:
+            field = ":".join(parts[2:])
+            return "delegation", (parts[0], parts[1]), field if name == "Delegators" else f"Pending:{field}"
+
+    if contract == currency:
+        if name == "balances" and len(parts) == 1:
+            return "account", parts[0], "balance"
+        if name == "balances" and len(parts) == 2:
+            return "account", parts[0], f"allowance:{parts[1]}"
+        if name == "custody" and len(parts) == 2:
+            return "account", parts[1], f"custody:{parts[0]}"
+
+    return "other", contract, rest
+
+
+def group(deltas, gov="gov", currency="currency"):
+    """
+    Groups deltas as {group: {entity: {field: Delta}}}.
+    Unlike diff() this holds every delta, StakingEpochs keys sort by epoch before validator, so a validator's
+    deltas are not contiguous in key order.
+    """
+    grouped = {}
+    for delta in deltas:
+        kind, entity, field = classify(delta.key, gov, currency)
+        grouped.setdefault(kind, {}).setdefault(entity, {})[field] = delta
+    return grouped
+
+
+if __name__ == "__main__":
+    import sys
+
+    from gov_snapshot import Snapshot
+
+    old, new = Snapshot(sys.argv[1]), Snapshot(sys.argv[2])
+    prefix = sys.argv[3] if len(sys.argv) > 3 else ""
+    for delta in diff(old.iter_items(prefix), new.iter_items(prefix)):
+        kind, entity, field = classify(delta.key)
+        print(kind, entity, field, delta.kind, delta.old, "->", delta.new)
@@ -0,0 +1,151 @@
+# Folds the events emitted by gov and currency into in-memory views, so indexers follow state in O(changes)
+# instead of polling driver.items("gov.Validators:").
+#
+# Events are dicts as found in a transaction's output["events"]:
+#   {"contract": str, "event": str, "data_indexed": dict, "data": dict, ...}
+# Constructors write state without events, pass that state in (e.g. from a snapshot) to start from it.
+
+
+class EventView:
+    def __init__(self, validators=None, delegations=None, balances=None, gov="gov", currency="currency"):
+        self.validators = validators or {}  # address -> {"active", "power", "locked", "commission", "unbonding"}
+        self.delegations = delegations or {}  # (delegator, validator) -> {"amount", "unbonding", "compound"}
+        self.balances = balances or {}  # address -> balance
+        self.custody = {}  # (contract, owner) -> bonded amount
+        self.streams = {}  # stream id -> {"sender", "receiver", "rate", "begins", "closes", "claimed", "status"}
+        self.epoch = 0
+        self.issued = 0
+
+        self.handlers = {
+            (gov, "ValidatorJoin"): self.on_validator_join,
+            (gov, "ValidatorAnnounceLeave"): self.on_validator_announce_leave,
+            (gov, "ValidatorCancelLeave"): self.on_validator_cancel_leave,
+            (gov, "ValidatorLeave"): self.on_validator_leave,
+            (gov, "Power"): self.on_power,
+            (gov, "Delegate"): self.on_delegate,
+            (gov, "Redelegate"): self.on_redelegate,
+            (gov, "DelegatorAnnounceLeave"): self.on_delegator_announce_leave,
+            (gov, "DelegatorCancelLeave"): self.on_delegator_cancel_leave,
+            (gov, "DelegatorLeave"): self.on_delegator_leave,
+            (gov, "Epoch"): self.on_epoch,
+            (currency, "Transfer"): self.on_transfer,
+            (currency, "Issue"): self.on_issue,
+            (currency, "Bond"): self.on_bond,
+            (currency, "Unbond"): self.on_unbond,
+            (currency, "StreamCreate"): self.on_stream_create,
+            (currency, "StreamBalance"): self.on_stream_balance,
+            (currency, "StreamCloseChange"): self.on_stream_close_change,
+            (currency, "StreamFinalize"): self.on_stream_finalize,
+            (currency, "StreamForfeit"): self.on_stream_forfeit,
+        }
+
+    def apply(self, event):
+        # Events without a handler, e.g. Approve or ClaimRewards, don't change the views.
+        handler = self.handlers.get((event["contract"], event["event"]))
+        if handler is not None:
+            handler({**event.get("data_indexed", {}), **event.get("data", {})})
+
+    def fold(self, events):
+        for event in events:
+            self.apply(event)
+        return self
+
+    def validator(self, address):
+        return self.validators.setdefault(
+            address, {"active": False, "power": 0, "locked": 0, "commission": 0, "unbonding": None}
+        )
+
+    def delegation(self, delegator, validator):
+        return self.delegations.setdefault((delegator, validator), {"amount": 0, "unbonding": None, "compound": False})
+
+    def credit(self, account, amount):
+        self.balances[account] = self.balances.get(account, 0) + amount
+
+    # gov
+
+    def on_validator_join(self, e):
+        v = self.validator(e["validator"])
+        v.update(active=True, locked=e["locked"], commission=e["commission"], unbonding=None)
+
+    def on_validator_announce_leave(self, e):
+        self.validator(e["validator"])["unbonding"] = e["unbonding"]
+
+    def on_validator_cancel_leave(self, e):
+        self.validator(e["validator"])["unbonding"] = None
+
+    def on_validator_leave(self, e):
+        self.validator(e["validator"]).update(active=False, locked=0, unbonding=None)
+
+    def on_power(self, e):
+        self.validator(e["validator"])["power"] = e["power"]
+
+    def on_delegate(self, e):
+        d = self.delegation(e["delegator"], e["validator"])
+        d["amount"] += e["amount"]
+        d["compound"] = e["compound"]
+
+    def on_redelegate(self, e):
+        self.delegation(e["delegator"], e["from_validator"])["amount"] -= e["amount"]
+        self.delegation(e["delegator"], e["to_validator"])["amount"] += e["amount"]
+
+    def on_delegator_announce_leave(self, e):
+        # The amount includes what compounding shares were worth when redeemed.
+        self.delegation(e["delegator"], e["validator"]).update(amount=e["amount"], unbonding=e["unbonding"], compound=False)
+
+    def on_delegator_cancel_leave(self, e):
+        self.delegation(e["delegator"], e["validator"]).update(amount=e["amount"], unbonding=None)
+
+    def on_delegator_leave(self, e):
+        self.delegations.pop((e["delegator"], e["validator"]), None)
+
+    def on_epoch(self, e):
+        self.epoch = e["epoch"]
+        self.issued += e["issued"]
+
+    # currency
+
+    def on_transfer(self, e):
+        self.credit(e["from"], -e["amount"])
+        self.credit(e["to"], e["amount"])
+
+    def on_issue(self, e):
+        self.credit(e["to"], e["amount"])
+
+    def on_bond(self, e):
+        self.credit(e["owner"], -e["amount"])
+        key = (e["contract"], e["owner"])
+        self.custody[key] = self.custody.get(key, 0) + e["amount"]
+
+    def on_unbond(self, e):
+        self.credit(e["owner"], e["amount"])
+        key = (e["contract"], e["owner"])
+        self.custody[key] = self.custody.get(key, 0) - e["amount"]
+
+    def on_stream_create(self, e):
+        self.streams[e["stream_id"]] = {
+            "sender": e["sender"],
+            "receiver": e["receiver"],
+            "rate": e["rate"],
+            "begins": e["begins"],
+            "closes": e["closes"],
+            "claimed": 0,
+            "status": "active",
+        }
+
+    def on_stream_balance(self, e):
+        self.credit(e["sender"], -e["amount"])
+        self.credit(e["receiver"], e["amount"])
+        if e["stream_id"] in self.streams:
+            self.streams[e["stream_id"]]["claimed"] += e["amount"]
+
+    def on_stream_close_change(self, e):
+        if e["stream_id"] in self.streams:
+            self.streams[e["stream_id"]]["closes"] = e["closes"]
+
+    def on_stream_finalize(self, e):
+        if e["stream_id"] in self.streams:
+            self.streams[e["stream_id"]]["status"] = "finalized"
+
+    def on_stream_forfeit(self, e):
+        if e["stream_id"] in self.streams:
+            self.streams[e["stream_id"]]["status"] = "forfeit"
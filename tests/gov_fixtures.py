@@ -0,0 +1,159 @@
+import copy
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+from contracting.storage.driver import Driver
+
+# Test fixtures that build contract state once per process and restore it from a snapshot afterwards.
+# A snapshot is a plain dict of every driver key and value, restoring it writes the keys back into a flushed driver,
+# which is much faster than submitting the contracts and running the setup transactions again.
+
+SNAPSHOTS = {}
+
+
+def worker_client():
+    """
+    A client whose storage is private to this test worker, so flushing it doesn't wipe the state of tests
+    running in other processes, e.g. under `pytest -n auto`.
+    Outside of a pytest-xdist worker the default storage is used.
+    """
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if not worker:
+        return ContractingClient()
+    return ContractingClient(driver=Driver(storage_home=Path(tempfile.gettempdir()) / f"contracting-{worker}"))
+
+
+def snapshot(driver, prefix=""):
+    return copy.deepcopy(dict(driver.items(prefix)))
+
+
+def restore(client, state):
+    client.flush()
+    driver = client.raw_driver
+    for key, value in copy.deepcopy(state).items():
+        driver.set(key, value)
+    driver.commit()
+
+
+def fixture(client, key, build):
+    """
+    Restores the state cached under `key`, building it with build(client) on a flushed client the first time.
+    `key` has to identify everything `build` does, e.g. the rules and node lists it uses.
+    """
+    if key not in SNAPSHOTS:
+        client.flush()
+        build(client)
+        SNAPSHOTS[key] = snapshot(client.raw_driver)
+    restore(client, SNAPSHOTS[key])
+
+
+def submit_currency(client, name="currency", gov_contract_name="gov"):
+    with open("currency.py") as f:
+        client.submit(f.read(), name, constructor_args={"vk": "sys", "gov_contract": gov_contract_name})
+
+
+def submit_gov(client, name, rules, genesis_nodes, issuance_rules=None):
+    constructor_args = {"genesis_nodes": genesis_nodes, "rules": rules}
+    if issuance_rules is not None:
+        constructor_args["issuance_rules"] = issuance_rules
+    with open("gov.py") as f:
+        client.submit(f.read(), name=name, constructor_args=constructor_args)
+
+
+def fund(client, accounts, spender, amount=10000, currency_name="currency"):
+    # Sends `amount` from sys to every account and approves `spender` for it.
+    currency = client.get_contract(currency_name)
+    for account in accounts:
+        currency.transfer(amount=amount, to=account, signer="sys")
+        currency.approve(amount=amount, to=spender, signer=account)
+
+
+def base_state(client, nodes, rules, genesis_nodes, gov_contract_name="gov"):
+    # Currency and gov submitted, every node funded and approved, as in GovTestCase.setUp.
+    def build(client):
+        submit_currency(client, gov_contract_name=gov_contract_name)
+        submit_gov(client, gov_contract_name, rules, genesis_nodes)
+        fund(client, nodes, gov_contract_name)
+
+    key = ("base", gov_contract_name, tuple(nodes), tuple(genesis_nodes), repr(sorted(rules.items())))
+    fixture(client, key, build)
+
+
+def large_validator_set(client, n_validators, n_delegators, rules, n_genesis=2, delegation=100, gov_contract_name="gov"):
+    """
+    A canned network of `n_validators` validators named node1.., the first `n_genesis` of them genesis nodes,
+    and `n_delegators` delegators named delegator1.. each delegating `delegation` to one validator in turn.
+    Returns (validators, delegators).
+    """
+    validators = [f"node{i}" for i in range(1, n_validators + 1)]
+    delegators = [f"delegator{i}" for i in range(1, n_delegators + 1)]
+
+    def build(client):
+        submit_currency(client, gov_contract_name=gov_contract_name)
+        submit_gov(client, gov_contract_name, rules, validators[:n_genesis])
+        fund(client, validators + delegators, gov_contract_name, amount=max(rules["v_lock"], delegation) * 10)
+
+        gov = client.get_contract(gov_contract_name)
+        for validator in validators[n_genesis:]:
+            gov.join(commission=rules["v_min_commission"], signer=validator)
+        for i, delegator in enumerate(delegators):
+            gov.delegate(validator=validators[i % n_validators], amount=delegation, signer=delegator)
+
+    key = ("large", gov_contract_name, n_validators, n_delegators, n_genesis, delegation, repr(sorted(rules.items())))
+    fixture(client, key, build)
+    return validators, delegators
+
+
+class GovTestCase(unittest.TestCase):
+    """
+    Base of the gov test cases: currency and gov submitted with GENESIS_NODES as validators and every one of NODES
+    funded, restored from the base_state snapshot before each test.
+    """
+
+    NODES = [
+        "node1",
+        "node2",
+        "node3",
+        "node4",
+        "node5",
+        "node6",
+        "node7",
+        "node8",
+        "node9",
+        "node10",
+    ]
+
+    RULES = {
+        "v_max": 2,
+        "v_lock": 100,
+        "v_min_commission": 5,
+        "fee_dist": [0.4, 0.3, 0.1, 0.2],
+        "unbonding_period": 7,
+        "epoch_length": 8,
+        "min_vote_turnout": 0.5,
+        "min_vote_ratio": 0.7,
+    }
+
+    GENESIS_NODES = ["node1", "node2"]
+
+    def setUp(self):
+        # Called before every test, restores the environment bootstrapped by the first test.
+        self.client = worker_client()
+        base_state(self.client, self.NODES, self.RULES, self.GENESIS_NODES)
+
+        self.currency = self.client.get_contract("currency")
+        self.gov = self.client.get_contract("gov")
+
+    def tearDown(self):
+        # Called after every test, ensures each test starts with a clean slate and is isolated from others
+        self.client.flush()
+
+    def next_epoch(self):
+        # Starts the next epoch, e.g. so the power tree picks up the power changes of this one.
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        self.gov.Epoch_T.set(EPOCH_START)
+        return self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=self.RULES["epoch_length"])})
@@ -0,0 +1,228 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Staking and currency health gauges in Prometheus text format.
+# The state is scanned once at startup, after that the aggregates are kept up to date from the events of
+# gov and currency (see gov_events), so a scrape costs O(top-N) rather than a scan of Validators.
+
+ACTIVE = "active"
+UNBONDING = "unbonding"
+INACTIVE = "inactive"
+
+
+class MetricsExporter:
+    def __init__(self, driver, gov="gov", currency="currency", top_n=(1, 5, 10)):
+        self.driver = driver
+        self.gov = gov
+        self.currency = currency
+        self.top_n = top_n
+        self.lock = threading.Lock()
+
+        self.handlers = {
+            (gov, "ValidatorJoin"): self.on_validator_join,
+            (gov, "ValidatorAnnounceLeave"): self.on_validator_announce_leave,
+            (gov, "ValidatorCancelLeave"): self.on_validator_cancel_leave,
+            (gov, "ValidatorLeave"): self.on_validator_leave,
+            (gov, "Power"): self.on_power,
+            (gov, "DelegatorAnnounceLeave"): self.on_delegator_announce_leave,
+            (gov, "DelegatorCancelLeave"): self.on_delegator_unbonded,
+            (gov, "DelegatorLeave"): self.on_delegator_unbonded,
+            (currency, "StreamCreate"): self.on_stream_create,
+            (currency, "StreamBalance"): self.on_stream_balance,
+            (currency, "StreamFinalize"): self.on_stream_closed,
+            (currency, "StreamForfeit"): self.on_stream_closed,
+        }
+        self.rescan()
+
+    def rescan(self):
+        # The only full scan, run at startup or to recover from missed events.
+        with self.lock:
+            self.validators = {}  # address -> [status, power, locked]
+            self.status_counts = {ACTIVE: 0, UNBONDING: 0, INACTIVE: 0}
+            self.powers = []  # every validator's power, sorted
+            self.total_power = 0.0
+            self.active_power = 0.0
+            self.unbonding = {}  # (delegator, validator) -> amount
+            self.unbonding_volume = 0.0
+            self.stream_rates = {}  # active stream id -> rate
+            self.stream_rate = 0.0
+            self.stream_claimed = 0.0
+
+            fields = {}
+            prefix = f"{self.gov}.Validators:"
+            for key, value in self.driver.items(prefix).items():
+                parts = key[len(prefix):].split(":")
+                if len(parts) == 2:
+                    fields.setdefault(parts[0], {})[parts[1]] = value
+            for address, f in fields.items():
+                status = INACTIVE if not f.get("active") else UNBONDING if f.get("unbonding") else ACTIVE
+                self.add_validator(address, status, float(f.get("power") or 0), float(f.get("locked") or 0))
+                if status == UNBONDING:
+                    self.unbonding_volume += self.validators[address][2]
+
+            prefix = f"{self.gov}.Delegators:"
+            delegations = self.driver.items(prefix)
+            for key, value in delegations.items():
+                parts = key[len(prefix):].split(":")
+                if len(parts) == 3 and parts[2] == "unbonding" and value:
+                    amount = float(delegations.get(f"{prefix}{parts[0]}:{parts[1]}:amount") or 0)
+                    self.unbonding[parts[0], parts[1]] = amount
+                    self.unbonding_volume += amount
+
+            prefix = f"{self.currency}.streams:"
+            streams = self.driver.items(prefix)
+            for key, value in streams.items():
+                parts = key[len(prefix):].split(":")
+                if len(parts) != 2:
+                    continue
+                if parts[1] == "status" and value == "active":
+                    rate = float(streams.get(f"{prefix}{parts[0]}:rate") or 0)
+                    self.stream_rates[parts[0]] = rate
+                    self.stream_rate += rate
+                elif parts[1] == "claimed":
+                    self.stream_claimed += float(value or 0)
+
+    # Aggregates
+
+    def add_validator(self, address, status, power, locked):
+        self.validators[address] = [status, power, locked]
+        self.status_counts[status] += 1
+        bisect.insort(self.powers, power)
+        self.total_power += power
+        if status != INACTIVE:
+            self.active_power += power
+
+    def validator(self, address):
+        if address not in self.validators:
+            self.add_validator(address, INACTIVE, 0.0, 0.0)
+        return self.validators[address]
+
+    def set_status(self, address, status):
+        v = self.validator(address)
+        if v[0] == status:
+            return
+        if v[0] == INACTIVE:
+            self.active_power += v[1]
+        elif status == INACTIVE:
+            self.active_power -= v[1]
+        self.status_counts[v[0]] -= 1
+        self.status_counts[status] += 1
+        v[0] = status
+
+    def set_power(self, address, power):
+        v = self.validator(address)
+        del self.powers[bisect.bisect_left(self.powers, v[1])]
+        bisect.insort(self.powers, power)
+        self.total_power += power - v[1]
+        if v[0] != INACTIVE:
+            self.active_power += power - v[1]
+        v[1] = power
+
+    # Events
+
+    def apply(self, event):
+        handler = self.handlers.get((event["contract"], event["event"]))
+        if handler is not None:
+            with self.lock:
+                handler({**event.get("data_indexed", {}), **event.get("data", {})})
+
+    def fold(self, events):
+        for event in events:
+            self.apply(event)
+        return self
+
+    def on_validator_join(self, e):
+        self.set_status(e["validator"], ACTIVE)
+        self.validators[e["validator"]][2] = float(e["locked"])
+
+    def on_validator_announce_leave(self, e):
+        self.set_status(e["validator"], UNBONDING)
+        self.unbonding_volume += self.validators[e["validator"]][2]
+
+    def on_validator_cancel_leave(self, e):
+        self.set_status(e["validator"], ACTIVE)
+        self.unbonding_volume -= self.validators[e["validator"]][2]
+
+    def on_validator_leave(self, e):
+        v = self.validator(e["validator"])
+        if v[0] == UNBONDING:
+            self.unbonding_volume -= v[2]
+        self.set_status(e["validator"], INACTIVE)
+        v[2] = 0.0
+
+    def on_power(self, e):
+        self.set_power(e["validator"], float(e["power"]))
+
+    def on_delegator_announce_leave(self, e):
+        amount = float(e["amount"])
+        self.unbonding[e["delegator"], e["validator"]] = amount
+        self.unbonding_volume += amount
+
+    def on_delegator_unbonded(self, e):
+        self.unbonding_volume -= self.unbonding.pop((e["delegator"], e["validator"]), 0.0)
+
+    def on_stream_create(self, e):
+        self.stream_rates[e["stream_id"]] = float(e["rate"])
+        self.stream_rate += float(e["rate"])
+
+    def on_stream_balance(self, e):
+        self.stream_claimed += float(e["amount"])
+
+    def on_stream_closed(self, e):
+        self.stream_rate -= self.stream_rates.pop(e["stream_id"], 0.0)
+
+    # Output
+
+    def gauges(self):
+        with self.lock:
+            gauges = [
+                ("gov_total_power", "Power of all validators.", {}, self.total_power),
+                ("gov_active_power", "Power of validators that have not left.", {}, self.active_power),
+                ("gov_unbonding_volume", "Tokens locked by announced validator and delegator leaves.", {}, self.unbonding_volume),
+                ("currency_stream_rate", "Tokens per second paid by active streams.", {}, self.stream_rate),
+                ("currency_stream_claimed", "Tokens claimed from streams.", {}, self.stream_claimed),
+            ]
+            for status, count in self.status_counts.items():
+                gauges.append(("gov_validators", "Validators by status.", {"status": status}, count))
+            for n in self.top_n:
+                share = sum(self.powers[-n:]) / self.total_power if self.total_power > 0 else 0
+                gauges.append(("gov_top_power_share", "Share of power held by the n largest validators.", {"n": n}, share))
+            return gauges
+
+    def render(self):
+        lines = []
+        described = set()
+        for name, help_text, labels, value in self.gauges():
+            if name not in described:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                described.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {float(value)}" if label_text else f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """
+        Serves the gauges at http://host:port/metrics from a background thread, returns the server.
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,213 @@
+import asyncio
+import itertools
+import threading
+import time
+
+from contracting.storage.encoder import decode, encode
+
+# Bulk state reads for off-chain tooling over a network connection instead of an in-process driver.
+#
+# The wire format is one encoded JSON object per line, so values keep their contracting types:
+#   request  {"id": int, "op": "get" | "items", "arg": key or prefix}
+#   response {"id": int, "value": ...}
+# A connection carries many requests at once (pipelining), responses are matched back by id and may arrive out of order.
+# StateServer is a local stand-in for a node's query endpoint, backed by any driver with get(key) and items(prefix).
+
+
+class StateServer:
+    def __init__(self, driver):
+        self.driver = driver
+        self.requests = 0
+        self.server = None
+        self.loop = None
+
+    async def handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = decode(line.decode())
+            self.requests += 1
+            if request["op"] == "get":
+                value = self.driver.get(request["arg"])
+            else:
+                value = dict(self.driver.items(request["arg"]))
+            writer.write(encode({"id": request["id"], "value": value}).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=2**26)
+        return self.server.sockets[0].getsockname()[:2]
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        # Runs the server on its own event loop in a daemon thread, returns (host, port).
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self.loop).result()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}  # request id -> future
+        self.ids = itertools.count()
+        self.task = asyncio.ensure_future(self.receive())
+
+    async def receive(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = decode(line.decode())
+                future = self.pending.pop(response["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(response["value"])
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("State server closed the connection"))
+            self.pending.clear()
+
+    async def send(self, op, arg):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(encode({"id": request_id, "op": op, "arg": arg}).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+class AsyncStateReader:
+    """
+    Asyncio client that spreads reads over `pool_size` pipelined connections, with at most `max_in_flight` requests
+    outstanding in total. Identical reads in flight are coalesced into one request, and results are cached for
+    `cache_ttl` seconds. A prefix read also caches every key it returned, so following get() calls are served locally.
+    """
+
+    def __init__(self, host, port, pool_size=4, max_in_flight=256, cache_ttl=1.0):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.cache_ttl = cache_ttl
+        self.max_in_flight = max_in_flight
+        self.connections = []
+        self.in_flight = {}  # (op, arg) -> future
+        self.cache = {}  # (op, arg) -> (expires, value)
+        self.slots = None
+
+    async def connect(self):
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        for _ in range(self.pool_size):
+            reader, writer = await asyncio.open_connection(self.host, self.port, limit=2**26)
+            self.connections.append(Connection(reader, writer))
+        return self
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
+        self.connections = []
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def cached(self, request):
+        entry = self.cache.get(request)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self.cache[request]
+            return False, None
+        return True, entry[1]
+
+    async def request(self, op, arg):
+        request = (op, arg)
+        hit, value = self.cached(request)
+        if hit:
+            return value
+        if request in self.in_flight:
+            return await asyncio.shield(self.in_flight[request])
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[request] = future
+        try:
+            async with self.slots:
+                connection = min(self.connections, key=lambda c: len(c.pending))
+                value = await connection.send(op, arg)
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so an error without other waiters isn't reported as never retrieved.
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[request]
+
+        expires = time.monotonic() + self.cache_ttl
+        self.cache[request] = (expires, value)
+        if op == "items":
+            for key, item in value.items():
+                self.cache["get", key] = (expires, item)
+        future.set_result(value)
+        return value
+
+    async def get(self, key):
+        return await self.request("get", key)
+
+    async def items(self, prefix):
+        return await self.request("items", prefix)
+
+    async def get_many(self, keys):
+        # {key: value} for every key, all requests pipelined at once.
+        values = await asyncio.gather(*[self.get(key) for key in keys])
+        return dict(zip(keys, values))
+
+    async def items_many(self, prefixes):
+        results = await asyncio.gather(*[self.items(prefix) for prefix in prefixes])
+        return dict(zip(prefixes, results))
+
+
+class ReaderDriver:
+    """
+    Blocking get(key) and items(prefix) over an AsyncStateReader running on a background event loop, so the
+    gov_utils helpers, e.g. get_validators(ReaderDriver(host, port)), work against a remote state unchanged.
+    Call prefetch() with the prefixes a tool is about to read to fetch them in one pipelined batch.
+    """
+
+    def __init__(self, host, port, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.reader = self.run(AsyncStateReader(host, port, **kwargs).connect())
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, key):
+        return self.run(self.reader.get(key))
+
+    def items(self, prefix):
+        return self.run(self.reader.items(prefix))
+
+    def get_many(self, keys):
+        return self.run(self.reader.get_many(keys))
+
+    def prefetch(self, *prefixes):
+        self.run(self.reader.items_many(list(prefixes)))
+
+    def close(self):
+        self.run(self.reader.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
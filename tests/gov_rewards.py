@@ -0,0 +1,195 @@
+import random
+
+from gov_utils import calculate_epoch_issuance
+
+try:
+    import numpy as np
+except ImportError:  # Delegations are then computed with plain lists.
+    np = None
+
+# Off-chain reward calculator over StakingEpochs, for previews and audits of delegation rewards.
+#
+# At the boundary into epoch b, gov issues I_b and spreads it over the power held at the end of epoch b - 1, which is
+# StakingEpochs[b, v] for validators without compounding delegations. gov only writes StakingEpochs[b, v] for validators
+# whose power changed in epoch b - 1, the others carry over from the latest earlier epoch. A validator keeps its commission and the share of
+# its own lock, a delegation gets (1 - commission) * I_b * amount / total power, with the amount taken from its record.
+# Epochs are read one at a time, so memory grows with the number of delegations, not with the number of epochs.
+# Compounding delegations and changes that are undone within one epoch are not modelled.
+
+
+def load_delegations(driver, gov="gov"):
+    """
+    Returns (keys, checkpoints): keys is a list of (delegator, validator) and checkpoints[i] the sorted
+    [(epoch, amount)] pairs of the i-th delegation's record.
+    """
+    keys = []
+    checkpoints = []
+    for key, record in driver.items(f"{gov}.Delegators:").items():
+        parts = key.split(":")
+        if parts[-1] != "record" or not record:
+            continue
+        keys.append((parts[1], parts[2]))
+        checkpoints.append(sorted((int(epoch), float(amount)) for epoch, amount in record.items()))
+    return keys, checkpoints
+
+
+def load_commissions(driver, gov="gov"):
+    prefix = f"{gov}.Validators:"
+    return {
+        key[len(prefix):].split(":")[0]: float(value or 0)
+        for key, value in driver.items(prefix).items()
+        if key.endswith(":commission")
+    }
+
+
+def epoch_powers(driver, epoch, gov="gov", previous=None):
+    """
+    {validator: power at the start of `epoch`}. `previous` is the result for epoch - 1, without it every
+    earlier epoch is scanned for the validators that have no StakingEpochs entry for `epoch`.
+    """
+    if previous is None:
+        prefix = f"{gov}.StakingEpochs:"
+        latest = {}
+        powers = {}
+        for key, value in driver.items(prefix).items():
+            snapshot_epoch, validator = key[len(prefix):].split(":", 1)
+            snapshot_epoch = int(snapshot_epoch)
+            if latest.get(validator, -1) < snapshot_epoch <= epoch:
+                latest[validator] = snapshot_epoch
+                powers[validator] = float(value or 0)
+        return powers
+
+    powers = dict(previous)
+    prefix = f"{gov}.StakingEpochs:{epoch}:"
+    for key, value in driver.items(prefix).items():
+        powers[key[len(prefix):]] = float(value or 0)
+    return powers
+
+
+def epoch_rewards(driver, epochs, issued, gov="gov"):
+    """
+    Yields (epoch, validator_rewards, delegation_rewards) for every epoch boundary in `epochs`.
+    issued[epoch] is the amount minted at that boundary, e.g. from Epoch events or issuance_schedule.
+    validator_rewards maps validator to what it keeps, delegation_rewards is aligned with load_delegations keys.
+    """
+    keys, checkpoints = load_delegations(driver, gov)
+    commissions = load_commissions(driver, gov)
+    locks = {}
+    for key, value in driver.items(f"{gov}.Validators:").items():
+        if key.endswith(":locked"):
+            locks[key[len(f"{gov}.Validators:"):].split(":")[0]] = float(value or 0)
+
+    validators = sorted({v for _, v in keys} | set(commissions))
+    position = {v: i for i, v in enumerate(validators)}
+    validator_of = [position[v] for _, v in keys]
+    cursors = [0] * len(keys)
+    amounts = [0.0] * len(keys)
+
+    powers = None
+    last = None
+    for epoch in epochs:
+        powers = epoch_powers(driver, epoch, gov, powers if last == epoch - 1 else None)
+        last = epoch
+        total = sum(powers.values())
+
+        # Amounts move forward to the last checkpoint at or before this epoch.
+        for i, points in enumerate(checkpoints):
+            c = cursors[i]
+            while c < len(points) and points[c][0] <= epoch:
+                amounts[i] = points[c][1]
+                c += 1
+            cursors[i] = c
+
+        per_unit = [0.0] * len(validators)
+        validator_rewards = {}
+        if total > 0 and issued.get(epoch, 0) > 0:
+            for v, power in powers.items():
+                if power <= 0:
+                    continue
+                reward = issued[epoch] * power / total
+                commission = reward * commissions.get(v, 0) / 100
+                validator_rewards[v] = commission + (reward - commission) * locks.get(v, 0) / power
+                if v in position:
+                    per_unit[position[v]] = (reward - commission) / power
+
+        if np is not None:
+            rewards = np.asarray(amounts) * np.asarray(per_unit)[np.asarray(validator_of, dtype=int)] if keys else np.zeros(0)
+        else:
+            rewards = [amount * per_unit[v] for amount, v in zip(amounts, validator_of)]
+
+        yield epoch, validator_rewards, rewards
+
+
+def issuance_schedule(epochs, supply, epoch_length, issuance_rules, driver, gov="gov"):
+    """
+    Recomputes what gov minted at each boundary from the StakingEpochs totals, starting from `supply` before the first one.
+    `epoch_length` is the hours each epoch lasted, or {epoch: hours} for boundaries that were advanced late.
+    """
+    base_units = bool(driver.get("currency.base_units"))
+    issued = {}
+    powers = None
+    last = None
+    for epoch in epochs:
+        powers = epoch_powers(driver, epoch, gov, powers if last == epoch - 1 else None)
+        last = epoch
+        hours = epoch_length[epoch] if isinstance(epoch_length, dict) else epoch_length
+        amount = calculate_epoch_issuance(sum(powers.values()), supply, hours, issuance_rules, base_units)
+        issued[epoch] = amount
+        supply += amount
+    return issued
+
+
+def total_rewards(driver, epochs, issued, gov="gov"):
+    # {(delegator, validator): rewards over all of `epochs`}
+    keys, _ = load_delegations(driver, gov)
+    totals = [0.0] * len(keys)
+    for _, _, rewards in epoch_rewards(driver, epochs, issued, gov):
+        totals = [t + float(r) for t, r in zip(totals, rewards)]
+    return dict(zip(keys, totals))
+
+
+def onchain_claimable(driver, delegator, validator, gov="gov"):
+    # What claim_rewards would pay right now, mirrors gov.accrue_rewards and gov.accrue_delegation without writing.
+    def v(field):
+        return float(driver.get(f"{gov}.Validators:{validator}:{field}") or 0)
+
+    def d(field):
+        return driver.get(f"{gov}.Delegators:{delegator}:{validator}:{field}")
+
+    power = v("power")
+    delegator_index = v("delegator_index")
+    reward = power * (float(driver.get(f"{gov}.RewardIndex") or 0) - v("reward_index"))
+
+    if reward > 0:
+        commission = reward * v("commission") / 100
+        validator_reward = commission + (reward - commission) * v("locked") / power
+        delegated = power - v("locked")
+        compound_stake = v("compound_stake")
+        if delegated > compound_stake:
+            delegator_reward = reward - validator_reward
+            compounded = delegator_reward * compound_stake / delegated
+            delegator_index += (delegator_reward - compounded) / (delegated - compound_stake)
+
+    rewards = float(d("rewards") or 0)
+    if not d("unbonding"):
+        rewards += float(d("amount") or 0) * (delegator_index - float(d("reward_index") or 0))
+    return rewards
+
+
+def cross_check(driver, totals, sample_size=100, claimed=None, tolerance=1e-6, seed=0, gov="gov"):
+    """
+    Compares computed totals with on-chain claimable rewards for a random sample of delegations.
+    claimed maps (delegator, validator) to rewards already paid out, e.g. summed from ClaimRewards events.
+    Returns [(key, computed, on-chain)] for the delegations that differ by more than `tolerance` relative.
+    """
+    claimed = claimed or {}
+    keys = sorted(totals)
+    sample = random.Random(seed).sample(keys, min(sample_size, len(keys)))
+
+    mismatches = []
+    for key in sample:
+        onchain = onchain_claimable(driver, key[0], key[1], gov) + claimed.get(key, 0)
+        computed = totals[key]
+        if abs(computed - onchain) > tolerance * max(1.0, abs(onchain)):
+            mismatches.append((key, computed, onchain))
+    return mismatches
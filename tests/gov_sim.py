@@ -0,0 +1,748 @@
+import bisect
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from gov_utils import calculate_reward_percentage
+
+# Pure Python reference model of gov.py and currency.py, for economic simulation and differential testing.
+# Time is whole seconds since START. Every operation checks all of its assertions before it changes any state,
+# so a failed operation leaves the model untouched, as a reverted transaction leaves the contracts.
+
+START = datetime(2021, 1, 1)
+DAY = 86400
+HOURS_PER_YEAR = 8760
+GOV = "gov"
+
+
+class SimAssertion(Exception):
+    pass
+
+
+def check(condition, message):
+    if not condition:
+        raise SimAssertion(message)
+
+
+class Validator:
+    __slots__ = (
+        "active", "locked", "unbonding", "power", "commission", "is_genesis_node",
+        "rewards", "reward_index", "delegator_index", "shares", "compound_stake",
+    )
+
+    def __init__(self):
+        self.active = False
+        self.locked = 0
+        self.unbonding = None
+        self.power = 0
+        self.commission = 0
+        self.is_genesis_node = False
+        self.rewards = 0
+        self.reward_index = 0
+        self.delegator_index = 0
+        self.shares = 0
+        self.compound_stake = 0
+
+
+class Delegation:
+    __slots__ = ("amount", "unbonding", "rewards", "reward_index", "shares", "principal", "compounded")
+
+    def __init__(self):
+        self.amount = 0
+        self.unbonding = None
+        self.rewards = 0
+        self.reward_index = 0
+        self.shares = 0
+        self.principal = 0
+        self.compounded = 0
+
+
+class Stream:
+    __slots__ = ("sender", "receiver", "rate", "begins", "closes", "accrued_until", "due", "claimed", "status")
+
+    def __init__(self, sender, receiver, rate, begins, closes):
+        self.sender = sender
+        self.receiver = receiver
+        self.rate = rate
+        self.begins = begins
+        self.closes = closes
+        self.accrued_until = begins
+        self.due = 0
+        self.claimed = 0
+        self.status = "active"
+
+
+class Outflow:
+    __slots__ = ("rate", "owed", "checkpoint", "schedule")
+
+    def __init__(self):
+        self.rate = 0
+        self.owed = 0
+        self.checkpoint = None
+        self.schedule = []  # [time, rate change] of streams beginning and closing, in time order
+
+
+class GovSim:
+    __slots__ = (
+        "rules", "issuance_rules", "now", "epoch", "epoch_t", "reward_index", "total_power", "supply",
+        "balances", "custody", "validators", "delegations", "streams", "outflows", "snapshots",
+    )
+
+    def __init__(self, genesis_nodes, rules, issuance_rules=None, supply=111111111, keep_snapshots=False):
+        self.rules = dict(rules)
+        self.issuance_rules = dict(issuance_rules or {
+            "staked_target": 0, "reward_steepness": 0, "reward_min": 0, "reward_max": 0, "reward_target": 0,
+        })
+        self.now = 0
+        self.epoch = 0
+        self.epoch_t = 0
+        self.reward_index = 0
+        self.total_power = 0
+        self.supply = supply
+        self.balances = {}
+        self.custody = {}
+        self.validators = {}
+        self.delegations = {}
+        self.streams = {}
+        self.outflows = {}
+        self.snapshots = {} if keep_snapshots else None
+
+        for node in genesis_nodes:
+            v = Validator()
+            v.active = True
+            v.locked = self.rules["v_lock"]
+            v.commission = self.rules["v_min_commission"]
+            v.is_genesis_node = True
+            self.validators[node] = v
+            self.add_power(node, self.rules["v_lock"])
+
+    # Currency
+
+    def balance(self, account):
+        return self.balances.get(account, 0)
+
+    def credit(self, account, amount):
+        self.balances[account] = self.balances.get(account, 0) + amount
+
+    def bond(self, owner, amount):
+        self.credit(owner, -amount)
+        self.custody[owner] = self.custody.get(owner, 0) + amount
+
+    def unbond(self, owner, amount):
+        self.custody[owner] = self.custody.get(owner, 0) - amount
+        self.credit(owner, amount)
+
+    def transfer(self, caller, amount, to):
+        check(amount > 0, "Cannot send negative balances.")
+        check(self.balance(caller) >= amount, "Not enough coins to send.")
+        self.credit(caller, -amount)
+        self.credit(to, amount)
+
+    # Gov power and rewards
+
+    def add_power(self, validator, amount):
+        v = self.validators[validator]
+        amount += self.accrue_rewards(v)
+        v.power += amount
+        self.total_power += amount
+
+    def accrue_rewards(self, v):
+        reward = v.power * (self.reward_index - v.reward_index)
+        v.reward_index = self.reward_index
+        if reward <= 0:
+            return 0
+
+        commission = reward * v.commission / 100
+        validator_reward = commission + (reward - commission) * v.locked / v.power
+        v.rewards += validator_reward
+
+        delegated = v.power - v.locked
+        if delegated <= 0:
+            return 0
+
+        delegator_reward = reward - validator_reward
+        compounded = delegator_reward * v.compound_stake / delegated
+        if delegated > v.compound_stake:
+            v.delegator_index += (delegator_reward - compounded) / (delegated - v.compound_stake)
+        v.compound_stake += compounded
+        return compounded
+
+    def sync_rewards(self, validator):
+        v = self.validators[validator]
+        if v.power and v.reward_index != self.reward_index:
+            self.add_power(validator, 0)
+
+    def accrue_delegation(self, d, validator):
+        if validator in self.validators:
+            self.sync_rewards(validator)
+            index = self.validators[validator].delegator_index
+        else:
+            index = 0
+        if not d.unbonding:
+            d.rewards += d.amount * (index - d.reward_index)
+        d.reward_index = index
+
+    def delegation(self, delegator, validator):
+        key = (delegator, validator)
+        d = self.delegations.get(key)
+        if d is None:
+            d = self.delegations[key] = Delegation()
+        return d
+
+    def delegation_of(self, delegator, validator):
+        d = self.delegations.get((delegator, validator))
+        if d is None:
+            return 0
+        amount = d.amount
+        if d.shares:
+            v = self.validators[validator]
+            amount += d.shares * v.compound_stake / v.shares
+        return amount
+
+    # Gov exports
+
+    def join(self, caller, commission):
+        v = self.validators.get(caller)
+        check(not (v and v.active), "Already a validator")
+        fee = self.rules["v_lock"]
+        check(self.balance(caller) >= fee, "Insufficient funds to join")
+        check(commission >= self.rules["v_min_commission"], "Commission too low")
+
+        if v is None:
+            v = self.validators[caller] = Validator()
+        self.bond(caller, fee)
+        v.active = True
+        v.locked = fee
+        v.unbonding = None
+        v.commission = commission
+        v.is_genesis_node = False
+        self.add_power(caller, fee)
+
+    def announce_validator_leave(self, caller):
+        v = self.validators.get(caller)
+        check(v and v.active, "Not a validator")
+        check(not v.unbonding, "Already unbonding")
+        v.unbonding = self.now + self.rules["unbonding_period"] * DAY
+
+    def cancel_validator_leave(self, caller):
+        v = self.validators.get(caller)
+        check(v and v.active, "Not an active validator")
+        check(v.unbonding, "Not unbonding")
+        v.unbonding = None
+
+    def validator_leave(self, caller):
+        v = self.validators.get(caller)
+        check(v and v.active, "Not a validator")
+        check(v.unbonding, "Not unbonding")
+        check(v.unbonding <= self.now, "Unbonding period not over")
+
+        locked = v.locked
+        if not v.is_genesis_node:
+            self.unbond(caller, locked)
+        self.add_power(caller, -locked)
+        v.active = False
+        v.unbonding = None
+        v.locked = 0
+        v.is_genesis_node = False
+
+    def delegate(self, caller, validator, amount, compound=False):
+        check(amount > 0, "Amount must be greater than 0")
+        v = self.validators.get(validator)
+        check(v and v.active, "Validator is not registered")
+        check(not v.unbonding, "Validator is unbonding")
+        d = self.delegations.get((caller, validator))
+        check(not (d and d.unbonding), "This delegation is unbonding")
+        check(self.balance(caller) >= amount, "Insufficient funds")
+        if compound:
+            check(not (d and d.amount), "This delegation is not compounding")
+        else:
+            check(not (d and d.shares), "This delegation is compounding")
+
+        d = self.delegation(caller, validator)
+        self.bond(caller, amount)
+
+        if compound:
+            self.add_power(validator, amount)
+            shares = amount if v.shares <= 0 or v.compound_stake <= 0 else amount * v.shares / v.compound_stake
+            v.shares += shares
+            v.compound_stake += amount
+            d.shares += shares
+            d.principal += amount
+            return
+
+        self.accrue_delegation(d, validator)
+        d.amount += amount
+        d.unbonding = None
+        self.add_power(validator, amount)
+
+    def redeem_shares(self, d, validator):
+        if not d.shares:
+            return
+        v = self.validators[validator]
+        self.sync_rewards(validator)
+        value = d.shares * v.compound_stake / v.shares
+        v.shares -= d.shares
+        v.compound_stake -= value
+        d.amount += value
+        d.compounded += value - d.principal if value > d.principal else 0
+        d.reward_index = v.delegator_index
+        d.shares = 0
+        d.principal = 0
+
+    def release_delegation(self, caller, d, amount):
+        if amount > d.compounded:
+            self.unbond(caller, amount - d.compounded)
+        if d.compounded:
+            self.transfer(GOV, d.compounded, caller)
+            d.compounded = 0
+
+    def announce_delegator_leave(self, caller, validator):
+        d = self.delegations.get((caller, validator))
+        check(d and (d.amount > 0 or d.shares > 0), "No delegation to leave")
+        check(not d.unbonding, "Already unbonding")
+        v = self.validators[validator]
+        if not v.active:
+            # Checked up front, the contract reverts if its custody or issuance can't pay out.
+            compounded = d.compounded
+            if d.shares:
+                compounded += max(self.delegation_of(caller, validator) - d.amount - d.principal, 0)
+            check(self.balance(GOV) >= compounded, "Not enough coins to send.")
+
+        self.accrue_delegation(d, validator)
+        self.redeem_shares(d, validator)
+        amount = d.amount
+
+        if not v.active:
+            self.release_delegation(caller, d, amount)
+            self.add_power(validator, -amount)
+            d.amount = 0
+            return
+
+        d.unbonding = v.unbonding if v.unbonding else self.now + self.rules["unbonding_period"] * DAY
+        self.add_power(validator, -amount)
+
+    def cancel_delegator_leave(self, caller, validator):
+        d = self.delegations.get((caller, validator))
+        check(d and d.amount > 0, "No delegation to leave")
+        check(d.unbonding, "Not unbonding")
+        self.accrue_delegation(d, validator)
+        d.unbonding = None
+        self.add_power(validator, d.amount)
+
+    def redelegate(self, caller, from_validator, to_validator, amount):
+        to = self.validators.get(to_validator)
+        check(to and to.active, "To validator is not active")
+        check(not to.unbonding, "To validator is unbonding")
+        d_from = self.delegations.get((caller, from_validator))
+        d_to = self.delegations.get((caller, to_validator))
+        delegated = self.delegation_of(caller, from_validator)
+        check(delegated > 0, "No delegation to move")
+        check(delegated >= amount, "Insufficient delegation")
+        check(not d_from.unbonding, "The 'from' delegation is unbonding")
+        check(not (d_to and d_to.unbonding), "The 'to' delegation is unbonding")
+        check(not d_from.shares, "Compounding delegations can't be redelegated")
+        check(not (d_to and d_to.shares), "Compounding delegations can't be redelegated")
+        check(not d_from.compounded, "Compounded delegations can't be redelegated")
+
+        d_to = self.delegation(caller, to_validator)
+        self.accrue_delegation(d_from, from_validator)
+        self.accrue_delegation(d_to, to_validator)
+        d_from.amount -= amount
+        d_to.amount += amount
+        self.add_power(from_validator, -amount)
+        self.add_power(to_validator, amount)
+
+    def delegator_leave(self, caller, validator):
+        d = self.delegations.get((caller, validator))
+        check(d and d.amount > 0, "No delegation to leave")
+        check(d.unbonding, "Not unbonding, call announce_delegator_leave first")
+        check(d.unbonding <= self.now, "Unbonding period not over")
+        check(self.balance(GOV) >= d.compounded, "Not enough coins to send.")
+
+        self.accrue_delegation(d, validator)
+        self.release_delegation(caller, d, d.amount)
+        d.amount = 0
+        d.unbonding = None
+
+    def claim_rewards(self, caller, validator):
+        d = self.delegations.get((caller, validator))
+        check(d is not None, "No rewards to claim")
+        self.accrue_delegation(d, validator)
+        amount = d.rewards
+        check(amount > 0, "No rewards to claim")
+        check(self.balance(GOV) >= amount, "Not enough coins to send.")
+        d.rewards = 0
+        self.transfer(GOV, amount, caller)
+
+    def claim_validator_rewards(self, caller):
+        v = self.validators.get(caller)
+        check(v is not None, "No rewards to claim")
+        self.sync_rewards(caller)
+        amount = v.rewards
+        check(amount > 0, "No rewards to claim")
+        check(self.balance(GOV) >= amount, "Not enough coins to send.")
+        v.rewards = 0
+        self.transfer(GOV, amount, caller)
+
+    def advance_epoch(self):
+        check(self.now >= self.epoch_t + self.rules["epoch_length"] * 3600, "Epoch not over")
+
+        if self.total_power > 0:
+            ir = self.issuance_rules
+            rate = calculate_reward_percentage(
+                self.total_power / self.supply, ir["staked_target"], ir["reward_target"],
+                ir["reward_max"], ir["reward_min"], ir["reward_steepness"],
+            )
+            amount = self.supply * rate * (self.now - self.epoch_t) / 3600 / HOURS_PER_YEAR
+            if amount > 0:
+                self.supply += amount
+                self.credit(GOV, amount)
+                self.reward_index += amount / self.total_power
+
+        self.epoch += 1
+        for name, v in self.validators.items():
+            if v.compound_stake:
+                self.add_power(name, 0)
+            if self.snapshots is not None:
+                self.snapshots[self.epoch, name] = v.power
+
+        self.epoch_t = self.now
+
+    # Streams
+
+    def outflow(self, sender):
+        o = self.outflows.get(sender)
+        if o is None:
+            o = self.outflows[sender] = Outflow()
+        return o
+
+    def checkpoint_outflow(self, sender):
+        o = self.outflow(sender)
+        while o.schedule and o.schedule[0][0] <= self.now:
+            time, change = o.schedule.pop(0)
+            o.owed += o.rate * (time - o.checkpoint)
+            o.checkpoint = time
+            o.rate += change
+        if o.checkpoint is not None:
+            o.owed += o.rate * (self.now - o.checkpoint)
+        o.checkpoint = self.now
+
+    def update_outflow(self, s, sign):
+        # Mirrors currency.update_outflow
+        self.checkpoint_outflow(s.sender)
+        o = self.outflows[s.sender]
+        accrued_until = min(self.now, s.closes)
+        if accrued_until > s.begins:
+            o.owed += sign * s.rate * (accrued_until - s.begins)
+        o.owed -= sign * s.claimed
+
+        for change in ([s.begins, s.rate], [s.closes, -s.rate]):
+            if change[0] <= self.now:
+                continue
+            if sign > 0:
+                bisect.insort_right(o.schedule, change, key=lambda c: c[0])
+            else:
+                o.schedule.remove(change)
+        if s.begins <= self.now < s.closes:
+            o.rate += sign * s.rate
+
+    def create_stream(self, caller, receiver, rate, begins, closes):
+        key = (caller, receiver, begins, closes, rate)
+        check(key not in self.streams, "Stream already exists.")
+        check(begins < closes, "Stream cannot begin after the close date.")
+        check(rate > 0, "Rate must be greater than 0.")
+
+        self.streams[key] = Stream(caller, receiver, rate, begins, closes)
+        self.update_outflow(self.streams[key], 1)
+        return key
+
+    def outstanding(self, s):
+        end = min(self.now, s.closes)
+        if end <= s.accrued_until:
+            return s.due
+        return s.due + s.rate * (end - s.accrued_until)
+
+    def balance_stream(self, caller, key):
+        s = self.streams.get(key)
+        check(s is not None, "Stream does not exist.")
+        check(s.status == "active", "You can only balance active streams.")
+        check(self.now > s.begins, "Stream has not started yet.")
+        check(caller in (s.sender, s.receiver), "Only sender or receiver can balance a stream.")
+        outstanding = self.outstanding(s)
+        check(outstanding > 0, "No amount due on this stream.")
+
+        self.checkpoint_outflow(s.sender)
+        o = self.outflows[s.sender]
+        available = self.balance(s.sender)
+        due = outstanding * available / o.owed if o.owed > available else outstanding
+        paid = due if due < available else available
+
+        self.credit(s.sender, -paid)
+        self.credit(s.receiver, paid)
+        s.claimed += paid
+        s.accrued_until = min(self.now, s.closes)
+        s.due = outstanding - paid
+        o.owed -= paid
+
+    def forfeit_stream(self, caller, key):
+        s = self.streams.get(key)
+        check(s is not None, "Stream does not exist.")
+        check(s.status == "active", "Stream is not active.")
+        check(caller == s.receiver, "Only receiver can forfeit a stream.")
+
+        s.status = "forfeit"
+        self.update_outflow(s, -1)
+        s.closes = self.now
+
+    # Driving the model
+
+    def tick(self, seconds):
+        self.now += seconds
+
+    def apply(self, op):
+        # Returns False if the operation's assertions fail, the model is unchanged in that case.
+        try:
+            getattr(self, op[0])(*op[1:])
+            return True
+        except SimAssertion:
+            return False
+
+
+def random_ops(rng, n, accounts, validators):
+    """
+    A random operation sequence over the given accounts.
+    Each op is a tuple of a GovSim method name and its arguments.
+    """
+    ops = []
+    streams = []
+    for _ in range(n):
+        roll = rng.random()
+        caller = rng.choice(accounts)
+        if roll < 0.25:
+            ops.append(("delegate", caller, rng.choice(validators), rng.randint(1, 500), rng.random() < 0.3))
+        elif roll < 0.33:
+            ops.append(("redelegate", caller, rng.choice(validators), rng.choice(validators), rng.randint(1, 200)))
+        elif roll < 0.41:
+            ops.append(("announce_delegator_leave", caller, rng.choice(validators)))
+        elif roll < 0.44:
+            ops.append(("cancel_delegator_leave", caller, rng.choice(validators)))
+        elif roll < 0.50:
+            ops.append(("delegator_leave", caller, rng.choice(validators)))
+        elif roll < 0.54:
+            ops.append(("join", rng.choice(validators), rng.randint(5, 20)))
+        elif roll < 0.57:
+            ops.append(("announce_validator_leave", rng.choice(validators)))
+        elif roll < 0.58:
+            ops.append(("cancel_validator_leave", rng.choice(validators)))
+        elif roll < 0.61:
+            ops.append(("validator_leave", rng.choice(validators)))
+        elif roll < 0.64:
+            ops.append(("claim_rewards", caller, rng.choice(validators)))
+        elif roll < 0.66:
+            ops.append(("claim_validator_rewards", rng.choice(validators)))
+        elif roll < 0.70:
+            begins = rng.randint(0, 30 * DAY)
+            key = (caller, rng.choice(accounts), begins, begins + rng.randint(DAY, 60 * DAY), rng.randint(1, 5) / 1000)
+            streams.append(key)
+            ops.append(("create_stream",) + key)
+        elif roll < 0.76 and streams:
+            key = rng.choice(streams)
+            ops.append(("balance_stream", key[rng.choice((0, 1))], key))
+        elif roll < 0.78 and streams:
+            key = rng.choice(streams)
+            ops.append(("forfeit_stream", key[1], key))
+        elif roll < 0.90:
+            ops.append(("advance_epoch",))
+        else:
+            ops.append(("tick", rng.randint(1, 2 * DAY)))
+    return ops
+
+
+RULES = {
+    "v_lock": 100,
+    "v_min_commission": 5,
+    "unbonding_period": 7,
+    "epoch_length": 8,
+}
+
+ISSUANCE_RULES = {
+    "staked_target": 0.5,
+    "reward_steepness": 0.5,
+    "reward_min": 0.02,
+    "reward_max": 0.2,
+    "reward_target": 0.05,
+}
+
+
+def new_sim(n_accounts=20, n_validators=8, n_genesis=2, funding=10000, rules=RULES, issuance_rules=ISSUANCE_RULES):
+    accounts = [f"account{i}" for i in range(n_accounts)]
+    validators = [f"node{i}" for i in range(1, n_validators + 1)]
+    sim = GovSim(validators[:n_genesis], rules, issuance_rules)
+    for account in accounts + validators:
+        sim.balances[account] = funding
+    return sim, accounts, validators
+
+
+def simulate(seed, n_ops=100000):
+    rng = random.Random(seed)
+    sim, accounts, validators = new_sim()
+    ops = random_ops(rng, n_ops, accounts, validators)
+
+    start = time.perf_counter()
+    applied = sum(sim.apply(op) for op in ops)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seed": seed,
+        "ops": n_ops,
+        "applied": applied,
+        "ops_per_s": n_ops / elapsed,
+        "epochs": sim.epoch,
+        "supply": sim.supply,
+        "total_power": sim.total_power,
+        "active_validators": sum(1 for v in sim.validators.values() if v.active),
+    }
+
+
+def monte_carlo(seeds, n_ops=100000, processes=None):
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(simulate, seeds, [n_ops] * len(seeds)))
+
+
+# Differential testing against the contracts
+
+def contract_time(seconds):
+    from contracting.stdlib.bridge.time import Datetime, Timedelta
+
+    return Datetime(year=START.year, month=START.month, day=START.day) + Timedelta(seconds=seconds)
+
+
+def contract_date_str(seconds):
+    return (START + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def replay(ops, client, sim):
+    """
+    Runs `ops` against freshly submitted contracts on `client`, seeded like `sim`,
+    and returns the list of operations that succeeded. `sim` must not have applied any ops yet.
+    """
+    client.flush()
+    with open("currency.py") as f:
+        client.submit(f.read(), name="currency", constructor_args={"vk": "sys", "gov_contract": GOV})
+    with open("gov.py") as f:
+        genesis = [name for name, v in sim.validators.items() if v.is_genesis_node]
+        client.submit(
+            f.read(),
+            name=GOV,
+            constructor_args={"genesis_nodes": genesis, "rules": sim.rules, "issuance_rules": sim.issuance_rules},
+        )
+
+    currency = client.get_contract("currency")
+    gov = client.get_contract(GOV)
+    gov.Epoch_T.set(contract_time(0))
+
+    for account, balance in sim.balances.items():
+        currency.transfer(amount=balance, to=account, signer="sys")
+        currency.approve(amount=10 ** 12, to=GOV, signer=account)
+
+    now = 0
+    stream_ids = {}
+    results = []
+
+    for op in ops:
+        name, args = op[0], op[1:]
+        environment = {"now": contract_time(now)}
+        ok = True
+        try:
+            if name == "tick":
+                now += args[0]
+            elif name == "advance_epoch":
+                gov.advance_epoch(environment=environment)
+            elif name == "join":
+                gov.join(commission=args[1], signer=args[0], environment=environment)
+            elif name in ("announce_validator_leave", "cancel_validator_leave", "validator_leave", "claim_validator_rewards"):
+                getattr(gov, name)(signer=args[0], environment=environment)
+            elif name == "delegate":
+                gov.delegate(validator=args[1], amount=args[2], compound=args[3], signer=args[0], environment=environment)
+            elif name == "redelegate":
+                gov.redelegate(from_validator=args[1], to_validator=args[2], amount=args[3], signer=args[0], environment=environment)
+            elif name in ("announce_delegator_leave", "cancel_delegator_leave", "delegator_leave", "claim_rewards"):
+                getattr(gov, name)(validator=args[1], signer=args[0], environment=environment)
+            elif name == "create_stream":
+                sender, receiver, begins, closes, rate = args
+                stream_ids[args] = currency.create_stream(
+                    receiver=receiver, rate=rate, begins=contract_date_str(begins), closes=contract_date_str(closes),
+                    signer=sender, environment=environment,
+                )
+            elif name in ("balance_stream", "forfeit_stream"):
+                ok = args[1] in stream_ids
+                if ok:
+                    getattr(currency, name)(stream_id=stream_ids[args[1]], signer=args[0], environment=environment)
+        except Exception:
+            ok = False
+        results.append(ok)
+
+    return results
+
+
+def compare(sim, driver, tolerance=1e-6):
+    """
+    Returns a list of (key, model value, contract value) for every state value that differs.
+    """
+    def close(a, b):
+        a = float(a or 0)
+        b = float(b or 0)
+        return abs(a - b) <= tolerance * max(1, abs(a), abs(b))
+
+    diffs = []
+
+    def expect(key, value):
+        actual = driver.get(key)
+        if not close(value, actual):
+            diffs.append((key, value, actual))
+
+    for name, v in sim.validators.items():
+        expect(f"{GOV}.Validators:{name}:power", v.power)
+        expect(f"{GOV}.Validators:{name}:rewards", v.rewards)
+        expect(f"{GOV}.Validators:{name}:compound_stake", v.compound_stake)
+        if bool(driver.get(f"{GOV}.Validators:{name}:active")) != v.active:
+            diffs.append((f"{GOV}.Validators:{name}:active", v.active, driver.get(f"{GOV}.Validators:{name}:active")))
+
+    for (delegator, validator), d in sim.delegations.items():
+        expect(f"{GOV}.Delegators:{delegator}:{validator}:amount", d.amount)
+        expect(f"{GOV}.Delegators:{delegator}:{validator}:shares", d.shares)
+        expect(f"{GOV}.Delegators:{delegator}:{validator}:rewards", d.rewards)
+
+    for account, balance in sim.balances.items():
+        expect(f"currency.balances:{account}", balance)
+
+    for owner, amount in sim.custody.items():
+        expect(f"currency.custody:{GOV}:{owner}", amount)
+
+    expect(f"{GOV}.TotalPower", sim.total_power)
+    return diffs
+
+
+def differential(seed, n_ops, client):
+    """
+    Replays the same random ops on the model and on the contracts.
+    Returns (ops whose outcome differs, state differences).
+    """
+    rng = random.Random(seed)
+    sim, accounts, validators = new_sim()
+    ops = random_ops(rng, n_ops, accounts, validators)
+
+    contract_results = replay(ops, client, sim)
+    sim_results = [sim.apply(op) for op in ops]
+
+    outcome_diffs = [(i, op, s, c) for i, (op, s, c) in enumerate(zip(ops, sim_results, contract_results)) if s != c]
+    if sim.epoch:
+        # TotalPower is only folded at the epoch boundary, fold it so the totals compare.
+        client.get_contract(GOV).fold_total_power()
+    return outcome_diffs, compare(sim, client.raw_driver)
+
+
+if __name__ == "__main__":
+    for result in monte_carlo(list(range(8))):
+        print(result)
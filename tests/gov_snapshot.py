@@ -0,0 +1,218 @@
+import bisect
+import mmap
+import struct
+from array import array
+
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.storage.encoder import decode, encode
+
+# Compact binary snapshots of contract state, e.g. the gov.* and currency.* namespaces.
+#
+# Keys are sorted and split on ":" into parts. Every distinct part is stored once, and a key is a run of part ids.
+# Each value has a type tag and a slot in the column of its type: int64, float64 or strings.
+# Decimals are stored as their string, values of any other type as their contracting encoding.
+#
+# Layout, little-endian, every section padded to 8 bytes:
+#   header       MAGIC, then part, key, part id, int, float and string counts as uint32
+#   parts        uint32 offsets[parts + 1], utf-8 blob
+#   keys         uint32 offsets[keys + 1] into part ids, uint32 part ids
+#   values       uint8 tags[keys], uint32 slots[keys]
+#   columns      int64 ints, float64 floats, uint32 string offsets[strings + 1], utf-8 blob
+
+MAGIC = b"GOVSNAP1"
+HEADER = struct.Struct("<8s6I")
+
+NONE, FALSE, TRUE, INT, FLOAT, STR, DECIMAL, ENCODED = range(8)
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def pad(data):
+    data += b"\0" * (-len(data) % 8)
+    return data
+
+
+def string_table(strings):
+    offsets = array("I", [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode()
+        offsets.append(len(blob))
+    return pad(bytearray(offsets.tobytes())) + pad(blob)
+
+
+def write_snapshot(items, path):
+    """
+    Writes a dict of key -> value, as returned by driver.items(prefix), to `path`.
+    """
+    keys = sorted(items)
+
+    part_ids = {}
+    key_offsets = array("I", [0])
+    key_parts = array("I")
+    tags = array("B")
+    slots = array("I")
+    ints = array("q")
+    floats = array("d")
+    strings = []
+
+    for key in keys:
+        for part in key.split(":"):
+            key_parts.append(part_ids.setdefault(part, len(part_ids)))
+        key_offsets.append(len(key_parts))
+
+        value = items[key]
+        if value is None:
+            tags.append(NONE)
+            slots.append(0)
+        elif value is True or value is False:
+            tags.append(TRUE if value else FALSE)
+            slots.append(0)
+        elif type(value) is int and INT64_MIN <= value <= INT64_MAX:
+            tags.append(INT)
+            slots.append(len(ints))
+            ints.append(value)
+        elif type(value) is float:
+            tags.append(FLOAT)
+            slots.append(len(floats))
+            floats.append(value)
+        else:
+            if type(value) is str:
+                tags.append(STR)
+            elif isinstance(value, ContractingDecimal):
+                tags.append(DECIMAL)
+                value = str(value)
+            else:
+                tags.append(ENCODED)
+                value = encode(value)
+            slots.append(len(strings))
+            strings.append(value)
+
+    with open(path, "wb") as f:
+        f.write(pad(bytearray(HEADER.pack(MAGIC, len(part_ids), len(keys), len(key_parts), len(ints), len(floats), len(strings)))))
+        f.write(string_table(part_ids))
+        f.write(pad(bytearray(key_offsets.tobytes())))
+        f.write(pad(bytearray(key_parts.tobytes())))
+        f.write(pad(bytearray(tags.tobytes())))
+        f.write(pad(bytearray(slots.tobytes())))
+        f.write(pad(bytearray(ints.tobytes())))
+        f.write(pad(bytearray(floats.tobytes())))
+        f.write(string_table(strings))
+
+
+def export(driver, path, prefixes=("gov.", "currency.")):
+    items = {}
+    for prefix in prefixes:
+        items.update(driver.items(prefix))
+    write_snapshot(items, path)
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot. Columns are read in place rather than parsed, only the interned key parts are decoded on open.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+
+        magic, n_parts, n_keys, n_key_parts, n_ints, n_floats, n_strings = HEADER.unpack_from(view)
+        assert magic == MAGIC, "Not a gov snapshot"
+        self.offset = HEADER.size + (-HEADER.size % 8)
+
+        def column(fmt, size, count):
+            start = self.offset
+            self.offset += size * count + (-(size * count) % 8)
+            return view[start:start + size * count].cast(fmt)
+
+        def strings(count):
+            offsets = column("I", 4, count + 1)
+            blob = column("B", 1, offsets[-1])
+            return offsets, blob
+
+        part_offsets, part_blob = strings(n_parts)
+        self.parts = [bytes(part_blob[part_offsets[i]:part_offsets[i + 1]]).decode() for i in range(n_parts)]
+        self.key_offsets = column("I", 4, n_keys + 1)
+        self.key_parts = column("I", 4, n_key_parts)
+        self.tags = column("B", 1, n_keys)
+        self.slots = column("I", 4, n_keys)
+        self.ints = column("q", 8, n_ints)
+        self.floats = column("d", 8, n_floats)
+        self.string_offsets, self.string_blob = strings(n_strings)
+        self.keys = KeyList(self)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def key(self, i):
+        parts = self.parts
+        return ":".join([parts[p] for p in self.key_parts[self.key_offsets[i]:self.key_offsets[i + 1]]])
+
+    def value(self, i):
+        tag = self.tags[i]
+        if tag == NONE:
+            return None
+        if tag == FALSE:
+            return False
+        if tag == TRUE:
+            return True
+        if tag == INT:
+            return self.ints[self.slots[i]]
+        if tag == FLOAT:
+            return self.floats[self.slots[i]]
+
+        slot = self.slots[i]
+        value = bytes(self.string_blob[self.string_offsets[slot]:self.string_offsets[slot + 1]]).decode()
+        if tag == DECIMAL:
+            return ContractingDecimal(value)
+        if tag == ENCODED:
+            return decode(value)
+        return value
+
+    def range(self, prefix=""):
+        # Keys are sorted, so the keys with a prefix are the run between two binary searches.
+        start = bisect.bisect_left(self.keys, prefix)
+        end = len(self) if not prefix else bisect.bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return start, end
+
+    def iter_items(self, prefix=""):
+        start, end = self.range(prefix)
+        for i in range(start, end):
+            yield self.key(i), self.value(i)
+
+    def items(self, prefix=""):
+        # Same shape as driver.items(prefix), so helpers such as gov_utils.get_validators can read a snapshot.
+        return dict(self.iter_items(prefix))
+
+    def get(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self) and self.key(i) == key:
+            return self.value(i)
+        return None
+
+    def hydrate(self, driver, prefix=""):
+        # Writes the snapshot into a driver in one pass.
+        for key, value in self.iter_items(prefix):
+            driver.set(key, value)
+        driver.commit()
+
+    def close(self):
+        self.keys = None
+        self.key_offsets = self.key_parts = self.tags = self.slots = None
+        self.ints = self.floats = self.string_offsets = self.string_blob = None
+        self.map.close()
+        self.file.close()
+
+
+class KeyList:
+    # Sequence view of the keys for bisect, keys are only joined when the search touches them.
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, i):
+        return self.snapshot.key(i)
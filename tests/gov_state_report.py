@@ -0,0 +1,77 @@
+import csv
+import os
+import time
+
+from contracting.storage.encoder import encode
+
+# Key counts and bytes per namespace and field of the gov and currency state, to track state growth over time.
+# Bytes are the key plus its encoded value, the size a key takes in storage before any overhead.
+
+# Position of the field in the parts after the hash name, for hashes keyed by address(es) then field.
+FIELD_POSITIONS = {
+    "gov.Validators": 1,
+    "gov.Delegators": 2,
+    "gov.Pending": 2,
+    "gov.PowerTree": 0,
+    "gov.RuleVersions": 0,
+    "gov.EpochWork": 0,
+    "currency.streams": 1,
+    "currency.outflows": 1,
+}
+
+
+def namespace_and_field(key):
+    name, _, path = key.partition(":")
+    position = FIELD_POSITIONS.get(name)
+    parts = path.split(":") if path else []
+    if position is None or position >= len(parts):
+        return name, ""
+    return name, parts[position]
+
+
+def state_report(driver, prefixes=("gov.", "currency.")):
+    """
+    Returns {(namespace, field): [keys, bytes]}, the field is "" for hashes and variables without named fields.
+    Works on anything with items(prefix), e.g. a driver or a gov_snapshot.Snapshot.
+    """
+    report = {}
+    for prefix in prefixes:
+        for key, value in driver.items(prefix).items():
+            row = report.setdefault(namespace_and_field(key), [0, 0])
+            row[0] += 1
+            row[1] += len(key) + len(encode(value))
+    return report
+
+
+def format_report(report):
+    lines = [f"{'namespace':<28} {'field':<20} {'keys':>10} {'bytes':>12}"]
+    for (namespace, field), (keys, size) in sorted(report.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{namespace:<28} {field:<20} {keys:>10} {size:>12}")
+    keys = sum(row[0] for row in report.values())
+    size = sum(row[1] for row in report.values())
+    lines.append(f"{'total':<49} {keys:>10} {size:>12}")
+    return "\n".join(lines)
+
+
+def append_history(path, report, label=None):
+    # Appends one row per namespace and field to a CSV file, labelled with e.g. a block height, or the time by default.
+    label = label if label is not None else int(time.time())
+    exists = os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if not exists:
+            writer.writerow(["label", "namespace", "field", "keys", "bytes"])
+        for (namespace, field), (keys, size) in sorted(report.items()):
+            writer.writerow([label, namespace, field, keys, size])
+
+
+if __name__ == "__main__":
+    import sys
+
+    from gov_snapshot import Snapshot
+
+    snapshot = Snapshot(sys.argv[1])
+    report = state_report(snapshot)
+    print(format_report(report))
+    if len(sys.argv) > 2:
+        append_history(sys.argv[2], report)
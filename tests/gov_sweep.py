@@ -0,0 +1,275 @@
+import itertools
+import json
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gov_utils import calculate_reward_percentage
+
+try:
+    import numpy as np
+except ImportError:  # The sweep falls back to plain Python, one grid point at a time.
+    np = None
+
+# Parameter sweep over IssuanceRules and Rules.
+# Each grid point is simulated at the aggregate level for some years of epochs, using the same reward curve as gov.issuance_rate:
+# * Issuance is minted each epoch and paid pro-rata to stake, `restake` of it is staked again.
+# * Liquid tokens are staked, and stake leaves, in proportion to how far the real yield is above or below a hurdle rate.
+#   Longer unbonding periods raise the hurdle by `lock_premium` per year of lock.
+# * Validator i starts with power proportional to (i + 1) ** -initial_skew.
+# * New stake favours larger validators by `preference`, giving the concentration of power over time.
+# Results are streamed to a directory of column files, see ColumnWriter.
+
+HOURS_PER_YEAR = 8760
+
+DEFAULTS = {
+    "staked_target": 0.5,
+    "reward_steepness": 0.5,
+    "reward_min": 0.02,
+    "reward_max": 0.2,
+    "reward_target": 0.05,
+    "unbonding_period": 7,
+    "v_max": 10,
+    "epoch_length": 24,
+    "initial_staked": 0.2,
+    "restake": 0.5,
+    "hurdle": 0.02,
+    "lock_premium": 0.1,
+    "elasticity": 0.01,
+    "preference": 0.5,
+    "initial_skew": 0.5,
+}
+
+# Per point, per simulated year.
+RESULT_COLUMNS = ["point", "year", "staked_ratio", "hhi", "nominal_yield", "real_yield", "supply"]
+
+
+def grid(**axes):
+    """
+    The cartesian product of the given axes over DEFAULTS, e.g. grid(unbonding_period=[7, 14], reward_max=[0.1, 0.2]).
+    """
+    names = list(axes)
+    return [{**DEFAULTS, **dict(zip(names, values))} for values in itertools.product(*axes.values())]
+
+
+def simulate_point(point, years, supply=111111111):
+    # Plain Python reference, returns one row per year.
+    p = point
+    epochs_per_year = int(HOURS_PER_YEAR // p["epoch_length"])
+    hurdle = p["hurdle"] + p["lock_premium"] * p["unbonding_period"] / 365
+    v = int(p["v_max"])
+
+    staked = supply * p["initial_staked"]
+    shape = [(i + 1) ** -p["initial_skew"] for i in range(v)]
+    powers = [staked * x / sum(shape) for x in shape]
+    rows = []
+
+    for year in range(1, years + 1):
+        for _ in range(epochs_per_year):
+            ratio = staked / supply
+            rate = calculate_reward_percentage(
+                ratio, p["staked_target"], p["reward_target"], p["reward_max"], p["reward_min"], p["reward_steepness"]
+            )
+            issued = supply * rate * p["epoch_length"] / HOURS_PER_YEAR
+            real = (1 + rate / ratio) / (1 + rate) - 1
+
+            gap = real - hurdle
+            flow = p["elasticity"] * gap * ((supply - staked) if gap > 0 else staked)
+            supply += issued
+
+            weights = [w ** (1 + p["preference"]) for w in powers]
+            total_weight = sum(weights)
+            restaked = issued * p["restake"]
+            grow = [restaked * w / staked for w in powers]
+            if flow > 0:
+                powers = [w + g + flow * x / total_weight for w, g, x in zip(powers, grow, weights)]
+            else:
+                powers = [w + g + flow * w / staked for w, g in zip(powers, grow)]
+            staked = sum(powers)
+
+        ratio = staked / supply
+        rate = calculate_reward_percentage(
+            ratio, p["staked_target"], p["reward_target"], p["reward_max"], p["reward_min"], p["reward_steepness"]
+        )
+        rows.append({
+            "year": year,
+            "staked_ratio": ratio,
+            "hhi": sum((w / staked) ** 2 for w in powers),
+            "nominal_yield": rate / ratio,
+            "real_yield": (1 + rate / ratio) / (1 + rate) - 1,
+            "supply": supply,
+        })
+
+    return rows
+
+
+def reward_rate(ratio, target, steepness, reward_target, reward_max, reward_min):
+    # gov.issuance_rate over arrays of points.
+    below = 1 - ratio / target
+    above = np.where(target >= 1, 1.0, np.minimum((ratio - target) / np.where(target >= 1, 1.0, 1 - target), 1))
+    shape_below = (1 - steepness) * below + steepness * below * below
+    shape_above = (1 - steepness) * above + steepness * above * above
+    return np.where(
+        ratio < target,
+        reward_target + (reward_max - reward_target) * shape_below,
+        reward_target - (reward_target - reward_min) * shape_above,
+    )
+
+
+def simulate_points(points, years, supply=111111111):
+    """
+    Simulates many grid points at once, returns one list of rows per point.
+    Points are vectorized with numpy when it is installed, all points must share the same epoch_length.
+    """
+    if np is None:
+        return [simulate_point(p, years, supply) for p in points]
+
+    lengths = {p["epoch_length"] for p in points}
+    assert len(lengths) == 1, "Points simulated together must share epoch_length"
+    epoch_length = lengths.pop()
+    epochs_per_year = int(HOURS_PER_YEAR // epoch_length)
+
+    def column(name):
+        return np.array([float(p[name]) for p in points])
+
+    target, steepness = column("staked_target"), column("reward_steepness")
+    r_target, r_max, r_min = column("reward_target"), column("reward_max"), column("reward_min")
+    hurdle = column("hurdle") + column("lock_premium") * column("unbonding_period") / 365
+    restake, elasticity, preference = column("restake"), column("elasticity"), column("preference")
+
+    # Validators beyond a point's v_max are masked out.
+    v = column("v_max").astype(int)
+    mask = np.arange(v.max())[None, :] < v[:, None]
+
+    supplies = np.full(len(points), float(supply))
+    staked = supplies * column("initial_staked")
+    shape = np.where(mask, (np.arange(v.max()) + 1.0)[None, :] ** -column("initial_skew")[:, None], 0.0)
+    powers = staked[:, None] * shape / shape.sum(axis=1)[:, None]
+    rows = [[] for _ in points]
+
+    for year in range(1, years + 1):
+        for _ in range(epochs_per_year):
+            ratio = staked / supplies
+            rate = reward_rate(ratio, target, steepness, r_target, r_max, r_min)
+            issued = supplies * rate * epoch_length / HOURS_PER_YEAR
+            real = (1 + rate / ratio) / (1 + rate) - 1
+
+            gap = real - hurdle
+            flow = elasticity * gap * np.where(gap > 0, supplies - staked, staked)
+            supplies = supplies + issued
+
+            weights = np.where(mask, powers, 0.0) ** (1 + preference)[:, None]
+            grow = (issued * restake / staked)[:, None] * powers
+            inflow = (np.maximum(flow, 0) / weights.sum(axis=1))[:, None] * weights
+            outflow = (np.minimum(flow, 0) / staked)[:, None] * powers
+            powers = powers + grow + inflow + outflow
+            staked = powers.sum(axis=1)
+
+        ratio = staked / supplies
+        rate = reward_rate(ratio, target, steepness, r_target, r_max, r_min)
+        hhi = ((powers / staked[:, None]) ** 2).sum(axis=1)
+        for i in range(len(points)):
+            rows[i].append({
+                "year": year,
+                "staked_ratio": float(ratio[i]),
+                "hhi": float(hhi[i]),
+                "nominal_yield": float(rate[i] / ratio[i]),
+                "real_yield": float((1 + rate[i] / ratio[i]) / (1 + rate[i]) - 1),
+                "supply": float(supplies[i]),
+            })
+
+    return rows
+
+
+def run_chunk(start, points, years):
+    return start, simulate_points(points, years)
+
+
+class ColumnWriter:
+    """
+    Appends rows to a directory with one binary file of doubles per column and a schema.json,
+    so a sweep can be written as it runs and single columns read back without parsing the rest.
+    """
+
+    def __init__(self, path, columns):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = columns
+        self.buffers = {c: array("d") for c in columns}
+        with open(os.path.join(path, "schema.json"), "w") as f:
+            json.dump({"columns": columns, "type": "d"}, f)
+        for c in columns:
+            open(self.column_path(c), "wb").close()
+
+    def column_path(self, column):
+        return os.path.join(self.path, f"{column}.bin")
+
+    def write(self, row):
+        for c in self.columns:
+            self.buffers[c].append(row[c])
+        if len(self.buffers[self.columns[0]]) >= 65536:
+            self.flush()
+
+    def flush(self):
+        for c in self.columns:
+            with open(self.column_path(c), "ab") as f:
+                self.buffers[c].tofile(f)
+            self.buffers[c] = array("d")
+
+    def close(self):
+        self.flush()
+
+
+def read_columns(path, columns=None):
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    result = {}
+    for c in columns or schema["columns"]:
+        values = array(schema["type"])
+        with open(os.path.join(path, f"{c}.bin"), "rb") as f:
+            values.frombytes(f.read())
+        result[c] = values
+    return result
+
+
+def sweep(points, path, years=10, chunk_size=64, processes=None):
+    """
+    Simulates every grid point for `years` across a process pool and streams the results to `path`.
+    The parameters of each point are written next to the results in points.json, `point` is the index into it.
+    """
+    # Chunks share an epoch_length so they can be vectorized.
+    groups = {}
+    for i, p in enumerate(points):
+        groups.setdefault(p["epoch_length"], []).append(i)
+    chunks = [g[i:i + chunk_size] for g in groups.values() for i in range(0, len(g), chunk_size)]
+
+    writer = ColumnWriter(path, RESULT_COLUMNS)
+    with open(os.path.join(path, "points.json"), "w") as f:
+        json.dump(points, f)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(run_chunk, n, [points[j] for j in c], years): c for n, c in enumerate(chunks)}
+        for future in as_completed(futures):
+            indices = futures[future]
+            for point, rows in zip(indices, future.result()[1]):
+                for row in rows:
+                    writer.write({"point": point, **row})
+
+    writer.close()
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    points = grid(
+        unbonding_period=[1, 7, 14, 28],
+        v_max=[10, 50, 100],
+        staked_target=[0.3, 0.5, 0.7],
+        reward_max=[0.1, 0.2, 0.3],
+        reward_steepness=[0, 0.5, 1],
+    )
+    start = time.perf_counter()
+    sweep(points, sys.argv[1] if len(sys.argv) > 1 else "sweep_results", years=10)
+    print(f"{len(points)} points in {time.perf_counter() - start:.1f}s")
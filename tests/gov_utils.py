@@ -1,3 +1,4 @@
+import bisect
 import math
 
 
@@ -60,6 +61,100 @@ def get_validators(driver, gov_contract_name="gov"):
     return available_validators, inactive_validators, unbonding_validators
 
 
+SAMPLE_PRECISION = 1000000  # Must match gov.SAMPLE_PRECISION
+
+
+def get_power_tree(driver, gov_contract_name="gov"):
+    """
+    Reads the on-chain Fenwick tree over validator slots.
+    Returns (nodes, owners), both indexed by slot with index 0 unused.
+    """
+    size = driver.get(f"{gov_contract_name}.PowerTree:size") or 0
+    nodes = [0] * (size + 1)
+    owners = [None] * (size + 1)
+
+    for key, value in driver.items(f"{gov_contract_name}.PowerTree:node:").items():
+        nodes[int(key.split(":")[2])] = value
+
+    for key, value in driver.items(f"{gov_contract_name}.PowerTree:owner:").items():
+        owners[int(key.split(":")[2])] = value
+
+    return nodes, owners
+
+
+def build_power_tree(powers):
+    """
+    Builds a Fenwick tree from (validator, power) pairs in slot order.
+    Returns (nodes, owners) in the same layout as get_power_tree.
+    """
+    size = len(powers)
+    nodes = [0] * (size + 1)
+    owners = [None] * (size + 1)
+
+    for slot, (validator, power) in enumerate(powers, start=1):
+        owners[slot] = validator
+        nodes[slot] += power
+        parent = slot + (slot & -slot)
+        if parent <= size:
+            nodes[parent] += nodes[slot]
+
+    return nodes, owners
+
+
+def power_tree_prefix(nodes, slot):
+    total = 0
+    while slot > 0:
+        total += nodes[slot]
+        slot -= slot & -slot
+    return total
+
+
+def sample_by_power(nodes, owners, seed):
+    # Mirrors gov.sample_by_power
+    size = len(nodes) - 1
+    total = power_tree_prefix(nodes, size)
+    assert total > 0, "No power to sample from"
+
+    target = (seed % SAMPLE_PRECISION) * total / SAMPLE_PRECISION
+
+    step = 1
+    while step * 2 <= size:
+        step *= 2
+
+    slot = 0
+    while step > 0:
+        if slot + step <= size and nodes[slot + step] <= target:
+            slot += step
+            target -= nodes[slot]
+        step //= 2
+
+    return owners[min(slot + 1, size)]
+
+
+def power_interval_of(nodes, owners, validator):
+    # Mirrors gov.power_interval_of, the [start, end) interval of cumulative power in slot order, not a rank.
+    slot = owners.index(validator)
+    return [power_tree_prefix(nodes, slot - 1), power_tree_prefix(nodes, slot)]
+
+
+def get_rule_versions(driver, gov_contract_name="gov"):
+    """
+    Reads every version of the rules recorded by gov.
+    Returns (epochs, versions), epochs[i] being the epoch from which versions[i] is in force, in increasing order.
+    """
+    count = driver.get(f"{gov_contract_name}.RuleVersions:count") or 0
+    epochs = [driver.get(f"{gov_contract_name}.RuleVersions:epoch:{i}") for i in range(count)]
+    versions = [driver.get(f"{gov_contract_name}.RuleVersions:rules:{i}") for i in range(count)]
+    return epochs, versions
+
+
+def rules_at(epochs, versions, epoch):
+    # Mirrors gov.rules_at
+    i = bisect.bisect_right(epochs, epoch) - 1
+    assert i >= 0, "No rules recorded for this epoch"
+    return versions[i]
+
+
 def calculate_reward_percentage(
     staked_amount: float,
     staked_target: float,
@@ -68,5 +163,30 @@ def calculate_reward_percentage(
     min_reward_pct: float,
     curve_steepness: float = 0.9,  # Adjusted for a more pronounced effect
 ) -> float:
-    # TODO - Add a dynamic reward %
-    return base_reward_pct
\ No newline at end of file
+    # Mirrors gov.issuance_rate, staked_amount is the staked share of supply.
+    if staked_amount < staked_target:
+        x = 1 - staked_amount / staked_target
+        return base_reward_pct + (max_reward_pct - base_reward_pct) * ((1 - curve_steepness) * x + curve_steepness * x * x)
+
+    x = 1 if staked_target >= 1 else min((staked_amount - staked_target) / (1 - staked_target), 1)
+    return base_reward_pct - (base_reward_pct - min_reward_pct) * ((1 - curve_steepness) * x + curve_steepness * x * x)
+
+
+def calculate_epoch_issuance(total_power, supply, epoch_length, issuance_rules, base_units=False):
+    # Mirrors gov.issue_epoch_rewards, returns the amount minted for an epoch that lasted `epoch_length` hours.
+    # With base_units the currency counts whole base units and, like gov.payable, the amount is rounded down.
+    if total_power <= 0:
+        return 0
+
+    rate = calculate_reward_percentage(
+        total_power / supply,
+        issuance_rules["staked_target"],
+        issuance_rules["reward_target"],
+        issuance_rules["reward_max"],
+        issuance_rules["reward_min"],
+        issuance_rules["reward_steepness"],
+    )
+    amount = supply * rate * epoch_length / 8760
+    if base_units:
+        amount = int(amount)
+    return max(amount, 0)
\ No newline at end of file
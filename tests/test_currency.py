@@ -0,0 +1,276 @@
+import unittest
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+from nacl.signing import SigningKey
+
+from bench_permits import sign_permit
+from gov_fixtures import worker_client
+
+
+class TestCurrency(unittest.TestCase):
+
+    BEGINS = "2021-01-01 00:00:00"
+    CLOSES = "2021-01-11 00:00:00"
+
+    def setUp(self):
+        # Called before every test, bootstraps the environment.
+        self.client = worker_client()
+        self.client.flush()
+
+        with open("currency.py") as f:
+            code = f.read()
+            self.client.submit(
+                code,
+                name="currency",
+                constructor_args={"vk": "sys", "gov_contract": "gov"},
+            )
+
+        self.currency = self.client.get_contract("currency")
+
+        for account in ["alice", "bob"]:
+            self.currency.transfer(amount=10000, to=account, signer="sys")
+
+    def tearDown(self):
+        # Called after every test, ensures each test starts with a clean slate and is isolated from others
+        self.client.flush()
+
+    def create_stream(self, sender, receiver, rate, begins=None, closes=None):
+        # Created at BEGINS, streams only count towards the sender's outflow from their own begins to closes.
+        return self.currency.create_stream(
+            receiver=receiver, rate=rate, begins=begins or self.BEGINS, closes=closes or self.CLOSES, signer=sender,
+            environment={"now": Datetime(year=2021, month=1, day=1, hour=0)},
+        )
+
+    def test_seed_stream_indexed(self):
+        self.assertEqual(self.currency.get_streams(account="team_lock", direction="out", start=0, limit=10), ["team_lock"])
+        self.assertEqual(self.currency.get_streams(account="sys", direction="in", start=0, limit=10), ["team_lock"])
+
+    def test_stream_index_add_remove(self):
+        first = self.create_stream("alice", "carol", 1)
+        second = self.create_stream("alice", "dave", 1)
+        third = self.create_stream("bob", "carol", 1)
+
+        self.assertEqual(self.currency.get_streams(account="alice", direction="out", start=0, limit=10), [first, second])
+        self.assertEqual(self.currency.get_streams(account="carol", direction="in", start=0, limit=10), [first, third])
+
+        self.currency.forfeit_stream(stream_id=first, signer="carol")
+
+        self.assertEqual(self.currency.get_streams(account="alice", direction="out", start=0, limit=10), [second])
+        self.assertEqual(self.currency.get_streams(account="carol", direction="in", start=0, limit=10), [third])
+
+    def test_balance_streams(self):
+        first = self.create_stream("alice", "carol", 1)
+        second = self.create_stream("bob", "carol", 2)
+        not_started = self.create_stream("bob", "carol", 1, begins="2021-02-01 00:00:00", closes="2021-02-02 00:00:00")
+
+        self.currency.balance_streams(
+            stream_ids=[first, second, not_started],
+            signer="carol",
+            environment={"now": Datetime(year=2021, month=1, day=1, hour=0, minute=10)},
+        )
+
+        self.assertEqual(self.currency.balances["carol"], 600 + 1200)
+        self.assertEqual(self.currency.balances["alice"], 10000 - 600)
+        self.assertEqual(self.currency.balances["bob"], 10000 - 1200)
+        self.assertEqual(self.currency.streams[not_started, "claimed"], 0)
+
+    def test_balance_all_incoming(self):
+        self.create_stream("alice", "carol", 1)
+        self.create_stream("bob", "carol", 1)
+
+        self.currency.balance_all_incoming(
+            start=0,
+            limit=10,
+            signer="carol",
+            environment={"now": Datetime(year=2021, month=1, day=1, hour=0, minute=1)},
+        )
+
+        self.assertEqual(self.currency.balances["carol"], 120)
+
+    def test_sender_solvent_until(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        self.currency.create_stream(receiver="carol", rate=1, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+        self.currency.create_stream(receiver="dave", rate=1, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+
+        self.assertEqual(self.currency.sender_solvent_until(sender="alice", environment={"now": start}), start + Timedelta(seconds=5000))
+        self.assertEqual(self.currency.sender_solvent_until(sender="bob", environment={"now": start}), None)
+
+    def test_insolvent_sender_claims_pro_rated(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        first = self.currency.create_stream(receiver="carol", rate=1, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+        self.currency.create_stream(receiver="dave", rate=1, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+        self.currency.transfer(amount=9400, to="bob", signer="alice")
+
+        # 1200 owed across both streams, only 600 held, each receiver is paid half of what is due
+        self.currency.balance_stream(stream_id=first, signer="carol", environment={"now": start + Timedelta(minutes=10)})
+
+        self.assertEqual(self.currency.balances["carol"], 300)
+        self.assertEqual(self.currency.outflows["alice", "owed"], 900)
+        self.assertEqual(self.currency.sender_solvent_until(sender="alice", environment={"now": start + Timedelta(minutes=10)}), start + Timedelta(minutes=10))
+
+    def test_expired_stream_stops_counting_as_owed(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        self.currency.transfer(amount=90000, to="alice", signer="sys")
+        self.create_stream("alice", "carol", 1, closes="2021-01-01 00:16:40")
+        second = self.create_stream("alice", "dave", 1)
+
+        # 1000 left due on the expired stream and 86400 on the other are owed, the 100000 held cover both
+        now = start + Timedelta(days=1)
+        self.currency.balance_stream(stream_id=second, signer="dave", environment={"now": now})
+
+        self.assertEqual(self.currency.balances["dave"], 86400)
+        self.assertEqual(self.currency.outflows["alice", "owed"], 1000)
+        self.assertEqual(self.currency.outflows["alice", "rate"], 1)
+        self.assertEqual(self.currency.sender_solvent_until(sender="alice", environment={"now": now}), now + Timedelta(seconds=12600))
+
+    def test_future_stream_does_not_offset_owed(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        first = self.create_stream("alice", "carol", 1)
+        self.create_stream("alice", "dave", 1)
+        self.create_stream("alice", "erin", 1, begins="2021-01-06 00:00:00")
+        self.currency.transfer(amount=9400, to="bob", signer="alice")
+
+        # The stream to erin has not begun, 1200 is owed on the other two and only 600 held
+        self.currency.balance_stream(stream_id=first, signer="carol", environment={"now": start + Timedelta(minutes=10)})
+
+        self.assertEqual(self.currency.balances["carol"], 300)
+        self.assertEqual(self.currency.outflows["alice", "owed"], 900)
+        self.assertEqual(self.currency.outflows["alice", "rate"], 2)
+
+        # From its begins it is owed like the others
+        self.assertEqual(
+            self.currency.sender_solvent_until(sender="alice", environment={"now": start + Timedelta(days=5, seconds=10)}),
+            start + Timedelta(days=5, seconds=10),
+        )
+
+        # Closing a stream early keeps what it accrued owed and takes its rate out
+        self.currency.change_close_time(stream_id=first, new_close_time="2021-01-01 00:10:00", signer="alice", environment={"now": start + Timedelta(days=5, seconds=10)})
+        self.assertEqual(self.currency.outflows["alice", "owed"], (5 * 86400 + 10) * 2 - 300 + 10)
+        self.assertEqual(self.currency.outflows["alice", "rate"], 2)
+
+    def test_checkpoint_drops_passed_outflow_changes(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        self.create_stream("alice", "carol", 1, closes="2021-01-03 00:00:00")
+        second = self.create_stream("alice", "dave", 1)
+
+        # Rate changes are bucketed by days since 2000-01-01, 2021-01-03 is day 7673 and 2021-01-11 day 7681
+        self.assertEqual(self.currency.outflows["alice", "cursor"], 7673)
+        self.assertEqual(self.currency.outflows["alice", "last"], 7681)
+
+        self.currency.balance_stream(stream_id=second, signer="dave", environment={"now": start + Timedelta(days=4, hours=1)})
+
+        self.assertEqual(self.currency.outflows["alice", "rate"], 1)
+        self.assertEqual(self.currency.outflows["alice", "cursor"], 7676)
+        self.assertIsNone(self.currency.outflow_changes["alice", 7673])
+        self.assertEqual(self.currency.outflow_changes["alice", 7681], [[0, -1]])
+
+        # Once the last change has passed nothing is left to walk
+        self.currency.balance_stream(stream_id=second, signer="dave", environment={"now": start + Timedelta(days=12)})
+        self.assertEqual(self.currency.outflows["alice", "rate"], 0)
+        self.assertIsNone(self.currency.outflows["alice", "cursor"])
+        self.assertIsNone(self.currency.outflow_changes["alice", 7681])
+
+    def test_seed_stream_accrues_whole_days(self):
+        begins = self.currency.streams["team_lock", "begins"]
+        rate = self.currency.streams["team_lock", "rate"]
+
+        self.currency.balance_stream(stream_id="team_lock", signer="sys", environment={"now": begins + Timedelta(days=2, seconds=5)})
+
+        self.assertAlmostEqual(float(self.currency.streams["team_lock", "claimed"]), float(rate) * (2 * 86400 + 5), places=4)
+
+    def test_balance_stream_checkpoints(self):
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        self.currency.transfer(amount=1000000, to="alice", signer="sys")
+        stream_id = self.create_stream("alice", "carol", 1)
+
+        self.currency.balance_stream(stream_id=stream_id, signer="carol", environment={"now": start + Timedelta(days=1)})
+        self.assertEqual(self.currency.streams[stream_id, "accrued_until"], start + Timedelta(days=1))
+        self.assertEqual(self.currency.streams[stream_id, "due"], 0)
+
+        self.currency.balance_stream(stream_id=stream_id, signer="carol", environment={"now": start + Timedelta(days=3, hours=1)})
+        self.assertEqual(self.currency.balances["carol"], (3 * 24 + 1) * 3600)
+
+        # Past the close date accrual stops at `closes`
+        self.currency.balance_stream(stream_id=stream_id, signer="carol", environment={"now": start + Timedelta(days=20)})
+        self.assertEqual(self.currency.balances["carol"], 10 * 86400)
+        self.assertEqual(self.currency.streams[stream_id, "accrued_until"], start + Timedelta(days=10))
+
+    def test_permit_many(self):
+        environment = {"chain_id": "bench-chain"}
+        keys = [SigningKey.generate() for _ in range(3)]
+        signed = [sign_permit(key, "relayer", 10, "2100-01-01 00:00:00") for key in keys]
+
+        self.currency.permit_many(signed_permits=signed, signer="relayer", environment=environment)
+
+        for p in signed:
+            self.assertEqual(self.currency.balances[p["owner"], "relayer"], 10)
+
+        with self.assertRaises(Exception) as context:
+            self.currency.permit_many(signed_permits=signed[:1], signer="relayer", environment=environment)
+        self.assertEqual(str(context.exception), "Permit can only be used once.")
+
+    def test_permit_many_rejects_bad_signature(self):
+        environment = {"chain_id": "bench-chain"}
+        good = sign_permit(SigningKey.generate(), "relayer", 10, "2100-01-01 00:00:00")
+        bad = {**sign_permit(SigningKey.generate(), "relayer", 10, "2100-01-01 00:00:00"), "value": 11}
+
+        with self.assertRaises(Exception) as context:
+            self.currency.permit_many(signed_permits=[good, bad], signer="relayer", environment=environment)
+        self.assertEqual(str(context.exception), "Invalid signature.")
+        self.assertEqual(self.currency.balances[good["owner"], "relayer"], None)
+
+    def test_prune_permits(self):
+        environment = {"chain_id": "bench-chain", "now": Datetime(year=2021, month=1, day=1, hour=0)}
+        signed = sign_permit(SigningKey.generate(), "relayer", 10, "2021-01-02 12:00:00")
+        self.currency.permit_many(signed_permits=[signed], signer="relayer", environment=environment)
+
+        self.assertEqual(len(self.client.raw_driver.items("currency.permits:20210102:")), 1)
+
+        with self.assertRaises(Exception) as context:
+            self.currency.prune_permits(days=[20210102], environment={"now": Datetime(year=2021, month=1, day=2, hour=13)})
+        self.assertEqual(str(context.exception), "Permits of this day can still be used.")
+
+        self.currency.prune_permits(days=[20210102], environment={"now": Datetime(year=2021, month=1, day=3, hour=0)})
+        self.assertEqual(len(self.client.raw_driver.items("currency.permits:20210102:")), 0)
+
+
+    def test_integer_units(self):
+        with open("currency.py") as f:
+            self.client.submit(
+                f.read(),
+                name="currency_units",
+                constructor_args={"vk": "sys", "gov_contract": "gov", "integer_units": True},
+            )
+        currency = self.client.get_contract("currency_units")
+
+        self.assertEqual(currency.balances["dao"], 3333333330000000)
+        self.assertEqual(currency.to_units(tokens=1.5), 150000000)
+        self.assertEqual(currency.from_units(units=150000000), 1.5)
+
+        currency.transfer(amount=3, to="alice", signer="sys")
+        self.assertEqual(currency.balances["alice"], 3)
+
+        with self.assertRaises(Exception) as context:
+            currency.transfer(amount=1.5, to="alice", signer="sys")
+        self.assertEqual(str(context.exception), "Amounts must be whole base units.")
+
+    def test_integer_units_pro_rated_claim_rounds_down(self):
+        with open("currency.py") as f:
+            self.client.submit(
+                f.read(),
+                name="currency_units",
+                constructor_args={"vk": "sys", "gov_contract": "gov", "integer_units": True},
+            )
+        currency = self.client.get_contract("currency_units")
+        start = Datetime(year=2021, month=1, day=1, hour=0)
+        currency.transfer(amount=1000, to="alice", signer="sys")
+
+        first = currency.create_stream(receiver="carol", rate=1, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+        currency.create_stream(receiver="dave", rate=2, begins=self.BEGINS, closes=self.CLOSES, signer="alice", environment={"now": start})
+
+        # 3000 owed, 1000 held, carol is due 1000 and gets 1000 * 1000 // 3000
+        currency.balance_stream(stream_id=first, signer="carol", environment={"now": start + Timedelta(seconds=1000)})
+        self.assertEqual(currency.balances["carol"], 333)
+        self.assertEqual(currency.streams[first, "due"], 667)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,86 +1,36 @@
 import unittest
 from contracting.stdlib.bridge.time import Datetime, Timedelta
-from contracting.client import ContractingClient
 from parameterized import parameterized
 
-from gov_utils import calculate_reward_percentage, get_validators
+from gov_fixtures import GovTestCase, fund, large_validator_set, submit_currency, submit_gov
+from gov_rewards import epoch_powers
+from gov_utils import (
+    build_power_tree,
+    calculate_epoch_issuance,
+    calculate_reward_percentage,
+    get_power_tree,
+    get_rule_versions,
+    get_validators,
+    power_interval_of,
+    rules_at,
+    sample_by_power,
+)
 
 # from gov_utils import get_validators
 
 
-class TestGovernance(unittest.TestCase):
-
-    NODES = [
-        "node1",
-        "node2",
-        "node3",
-        "node4",
-        "node5",
-        "node6",
-        "node7",
-        "node8",
-        "node9",
-        "node10",
-    ]
-
-    RULES = {
-        "v_max": 2,
-        "v_lock": 100,
-        "v_min_commission": 5,
-        "fee_dist": [0.4, 0.3, 0.1, 0.2],
-        "unbonding_period": 7,
-        "epoch_length": 8,
-        "min_vote_turnout": 0.5,
-        "min_vote_ratio": 0.7,
-    }
-
-    GENESIS_NODES = ["node1", "node2"]
-
-    def setUp(self):
-        # Called before every test, bootstraps the environment.
-        self.client = ContractingClient()
-        self.client.flush()
-
-        gov_contract_name = "gov"
-        currency_contract_name = "currency"
-
-        self.setup_currency_contract(currency_contract_name, gov_contract_name)
-        self.currency = self.client.get_contract("currency")
-
-        self.setup_gov_contract(gov_contract_name, self.RULES, self.GENESIS_NODES)
-        self.gov = self.client.get_contract(gov_contract_name)
-
-        self.setup_nodes_currency(self.NODES, gov_contract_name)
-
-    def tearDown(self):
-        # Called after every test, ensures each test starts with a clean slate and is isolated from others
-        self.client.flush()
+class TestGovernance(GovTestCase):
 
     def setup_nodes_currency(
         self, nodes, gov_contract_name, currency_contract_name="currency"
     ):
-        currency_contract = self.client.get_contract(currency_contract_name)
-        for node in nodes:
-            currency_contract.transfer(amount=10000, to=node, signer="sys")
-            currency_contract.approve(amount=10000, to=gov_contract_name, signer=node)
+        fund(self.client, nodes, gov_contract_name, currency_name=currency_contract_name)
 
     def setup_currency_contract(self, contract_name, gov_contract_name):
-        with open("currency.py") as f:
-            code = f.read()
-            self.client.submit(
-                code,
-                contract_name,
-                constructor_args={"vk": "sys", "gov_contract": gov_contract_name},
-            )
+        submit_currency(self.client, contract_name, gov_contract_name)
 
     def setup_gov_contract(self, contract_name, rules, genesis_nodes):
-        with open("gov.py") as f:
-            code = f.read()
-            self.client.submit(
-                code,
-                name=contract_name,
-                constructor_args={"genesis_nodes": genesis_nodes, "rules": rules},
-            )
+        submit_gov(self.client, contract_name, rules, genesis_nodes)
 
     def test_constructor_defaults(self):
         with open("gov.py") as f:
@@ -176,6 +126,15 @@ class TestGovernance(unittest.TestCase):
         self.assertEqual(self.gov.Validators["node3", "is_genesis_node"], None)
         self.assertEqual(self.currency.balances["node3"], initial_balance - 100)
 
+    def test_join_bonds_into_custody(self):
+        self.gov.join(commission=5, signer="node3")
+        self.gov.delegate(validator="node3", amount=50, signer="node4")
+
+        self.assertEqual(self.currency.custody["gov", "node3"], 100)
+        self.assertEqual(self.currency.custody["gov", "node4"], 50)
+        self.assertEqual(self.currency.custody_of(contract="gov"), 150)
+        self.assertEqual(self.currency.balances["node4"], 10000 - 50)
+
     def test_join_already_member(self):
         self.assertRaises(Exception, self.gov.join, commission=5, signer="node1")
 
@@ -215,6 +174,53 @@ class TestGovernance(unittest.TestCase):
         self.assertEqual(self.gov.Delegators["node4", "node3", "unbonding"], None)
         self.assertEqual(self.gov.Delegators["node4", "node3", "epoch_joined"], 1)
 
+    def test_power_tree_tracks_power(self):
+        self.gov.join(commission=5, signer="node3")
+        self.gov.delegate(validator="node3", amount=200, signer="node4")
+        self.gov.delegate(validator="node1", amount=100, signer="node4")
+
+        # Power changes reach the tree at the epoch boundary
+        self.assertEqual(self.gov.power_interval_of(validator="node1"), [0, 100])
+        self.assertEqual(self.gov.PowerTree["slot", "node3"], None)
+        self.next_epoch()
+
+        self.assertEqual(self.gov.power_interval_of(validator="node1"), [0, 200])
+        self.assertEqual(self.gov.power_interval_of(validator="node2"), [200, 300])
+        self.assertEqual(self.gov.power_interval_of(validator="node3"), [300, 600])
+
+        nodes, owners = get_power_tree(self.client.raw_driver)
+        expected_nodes, expected_owners = build_power_tree([("node1", 200), ("node2", 100), ("node3", 300)])
+        self.assertEqual(nodes, expected_nodes)
+        self.assertEqual(owners, expected_owners)
+
+    def test_sample_by_power(self):
+        self.gov.join(commission=5, signer="node3")
+        self.gov.delegate(validator="node3", amount=200, signer="node4")
+        self.next_epoch()
+
+        # node1: [0, 100), node2: [100, 200), node3: [200, 500)
+        self.assertEqual(self.gov.sample_by_power(seed=0), "node1")
+        self.assertEqual(self.gov.sample_by_power(seed=400000), "node3")
+        self.assertEqual(self.gov.sample_by_power(seed=300000), "node2")
+        self.assertEqual(self.gov.sample_by_power(seed=1999999), "node3")
+
+        nodes, owners = get_power_tree(self.client.raw_driver)
+        for seed in range(0, 1000000, 37111):
+            self.assertEqual(self.gov.sample_by_power(seed=seed), sample_by_power(nodes, owners, seed))
+        self.assertEqual(power_interval_of(nodes, owners, "node3"), self.gov.power_interval_of(validator="node3"))
+
+    def test_total_power_folds_shards(self):
+        self.assertEqual(self.gov.TotalPower.get(), 200)
+
+        self.gov.join(commission=5, signer="node3")
+        self.gov.delegate(validator="node1", amount=50, signer="node4")
+        self.assertEqual(self.gov.TotalPower.get(), 200)
+        self.assertEqual(self.gov.total_power(), 350)
+
+        self.assertEqual(self.gov.fold_total_power(), 350)
+        self.assertEqual(self.gov.TotalPower.get(), 350)
+        self.assertEqual(self.gov.total_power(), 350)
+
     def test_delegate_not_validator(self):
         with self.assertRaises(Exception) as context:
             self.gov.delegate(validator="node3", amount=100, signer="node4")
@@ -321,9 +327,12 @@ class TestGovernance(unittest.TestCase):
             environment={"now": JOIN_DATE + Timedelta(days=7)},
         )
 
+        # The delegation is deleted rather than zeroed
         self.assertEqual(self.gov.Delegators["node3", "node2", "unbonding"], None)
-        self.assertEqual(self.gov.Delegators["node3", "node2", "amount"], 0)
-        self.assertEqual(self.gov.Delegators["node3", "node2", "epoch_joined"], 1)
+        self.assertEqual(self.gov.Delegators["node3", "node2", "amount"], None)
+        self.assertEqual(self.gov.Delegators["node3", "node2", "epoch_joined"], None)
+        self.assertEqual(self.gov.Delegators["node3", "node2", "record"], None)
+        self.assertEqual(self.client.raw_driver.items("gov.Delegators:node3:node2:"), {})
 
     def test_delegator_leave_join_again(self):
         JOIN_DATE = Datetime(year=2021, month=1, day=1, hour=0)
@@ -353,6 +362,326 @@ class TestGovernance(unittest.TestCase):
         self.assertEqual(self.gov.Delegators["node3", "node2", "amount"], 100)
         self.assertEqual(self.gov.Delegators["node3", "node2", "epoch_joined"], 2)
 
+    def test_validator_leave_clears_record(self):
+        JOIN_DATE = Datetime(year=2021, month=1, day=1, hour=0)
+        self.gov.join(commission=5, signer="node3", environment={"now": JOIN_DATE})
+        self.gov.announce_validator_leave(signer="node3", environment={"now": JOIN_DATE})
+        self.gov.validator_leave(signer="node3", environment={"now": JOIN_DATE + Timedelta(days=7)})
+
+        self.assertEqual(
+            self.client.raw_driver.items("gov.Validators:node3:"),
+            {"gov.Validators:node3:active": False, "gov.Validators:node3:power": 0},
+        )
+
+    def test_validator_leave_releases_power_slot(self):
+        JOIN_DATE = Datetime(year=2021, month=1, day=1, hour=0)
+        self.gov.join(commission=5, signer="node3", environment={"now": JOIN_DATE})
+        self.gov.delegate(validator="node3", amount=100, signer="node4", environment={"now": JOIN_DATE})
+        self.next_epoch()
+        slot = self.gov.PowerTree["slot", "node3"]
+        self.assertEqual(self.gov.PowerTree["owner", slot], "node3")
+
+        self.gov.announce_validator_leave(signer="node3", environment={"now": JOIN_DATE})
+        self.gov.validator_leave(signer="node3", environment={"now": JOIN_DATE + Timedelta(days=7)})
+        self.gov.Validators["node3", "delegator_index"] = 0.5
+
+        # The last delegation leaving empties the validator, only its accrued rewards survive on the delegation
+        self.gov.announce_delegator_leave(validator="node3", signer="node4", environment={"now": JOIN_DATE + Timedelta(days=7)})
+        self.assertEqual(
+            self.client.raw_driver.items("gov.Validators:node3:"),
+            {"gov.Validators:node3:active": False, "gov.Validators:node3:power": 0},
+        )
+        self.assertEqual(self.gov.Delegators["node4", "node3", "rewards"], 50)
+
+        # The slot is given up at the boundary once its leaf is empty
+        self.assertEqual(self.gov.PowerTree["owner", slot], "node3")
+        self.next_epoch()
+        self.assertEqual(self.gov.PowerTree["slot", "node3"], None)
+        self.assertEqual(self.gov.PowerTree["owner", slot], None)
+        self.assertEqual(self.gov.EpochWork["epoch", "node3"], None)
+        self.assertEqual(self.gov.power_interval_of(validator="node2"), [100, 200])
+        self.assertEqual(self.gov.sample_by_power(seed=999999), "node2")
+
+    def test_prune(self):
+        JOIN_DATE = Datetime(year=2021, month=1, day=1, hour=0)
+        self.gov.join(commission=5, signer="node3", environment={"now": JOIN_DATE})
+        self.next_epoch()
+        self.gov.announce_validator_leave(signer="node3", environment={"now": JOIN_DATE})
+        self.gov.validator_leave(signer="node3", environment={"now": JOIN_DATE + Timedelta(days=7)})
+
+        # Fields left behind by exits before records were cleared
+        self.gov.Validators["node3", "epoch_joined"] = 1
+        self.gov.Validators["node3", "commission"] = 5
+        self.gov.Delegators["node4", "node3", "amount"] = 0
+        self.gov.Delegators["node4", "node3", "epoch_joined"] = 1
+        self.gov.delegate(validator="node1", amount=100, signer="node5")
+
+        self.assertEqual(self.gov.prune(max_items=2), 3)
+        self.assertEqual(self.gov.Validators["node3", "epoch_joined"], 1)
+        self.assertEqual(self.gov.prune(max_items=2), 2)
+        self.assertEqual(self.gov.Validators["node3", "epoch_joined"], None)
+        self.assertEqual(self.gov.Validators["node3", "commission"], None)
+        self.assertEqual(self.gov.Validators["node1", "commission"], 5)
+
+        # Its leaf still holds power until the boundary, after that the empty slot has no owner and is skipped
+        self.assertEqual(self.gov.PowerTree["owner", 3], "node3")
+        self.next_epoch()
+        self.assertEqual(self.gov.PowerTree["owner", 3], None)
+        self.assertEqual(self.gov.prune(max_items=3), 2)
+
+        self.assertEqual(self.gov.prune_delegations(delegations=[["node4", "node3"], ["node5", "node1"]]), 1)
+        self.assertEqual(self.gov.Delegators["node4", "node3", "epoch_joined"], None)
+        self.assertEqual(self.gov.Delegators["node5", "node1", "amount"], 100)
+
+    def test_advance_epoch_snapshots_power(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        self.gov.Epoch_T.set(EPOCH_START)
+        self.gov.delegate(validator="node1", amount=50, signer="node3")
+
+        with self.assertRaises(Exception) as context:
+            self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=7)})
+        self.assertEqual(str(context.exception), "Epoch not over")
+
+        self.assertEqual(self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)}), 1)
+        self.assertEqual(self.gov.Epoch_I.get(), 1)
+        self.assertEqual(self.gov.StakingEpochs[1, "node1"], 150)
+        self.assertEqual(self.gov.TotalPower.get(), 250)
+
+        # Only validators whose power changed are snapshotted, the others carry over from earlier epochs
+        self.assertEqual(self.gov.StakingEpochs[1, "node2"], None)
+        self.assertEqual(epoch_powers(self.client.raw_driver, 1), {"node1": 150, "node2": 100})
+
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=16)})
+        self.assertEqual(self.client.raw_driver.items("gov.StakingEpochs:2:"), {})
+
+    def test_rule_versions(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        genesis = {**self.RULES, "queued_settlement": False}
+        self.assertEqual(self.gov.rules_at(epoch=0), genesis)
+
+        # Versions taking effect at epochs 2 and 5, as governance would record them
+        for index, (epoch, change) in enumerate([(2, {"unbonding_period": 14}), (5, {"v_max": 3})], start=1):
+            genesis = {**genesis, **change}
+            self.gov.RuleVersions["epoch", index] = epoch
+            self.gov.RuleVersions["rules", index] = genesis
+        self.gov.RuleVersions["count"] = 3
+
+        self.assertEqual(self.gov.rules_at(epoch=1)["unbonding_period"], 7)
+        self.assertEqual(self.gov.rules_at(epoch=4)["unbonding_period"], 14)
+        self.assertEqual(self.gov.rules_at(epoch=4)["v_max"], 2)
+        self.assertEqual(self.gov.rules_at(epoch=9)["v_max"], 3)
+
+        epochs, versions = get_rule_versions(self.client.raw_driver)
+        for epoch in range(10):
+            self.assertEqual(rules_at(epochs, versions, epoch), self.gov.rules_at(epoch=epoch))
+
+        # The live rules follow the versions as epochs advance
+        self.gov.Epoch_T.set(EPOCH_START)
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)})
+        self.assertEqual(self.gov.Rules["unbonding_period"], 7)
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=16)})
+        self.assertEqual(self.gov.Rules["unbonding_period"], 14)
+        self.assertEqual(self.gov.Rules["v_max"], 2)
+
+        # Boundaries without a version of their own don't write Rules, a value set since then survives
+        self.gov.Rules["v_lock"] = 150
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=24)})
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=32)})
+        self.assertEqual(self.gov.Rules["v_lock"], 150)
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=40)})
+        self.assertEqual(self.gov.Rules["v_lock"], 100)
+        self.assertEqual(self.gov.Rules["v_max"], 3)
+
+    def test_advance_epoch_issues_rewards(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        for rule, value in ISSUANCE_RULES.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Epoch_T.set(EPOCH_START)
+
+        supply = self.currency.supply.get()
+        expected = calculate_epoch_issuance(200, float(supply), self.RULES["epoch_length"], ISSUANCE_RULES)
+
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)})
+
+        self.assertAlmostEqual(float(self.currency.supply.get()), float(supply) + expected, places=2)
+        self.assertAlmostEqual(float(self.currency.balances["gov"]), expected, places=2)
+        self.assertAlmostEqual(float(self.gov.RewardIndex.get()), expected / 200, places=6)
+        self.assertAlmostEqual(float(self.gov.pending_rewards(validator="node1")), expected / 2, places=2)
+
+    def test_late_advance_epoch_issues_for_elapsed_hours(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        for rule, value in ISSUANCE_RULES.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Epoch_T.set(EPOCH_START)
+
+        # One boundary two epochs late issues what two on time would have, at the same supply
+        supply = self.currency.supply.get()
+        expected = calculate_epoch_issuance(200, float(supply), 2 * self.RULES["epoch_length"], ISSUANCE_RULES)
+
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=2 * self.RULES["epoch_length"])})
+
+        self.assertAlmostEqual(expected, 2 * calculate_epoch_issuance(200, float(supply), self.RULES["epoch_length"], ISSUANCE_RULES), places=6)
+        self.assertAlmostEqual(float(self.currency.supply.get()), float(supply) + expected, places=2)
+        self.assertAlmostEqual(float(self.gov.RewardIndex.get()), expected / 200, places=6)
+        self.assertEqual(self.gov.Epoch_I.get(), 1)
+
+    def test_compounding_delegation(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        for rule, value in ISSUANCE_RULES.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Epoch_T.set(EPOCH_START)
+
+        self.gov.delegate(validator="node1", amount=100, compound=True, signer="node3")
+        self.assertEqual(self.gov.Delegators["node3", "node1", "shares"], 100)
+
+        issued = calculate_epoch_issuance(300, float(self.currency.supply.get()), self.RULES["epoch_length"], ISSUANCE_RULES)
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)})
+
+        # node1 earns 2/3 of issuance, keeps 5% commission plus half of the rest for its own lock
+        reward = issued * 200 / 300
+        compounded = (reward - reward * 0.05) / 2
+
+        self.assertAlmostEqual(float(self.gov.Validators["node1", "power"]), 200 + compounded, places=4)
+        self.assertAlmostEqual(float(self.gov.StakingEpochs[1, "node1"]), 200 + compounded, places=4)
+        self.assertAlmostEqual(float(self.gov.delegation_of(delegator="node3", validator="node1")), 100 + compounded, places=4)
+        self.assertAlmostEqual(float(self.gov.pending_rewards(validator="node1")), reward - compounded, places=4)
+
+        # Leaving redeems the shares, the compounded part is paid from issuance
+        self.gov.announce_delegator_leave(validator="node1", signer="node3", environment={"now": EPOCH_START + Timedelta(hours=9)})
+        self.assertAlmostEqual(float(self.gov.Delegators["node3", "node1", "amount"]), 100 + compounded, places=4)
+        self.assertAlmostEqual(float(self.gov.Validators["node1", "power"]), 100, places=4)
+
+        self.gov.delegator_leave(validator="node1", signer="node3", environment={"now": EPOCH_START + Timedelta(days=8)})
+        self.assertAlmostEqual(float(self.currency.balances["node3"]), 10000 + compounded, places=4)
+
+    def test_large_validator_set(self):
+        validators, delegators = large_validator_set(self.client, 50, 500, self.RULES)
+
+        self.assertEqual(len(get_validators(self.client.raw_driver, "gov")[0]), 50)
+        self.assertEqual(self.client.get_contract("gov").total_power(), 50 * 100 + 500 * 100)
+
+        # The second time the canned state is restored rather than rebuilt
+        self.client.get_contract("gov").delegate(validator="node1", amount=100, signer="delegator1")
+        large_validator_set(self.client, 50, 500, self.RULES)
+        self.assertEqual(self.client.get_contract("gov").delegation_of(delegator="delegator1", validator="node1"), 100)
+
+    @parameterized.expand(
+        [ # (staked, expected rate)
+            (0.0, 0.2),
+            (0.25, 0.05 + 0.15 * (0.5 * 0.5 + 0.5 * 0.25)),
+            (0.5, 0.05),
+            (1.0, 0.02),
+        ]
+    )
+    def test_calculate_reward_curve(self, staked, expected):
+        self.assertAlmostEqual(calculate_reward_percentage(staked, 0.5, 0.05, 0.2, 0.02, 0.5), expected)
+
+    def test_epoch_issuance_rounds_down_in_base_units(self):
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        amount = calculate_epoch_issuance(200, 111111111 * 10 ** 8, 8, ISSUANCE_RULES)
+        units = calculate_epoch_issuance(200, 111111111 * 10 ** 8, 8, ISSUANCE_RULES, base_units=True)
+
+        self.assertIsInstance(units, int)
+        self.assertEqual(units, int(amount))
+
+    def test_queued_settlement_nets_changes(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+
+        gov_contract_name = "gov_local"
+        self.setup_gov_contract(gov_contract_name, {**self.RULES, "queued_settlement": True}, self.GENESIS_NODES)
+        gov = self.client.get_contract(gov_contract_name)
+        self.setup_nodes_currency(self.NODES, gov_contract_name)
+        gov.Epoch_T.set(EPOCH_START)
+
+        gov.delegate(validator="node1", amount=100, signer="node3")
+        gov.redelegate(from_validator="node1", to_validator="node2", amount=40, signer="node3")
+        gov.delegate(validator="node1", amount=10, signer="node3")
+
+        # Nothing is applied until the epoch boundary
+        self.assertEqual(gov.Validators["node1", "power"], 100)
+        self.assertEqual(gov.Delegators["node3", "node1", "amount"], None)
+        self.assertEqual(gov.PendingPower["node1"], 70)
+        self.assertEqual(gov.PendingPower["node2"], 40)
+        self.assertEqual(gov.delegation_of(delegator="node3", validator="node1"), 70)
+
+        gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)})
+
+        self.assertEqual(gov.Validators["node1", "power"], 170)
+        self.assertEqual(gov.Validators["node2", "power"], 140)
+        self.assertEqual(gov.StakingEpochs[1, "node1"], 170)
+        self.assertEqual(gov.StakingEpochs[1, "node2"], 140)
+
+        # Leaving settles the delegation before removing its power
+        gov.announce_delegator_leave(validator="node1", signer="node3", environment={"now": EPOCH_START + Timedelta(hours=9)})
+        self.assertEqual(gov.Delegators["node3", "node1", "amount"], 70)
+        self.assertEqual(gov.Delegators["node3", "node1", "epoch_joined"], 1)
+        self.assertEqual(gov.Validators["node1", "power"], 100)
+
+    def test_queued_redelegation_rewards_stay_within_issuance(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        for rule, value in ISSUANCE_RULES.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Rules["queued_settlement"] = True
+        self.gov.Epoch_T.set(EPOCH_START)
+        supply = float(self.currency.supply.get())
+
+        # A high commission at the target validator makes overpaying at the source show up in the totals
+        self.gov.join(commission=50, signer="node5")
+        self.gov.delegate(validator="node1", amount=100, signer="node3")
+        self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8)})
+        self.gov.redelegate(from_validator="node1", to_validator="node5", amount=60, signer="node3")
+        for epoch in range(2, 6):
+            self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8 * epoch)})
+
+        # The redelegation took effect at the boundary into epoch 2, the delegation is only settled by the claims
+        self.assertEqual(self.gov.Delegators["node3", "node1", "amount"], 100)
+        self.gov.claim_rewards(validator="node1", signer="node3")
+        self.gov.claim_rewards(validator="node5", signer="node3")
+        for validator in ["node1", "node2", "node5"]:
+            self.gov.claim_validator_rewards(signer=validator)
+
+        issued = float(self.currency.supply.get()) - supply
+        self.assertGreater(issued, 0)
+        self.assertEqual(self.gov.Delegators["node3", "node1", "amount"], 40)
+        self.assertEqual(self.gov.Delegators["node3", "node5", "amount"], 60)
+        # Everything issued was claimed and nothing more
+        self.assertGreaterEqual(float(self.currency.balances["gov"]), 0)
+        self.assertAlmostEqual(float(self.currency.balances["gov"]), 0, places=4)
+
     @parameterized.expand(
         [ # (genesis, unbonding, inactive)
             (["node1", "node2"], ["node3", "node4", "node5"], ["node6", "node7", "node8"]),
@@ -0,0 +1,75 @@
+import unittest
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+
+from gov_access import Tx, access_sets, benchmark, conflicts, schedule, undeclared
+from gov_fixtures import GovTestCase
+
+
+class TestGovAccess(GovTestCase):
+
+    def test_access_sets_schedule(self):
+        self.gov.join(commission=5, signer="node3")
+        driver = self.client.raw_driver
+
+        txs = [
+            Tx("currency", "transfer", "node5", {"amount": 1, "to": "node6"}),
+            Tx("currency", "transfer", "node7", {"amount": 1, "to": "node8"}),
+            Tx("gov", "delegate", "node4", {"validator": "node1", "amount": 1}),
+            Tx("gov", "delegate", "node5", {"validator": "node1", "amount": 1}),
+        ]
+        sets = [access_sets(tx, driver) for tx in txs]
+
+        self.assertFalse(conflicts(sets[0], sets[1]))
+        self.assertTrue(conflicts(sets[2], sets[3]))
+        self.assertTrue(conflicts(sets[0], sets[3]))
+        self.assertEqual(schedule(txs, driver), [txs[:3], txs[3:]])
+
+    def test_access_sets_cover_execution(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        for rule, value in {"staked_target": 0.5, "reward_steepness": 0.5, "reward_min": 0.02, "reward_max": 0.2, "reward_target": 0.05}.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Epoch_T.set(EPOCH_START)
+        driver = self.client.raw_driver
+
+        start, boundary, unbonded = EPOCH_START, EPOCH_START + Timedelta(hours=8), EPOCH_START + Timedelta(days=8)
+        block = [
+            (start, Tx("gov", "join", "node3", {"commission": 5})),
+            (start, Tx("gov", "delegate", "node4", {"validator": "node3", "amount": 100})),
+            (start, Tx("gov", "delegate", "node5", {"validator": "node1", "amount": 100, "compound": True})),
+            (start, Tx("gov", "redelegate", "node4", {"from_validator": "node3", "to_validator": "node1", "amount": 40})),
+            (boundary, Tx("gov", "advance_epoch", "node6", {})),
+            (boundary, Tx("gov", "claim_rewards", "node4", {"validator": "node1"})),
+            (boundary, Tx("gov", "claim_validator_rewards", "node1", {})),
+            (boundary, Tx("gov", "announce_delegator_leave", "node5", {"validator": "node1"})),
+            (boundary, Tx("gov", "announce_delegator_leave", "node4", {"validator": "node3"})),
+            (boundary, Tx("gov", "announce_validator_leave", "node3", {})),
+            (unbonded, Tx("gov", "validator_leave", "node3", {})),
+            (unbonded, Tx("gov", "delegator_leave", "node4", {"validator": "node3"})),
+            (unbonded, Tx("gov", "delegator_leave", "node5", {"validator": "node1"})),
+            (unbonded, Tx("gov", "prune", "node6", {"max_items": 3})),
+            (unbonded, Tx("gov", "prune_delegations", "node6", {"delegations": [["node4", "node3"]]})),
+            (unbonded, Tx("gov", "fold_total_power", "node6", {})),
+            (unbonded, Tx("currency", "transfer", "node5", {"amount": 1, "to": "node6"})),
+        ]
+
+        # Every key a transaction really reads or writes is covered by its declared sets
+        for now, tx in block:
+            sets = access_sets(tx, driver)
+            contract = self.gov if tx.contract == "gov" else self.currency
+            output = getattr(contract, tx.function)(**tx.kwargs, signer=tx.caller, environment={"now": now}, return_full_output=True)
+            self.assertEqual(output["status_code"], 0, tx.function)
+            self.assertTrue(output["writes"], tx.function)
+            self.assertEqual(undeclared(sets, output.get("reads") or {}, output["writes"]), [], tx.function)
+
+    def test_scheduled_block_matches_serial(self):
+        # The waves run on two worker replicas end in the same state as the block run serially.
+        result = benchmark(self.client, size=200, workers=2, n_validators=10, n_delegators=50)
+
+        self.assertTrue(result["same_state"])
+        self.assertLess(result["waves"], result["txs"])
+        self.assertGreater(result["serial_s"], 0)
+        self.assertGreater(result["scheduled_s"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import tempfile
+import unittest
+
+from gov_diff import CHANGED, diff, group
+from gov_fixtures import GovTestCase
+from gov_snapshot import Snapshot, export
+
+
+class TestGovDiff(GovTestCase):
+
+    def test_snapshot_diff(self):
+        driver = self.client.raw_driver
+        with tempfile.TemporaryDirectory() as path:
+            export(driver, f"{path}/before.snap")
+            self.gov.delegate(validator="node1", amount=100, signer="node3")
+            export(driver, f"{path}/after.snap")
+
+            before, after = Snapshot(f"{path}/before.snap"), Snapshot(f"{path}/after.snap")
+            grouped = group(diff(before.iter_items(), after.iter_items()))
+            before.close()
+            after.close()
+
+        power = grouped["validator"]["node1"]["power"]
+        self.assertEqual((power.kind, power.old, power.new), (CHANGED, 100, 200))
+        self.assertEqual(grouped["delegation"][("node3", "node1")]["amount"].new, 100)
+        self.assertEqual(grouped["account"]["node3"]["balance"].new, 10000 - 100)
+        self.assertEqual(grouped["account"]["node3"]["custody:gov"].new, 100)
+        self.assertNotIn("node2", grouped["validator"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from gov_events import EventView
+from gov_fixtures import GovTestCase
+
+
+class TestGovEvents(GovTestCase):
+
+    def test_events_fold_into_views(self):
+        events = []
+        for call in [
+            lambda: self.gov.join(commission=10, signer="node3", return_full_output=True),
+            lambda: self.gov.delegate(validator="node3", amount=100, signer="node4", return_full_output=True),
+            lambda: self.gov.redelegate(from_validator="node3", to_validator="node1", amount=40, signer="node4", return_full_output=True),
+            lambda: self.gov.announce_delegator_leave(validator="node1", signer="node4", return_full_output=True),
+            lambda: self.currency.transfer(amount=5, to="node5", signer="node4", return_full_output=True),
+        ]:
+            events.extend(call()["events"])
+
+        view = EventView(balances={"node4": 10000, "node5": 10000}).fold(events)
+
+        self.assertEqual(view.validators["node3"]["active"], True)
+        self.assertEqual(view.validators["node3"]["commission"], 10)
+        self.assertEqual(view.validators["node3"]["power"], self.gov.Validators["node3", "power"])
+        self.assertEqual(view.validators["node1"]["power"], self.gov.Validators["node1", "power"])
+        self.assertEqual(view.delegations[("node4", "node3")]["amount"], 60)
+        self.assertEqual(view.delegations[("node4", "node1")]["unbonding"], str(self.gov.Delegators["node4", "node1", "unbonding"]))
+        self.assertEqual(view.balances["node4"], self.currency.balances["node4"])
+        self.assertEqual(view.balances["node5"], self.currency.balances["node5"])
+        self.assertEqual(view.custody[("gov", "node4")], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import urllib.request
+
+from gov_fixtures import GovTestCase
+from gov_metrics import MetricsExporter
+
+
+class TestGovMetrics(GovTestCase):
+
+    def test_metrics_follow_events(self):
+        exporter = MetricsExporter(self.client.raw_driver)
+        self.assertEqual(exporter.status_counts["active"], 2)
+        self.assertEqual(exporter.total_power, 200)
+
+        events = []
+        for call in [
+            lambda: self.gov.join(commission=10, signer="node3", return_full_output=True),
+            lambda: self.gov.delegate(validator="node3", amount=100, signer="node4", return_full_output=True),
+            lambda: self.gov.announce_delegator_leave(validator="node3", signer="node4", return_full_output=True),
+            lambda: self.gov.announce_validator_leave(signer="node2", return_full_output=True),
+        ]:
+            events.extend(call()["events"])
+        exporter.fold(events)
+
+        # The incremental aggregates end where a fresh scan of the state does
+        self.assertEqual(exporter.render(), MetricsExporter(self.client.raw_driver).render())
+        self.assertEqual(exporter.status_counts["unbonding"], 1)
+        self.assertEqual(exporter.unbonding_volume, 200)
+        self.assertIn('gov_validators{status="active"} 2.0', exporter.render())
+
+        server = exporter.serve(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertEqual(response.read().decode(), exporter.render())
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from gov_fixtures import GovTestCase
+from gov_reader import ReaderDriver, StateServer
+from gov_utils import get_validators
+
+
+class TestGovReader(GovTestCase):
+
+    def test_reader_matches_driver(self):
+        self.gov.join(commission=10, signer="node3")
+        self.gov.announce_validator_leave(signer="node2")
+        self.client.raw_driver.commit()
+
+        server = StateServer(self.client.raw_driver)
+        host, port = server.start_in_thread()
+        reader = ReaderDriver(host, port, pool_size=2)
+        try:
+            self.assertEqual(get_validators(reader), get_validators(self.client.raw_driver))
+
+            # Identical reads in flight are sent once, cached keys are not sent again
+            requests = server.requests
+            keys = [f"gov.Validators:node{i}:power" for i in (1, 3, 3, 3)]
+            self.assertEqual(reader.get_many(keys)[keys[0]], self.gov.Validators["node1", "power"])
+            self.assertEqual(server.requests, requests)
+            self.assertEqual(reader.get("currency.balances:node4"), self.currency.balances["node4"])
+            self.assertEqual(server.requests, requests + 1)
+        finally:
+            reader.close()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
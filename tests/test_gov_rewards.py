@@ -0,0 +1,43 @@
+import unittest
+from contracting.stdlib.bridge.time import Datetime, Timedelta
+
+from gov_fixtures import GovTestCase
+from gov_rewards import cross_check, issuance_schedule, total_rewards
+
+
+class TestGovRewards(GovTestCase):
+
+    def test_reward_calculator_matches_claimable(self):
+        EPOCH_START = Datetime(year=2021, month=1, day=1, hour=0)
+        ISSUANCE_RULES = {
+            "staked_target": 0.5,
+            "reward_steepness": 0.5,
+            "reward_min": 0.02,
+            "reward_max": 0.2,
+            "reward_target": 0.05,
+        }
+        for rule, value in ISSUANCE_RULES.items():
+            self.gov.IssuanceRules[rule] = value
+        self.gov.Epoch_T.set(EPOCH_START)
+        supply = float(self.currency.supply.get())
+
+        self.gov.delegate(validator="node1", amount=100, signer="node3")
+        self.gov.delegate(validator="node2", amount=50, signer="node4")
+        for epoch in range(1, 4):
+            if epoch == 2:
+                self.gov.delegate(validator="node2", amount=25, signer="node5")
+            self.gov.advance_epoch(environment={"now": EPOCH_START + Timedelta(hours=8 * epoch)})
+
+        driver = self.client.raw_driver
+        epochs = range(1, 4)
+        issued = issuance_schedule(epochs, supply, self.RULES["epoch_length"], ISSUANCE_RULES, driver)
+        self.assertAlmostEqual(sum(issued.values()), float(self.currency.balances["gov"]), places=4)
+
+        totals = total_rewards(driver, epochs, issued)
+        self.assertGreater(totals[("node5", "node2")], 0)
+        self.assertLess(totals[("node5", "node2")], totals[("node4", "node2")])
+        self.assertEqual(cross_check(driver, totals), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
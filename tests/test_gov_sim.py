@@ -0,0 +1,25 @@
+import unittest
+
+from gov_fixtures import worker_client
+from gov_sim import differential
+
+
+class TestGovSim(unittest.TestCase):
+
+    def setUp(self):
+        # differential submits its own contracts, seeded like the model, so no base state is restored.
+        self.client = worker_client()
+
+    def tearDown(self):
+        self.client.flush()
+
+    def test_simulator_matches_contracts(self):
+        # Random ops on the reference model and on freshly submitted contracts end in the same state.
+        outcome_diffs, state_diffs = differential(seed=7, n_ops=300, client=self.client)
+
+        self.assertEqual(outcome_diffs, [])
+        self.assertEqual(state_diffs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+
+from gov_fixtures import GovTestCase, submit_currency, submit_gov
+from gov_snapshot import Snapshot, export
+from gov_utils import get_validators
+
+
+class TestGovSnapshot(GovTestCase):
+
+    def test_snapshot_export_and_hydrate(self):
+        self.gov.delegate(validator="node1", amount=100, signer="node3")
+        self.gov.join(commission=5, signer="node4")
+        driver = self.client.raw_driver
+
+        with tempfile.TemporaryDirectory() as path:
+            export(driver, f"{path}/state.snap")
+            snapshot = Snapshot(f"{path}/state.snap")
+
+            self.assertEqual(snapshot.items("gov.Validators:"), driver.items("gov.Validators:"))
+            self.assertEqual(snapshot.items("currency.balances:"), driver.items("currency.balances:"))
+            self.assertEqual(get_validators(snapshot, "gov"), get_validators(driver, "gov"))
+            self.assertEqual(snapshot.get("gov.Epoch_T"), driver.get("gov.Epoch_T"))
+
+            self.client.flush()
+            submit_currency(self.client)
+            submit_gov(self.client, "gov", self.RULES, self.GENESIS_NODES)
+            snapshot.hydrate(driver)
+            snapshot.close()
+        self.next_epoch()
+
+        self.assertEqual(self.gov.Validators["node1", "power"], 200)
+        self.assertEqual(self.gov.delegation_of(delegator="node3", validator="node1"), 100)
+        self.assertEqual(self.gov.power_interval_of(validator="node4"), [300, 400])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+import unittest
+
+from gov_fixtures import GovTestCase
+from gov_state_report import state_report
+
+
+class TestGovStateReport(GovTestCase):
+
+    def test_state_report(self):
+        report = state_report(self.client.raw_driver)
+
+        self.assertEqual(report[("gov.Validators", "power")][0], 2)
+        self.assertEqual(report[("currency.balances", "")][0], len(self.client.raw_driver.items("currency.balances:")))
+        self.assertGreater(report[("gov.Validators", "power")][1], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
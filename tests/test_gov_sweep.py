@@ -0,0 +1,22 @@
+import tempfile
+import unittest
+
+from gov_sweep import grid, read_columns, sweep
+
+
+class TestGovSweep(unittest.TestCase):
+
+    def test_sweep_writes_columns(self):
+        points = grid(unbonding_period=[1, 28])
+        with tempfile.TemporaryDirectory() as path:
+            sweep(points, path, years=3, processes=2)
+            results = read_columns(path)
+
+        self.assertEqual(len(results["point"]), 2 * 3)
+        final = {int(p): r for p, y, r in zip(results["point"], results["year"], results["staked_ratio"]) if y == 3}
+        # A longer lock asks for a higher yield, so less is staked
+        self.assertGreater(final[0], final[1])
+
+
+if __name__ == "__main__":
+    unittest.main()